@@ -51,6 +51,14 @@ async def read_all_jobs(
         
     return jobs
 
+@router.get("/pipeline")
+async def read_pipeline_stats(
+    current_user: User = Depends(get_current_active_superuser),
+):
+    # Queue depth and per-stage worker usage of the transcription pipeline
+    from app.services.pipeline import job_pipeline
+    return job_pipeline.stats()
+
 from app.core.config import settings
 import shutil
 import os
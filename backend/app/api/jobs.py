@@ -12,8 +12,16 @@ import json
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
-from app.services.transcription import transcription_service
-from app.services.summarization import generate_summary, get_style_guide
+from app.services.transcription import transcription_service, speaker_renames, apply_speaker_renames
+from app.services.summarization import get_style_guide, OLLAMA_MODEL
+from app.services.llm_backends import PRIORITY_DRAFT, PRIORITY_NORMAL, PRIORITY_REFINE
+from app.services.compaction import compact_transcript
+from app.services.summary_notes import summarize_transcript, NotesStore, notes_path_for
+from app.services.checkpoints import checkpoint_files, checkpoint_base_for, CheckpointStore
+from app.services.audio_spool import spool_path_for
+from app.services.voiceprints import voiceprint_store_for, voiceprint_path_for, voiceprint_lock
+from app.services.vad import SAMPLE_RATE
+from app.services.pipeline import job_pipeline, PipelineFull
 
 router = APIRouter()
 
@@ -28,6 +36,11 @@ async def create_job(
     background_tasks: BackgroundTasks = BackgroundTasks(), # Correct way to use it in FastAPI
     current_user: User = Depends(get_current_user)
 ):
+    # Backpressure: refuse uploads early rather than queueing without bound (submit()
+    # below is the authoritative check, this one only spares a doomed upload)
+    if job_pipeline.is_full():
+        raise HTTPException(status_code=503, detail="Processing queue is full. Please try again later.")
+
     # Default job name if still empty
     if not job_name:
         job_name = file.filename
@@ -121,12 +134,20 @@ async def create_job(
     job_dict = job.model_dump(by_alias=True, exclude={"id"})
     
     new_job = await db.get_db().jobs.insert_one(job_dict)
+
+    # Queue for Background Transcription. The queue may have filled up during the upload:
+    # then the job is rolled back and the client retries later
+    try:
+        job_pipeline.submit(str(new_job.inserted_id))
+    except PipelineFull:
+        await db.get_db().jobs.delete_one({"_id": new_job.inserted_id})
+        for path in (file_path, transcript_file_path_enc):
+            if path and os.path.exists(path):
+                os.remove(path)
+        raise HTTPException(status_code=503, detail="Processing queue is full. Please try again later.")
+
     created_job = await db.get_db().jobs.find_one({"_id": new_job.inserted_id})
     created_job["_id"] = str(created_job["_id"])
-    
-    # Trigger Background Transcription
-    background_tasks.add_task(transcription_service.process_job, str(new_job.inserted_id))
-    
     return Job(**created_job)
 
 @router.get("")
@@ -175,26 +196,42 @@ async def retry_job(
     if not job.get("file_path") or not os.path.exists(job["file_path"]):
         raise HTTPException(status_code=400, detail="Original audio file missing. Cannot retry.")
 
-    # Reset job status in DB
+    if job_pipeline.is_full():
+        raise HTTPException(status_code=503, detail="Processing queue is full. Please try again later.")
+
+    # Reset job status in DB (processing resumes from the last checkpointed stage)
     await db.get_db().jobs.update_one(
         {"_id": ObjectId(job_id)},
         {"$set": {
             "status": JobStatus.PENDING,
-            "status_message": "Retrying...",
+            "status_message": "Retrying..." if not job.get("checkpoint_stages") else "Retrying from checkpoints...",
             "progress": 0
         }}
     )
 
-    # Re-trigger background task
-    background_tasks.add_task(transcription_service.process_job, job_id)
+    # Re-queue on the job pipeline; when it filled up meanwhile, the job keeps its previous status
+    try:
+        job_pipeline.submit(job_id)
+    except PipelineFull:
+        await db.get_db().jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {key: job.get(key) for key in ("status", "status_message", "progress")}}
+        )
+        raise HTTPException(status_code=503, detail="Processing queue is full. Please try again later.")
     
     updated_job = await db.get_db().jobs.find_one({"_id": ObjectId(job_id)})
     updated_job["_id"] = str(updated_job["_id"])
     return Job(**updated_job)
 
+class DiarizeRequest(BaseModel):
+    num_speakers: Optional[int] = None # Exact count; overrides min/max
+    min_speakers: Optional[int] = None
+    max_speakers: Optional[int] = None
+
 @router.post("/{job_id}/diarize", response_model=Job)
 async def diarize_job(
     job_id: str, 
+    request: Optional[DiarizeRequest] = None,
     background_tasks: BackgroundTasks = BackgroundTasks(),
     current_user: User = Depends(get_current_user)
 ):
@@ -205,6 +242,18 @@ async def diarize_job(
             
         if not job.get("transcript_path"):
             raise HTTPException(status_code=400, detail="Transcript must be ready before diarization")
+
+        # Speaker hints sent are stored on the job (the others keep their upload values);
+        # stored embeddings are re-clustered with them
+        hints = request.model_dump(exclude_unset=True) if request is not None else {}
+        update = {}
+        if "num_speakers" in hints:
+            update["num_speakers"] = hints["num_speakers"] if hints["num_speakers"] and hints["num_speakers"] > 0 else None
+        for key in ("min_speakers", "max_speakers"):
+            if key in hints:
+                update[f"config.{key}"] = hints[key]
+        if update:
+            await db.get_db().jobs.update_one({"_id": ObjectId(job_id)}, {"$set": update})
             
         # Trigger background task
         background_tasks.add_task(transcription_service.process_diarization_only, job_id)
@@ -238,7 +287,10 @@ async def delete_job(job_id: str, current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=404, detail="Job not found")
         
     # 2. Delete files from disk
-    paths_to_delete = [job.get("file_path"), job.get("transcript_path")]
+    paths_to_delete = [job.get("file_path"), job.get("transcript_path"), job.get("summary_notes_path")]
+    if job.get("status") == JobStatus.RECORDING and job.get("file_path"):
+        paths_to_delete.append(spool_path_for(job["file_path"]))
+    paths_to_delete += checkpoint_files(job, job_id)
     for path in paths_to_delete:
         if path and os.path.exists(path):
             try:
@@ -246,6 +298,16 @@ async def delete_job(job_id: str, current_user: User = Depends(get_current_user)
             except Exception as e:
                 print(f"Error deleting file {path}: {e}")
                 
+    # Voices learned from this meeting go with it
+    if os.path.exists(voiceprint_path_for(str(current_user.id))):
+        try:
+            async with voiceprint_lock(str(current_user.id)):
+                voiceprints = await voiceprint_store_for(str(current_user.id))
+                if voiceprints.forget_job(job_id):
+                    voiceprints.save()
+        except Exception as e:
+            print(f"Error removing voiceprints of job {job_id}: {e}")
+
     # 3. Delete from DB
     await db.get_db().jobs.delete_one({"_id": ObjectId(job_id)})
     return None
@@ -298,6 +360,18 @@ async def get_job_transcript(job_id: str, current_user: User = Depends(get_curre
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
         
+    if job.get("status") in (JobStatus.PENDING, JobStatus.PROCESSING) and job.get("file_key") and job.get("file_path"):
+        # Segments transcribed so far, published window by window during ASR
+        partial = CheckpointStore(checkpoint_base_for(job, job_id), decode_str(job["file_key"])).load_json("partial")
+        if partial:
+            return {
+                "segments": partial["segments"],
+                "language": partial.get("language"),
+                "partial": True,
+                "processed_seconds": partial["processed_until"] / SAMPLE_RATE,
+                "duration": partial.get("duration")
+            }
+
     if job.get("status") != JobStatus.COMPLETED or not job.get("transcript_path"):
         raise HTTPException(status_code=400, detail="Transcript not ready")
         
@@ -338,7 +412,12 @@ async def get_job_transcript(job_id: str, current_user: User = Depends(get_curre
 from app.models.job import TranscriptUpdate
 
 @router.put("/{job_id}/transcript")
-async def update_transcript(job_id: str, update: TranscriptUpdate, current_user: User = Depends(get_current_user)):
+async def update_transcript(
+    job_id: str,
+    update: TranscriptUpdate,
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    current_user: User = Depends(get_current_user)
+):
     job = await db.get_db().jobs.find_one({"_id": ObjectId(job_id), "user_id": str(current_user.id)})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -368,11 +447,25 @@ async def update_transcript(job_id: str, update: TranscriptUpdate, current_user:
             full_text_parts.append(s_dict.get("text", ""))
             
         full_text = " ".join(full_text_parts)
+
+        # Edits made on a draft that was refined meanwhile (two-pass ASR): keep the refined
+        # transcript and carry over only the speaker renames
+        transcript_path = job["transcript_path"]
+        with open(transcript_path, "rb") as f:
+            current = json.loads(decrypt_data(f.read(), file_key).decode('utf-8'))
+        if update.asr_pass == "draft" and current.get("asr_pass") == "refined":
+            renames = speaker_renames(seg_list, current.get("segments", []))
+            apply_speaker_renames(current, renames)
+            with open(transcript_path, "wb") as f:
+                f.write(encrypt_data(json.dumps(current).encode('utf-8'), file_key))
+            background_tasks.add_task(transcription_service.learn_voiceprints, job_id, current.get("segments", []))
+            return {"status": "merged", "segment_count": len(current.get("segments", [])), "renamed": len(renames)}
         
         transcript_data = {
             "segments": seg_list,
             "language": job.get("language", "en"),
-            "text": full_text
+            "text": full_text,
+            "asr_pass": current.get("asr_pass")
         }
         
         # 3. Encrypt
@@ -380,9 +473,11 @@ async def update_transcript(job_id: str, update: TranscriptUpdate, current_user:
         encrypted_transcript = encrypt_data(result_json, file_key)
         
         # 4. Save to Disk (Overwrite)
-        transcript_path = job["transcript_path"]
         with open(transcript_path, "wb") as f:
             f.write(encrypted_transcript)
+
+        # 5. Remember the voices of named speakers for the next meetings
+        background_tasks.add_task(transcription_service.learn_voiceprints, job_id, seg_list)
             
         return {"status": "updated", "segment_count": len(update.segments)}
 
@@ -425,26 +520,71 @@ async def process_summary_task(
         decrypted_json_bytes = decrypt_data(encrypted_content, file_key)
         transcript_data = json.loads(decrypted_json_bytes.decode('utf-8'))
         
-        # Combine segments
-        segments = transcript_data.get("segments", [])
-        if segments:
-            full_text = "\n".join([f"{s.get('speaker', 'Unknown')}: {s.get('text', '')}" for s in segments])
-        else:
-            full_text = transcript_data.get("text", "")
-
         # 2. Generate Summary
         meeting_type = template_name if template_name else job.get("meeting_type", "General Meeting")
         language = job.get("language", "en")
-        
-        summary = await generate_summary(
-            full_text, 
-            meeting_type=meeting_type, 
-            language=language, 
+        summary_stats = {}
+
+        # Combine segments (compacted to cut LLM prefill tokens)
+        segments = transcript_data.get("segments", [])
+        if not segments:
+            segments = [{"speaker": "Unknown", "text": transcript_data.get("text", "")}]
+        compacted = compact_transcript(segments, language)
+        summary_stats["compaction"] = compacted["stats"]
+
+        summary_kwargs = dict(
+            meeting_type=meeting_type,
+            language=language,
             user_id=user_id,
             context_date=context_date,
             context_participants=context_participants,
             context_notes=context_notes
         )
+
+        # Optional quick draft from a small model, shown while the large model works
+        draft_model = settings.SUMMARY_DRAFT_MODEL
+        if draft_model and draft_model != OLLAMA_MODEL:
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {"summary_status": "drafting"}, "$unset": {"summary_draft_encrypted": ""}}
+            )
+            draft_stats = {}
+            draft = await summarize_transcript(
+                compacted, model=draft_model, stats=draft_stats, priority=PRIORITY_DRAFT, **summary_kwargs
+            )
+            if not draft.startswith("Error:"):
+                summary_stats["draft"] = draft_stats
+                await db.get_db().jobs.update_one(
+                    {"_id": ObjectId(job_id)},
+                    {"$set": {
+                        "summary_draft_encrypted": encode_bytes(encrypt_data(draft.encode('utf-8'), file_key)),
+                        "summary_status": "draft"
+                    }}
+                )
+                print(f"Draft summary ready for job {job_id} ({draft_model})")
+            else:
+                print(f"Draft summary failed for job {job_id}, waiting for the full model")
+            priority = PRIORITY_REFINE
+        else:
+            priority = PRIORITY_NORMAL
+
+        # Chunk notes are cached next to the transcript and reused across re-summaries
+        notes_path = notes_path_for(transcript_path)
+        summary = await summarize_transcript(
+            compacted,
+            notes_store=NotesStore(notes_path, file_key),
+            stats=summary_stats,
+            priority=priority,
+            **summary_kwargs
+        )
+        if summary.startswith("Error:"):
+            # Keep the draft and the previous summary rather than replacing them with the error
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {"summary_status": "failed", "summary_error": summary, "summary_stats": summary_stats}}
+            )
+            print(f"Summary failed for job {job_id}: {summary}")
+            return
         
         # 3. Store Summary (Encrypted)
         summary_bytes = summary.encode('utf-8')
@@ -453,7 +593,12 @@ async def process_summary_task(
         
         await db.get_db().jobs.update_one(
             {"_id": ObjectId(job_id)},
-            {"$set": {"summary_encrypted": encrypted_summary_str}}
+            {"$set": {
+                "summary_encrypted": encrypted_summary_str,
+                "summary_status": "final",
+                "summary_stats": summary_stats,
+                "summary_notes_path": notes_path if os.path.exists(notes_path) else None
+            }}
         )
         print(f"Background summary completed for job {job_id}")
         
@@ -461,8 +606,11 @@ async def process_summary_task(
         print(f"Error in background summarization for {job_id}: {e}")
         import traceback
         traceback.print_exc()
-        # Optionally update job with error state regarding summary?
-        # For now, we rely on the summary remaining null or checking logs.
+        # Ends the "drafting"/"draft" state so clients stop waiting for a final summary
+        await db.get_db().jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"summary_status": "failed", "summary_error": f"Error: {e}"}}
+        )
 
 @router.post("/{job_id}/summarize")
 async def summarize_job(
@@ -484,6 +632,12 @@ async def summarize_job(
     if job.get("status") != JobStatus.COMPLETED or not job.get("transcript_path"):
         raise HTTPException(status_code=400, detail="Transcript must be ready before summarization")
 
+    # Clears the outcome of the previous run before clients start polling
+    await db.get_db().jobs.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$set": {"summary_status": "summarizing"}, "$unset": {"summary_error": ""}}
+    )
+
     # Trigger background task
     background_tasks.add_task(
         process_summary_task, 
@@ -499,23 +653,44 @@ async def summarize_job(
 
 @router.get("/{job_id}/summary")
 async def get_job_summary(job_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Returns the summary plus both versions when a draft model is configured.
+    `summary` is the draft while the large model is still refining it, otherwise the final one.
+    """
     job = await db.get_db().jobs.find_one({"_id": ObjectId(job_id), "user_id": str(current_user.id)})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
+    status = job.get("summary_status")
     encrypted_summary_str = job.get("summary_encrypted")
-    if not encrypted_summary_str:
-        return {"summary": None}
+    encrypted_draft_str = job.get("summary_draft_encrypted")
+    error = job.get("summary_error") if status == "failed" else None
+    if not encrypted_summary_str and not encrypted_draft_str:
+        return {"summary": None, "draft": None, "final": None, "status": status, "is_draft": False, "error": error}
         
     try:
         encrypted_file_key = job.get("file_key")
         file_key = decode_str(encrypted_file_key)
-        
-        encrypted_summary = decode_str(encrypted_summary_str) # Decode base64 to bytes
-        decrypted_summary_bytes = decrypt_data(encrypted_summary, file_key)
-        summary = decrypted_summary_bytes.decode('utf-8')
-        
-        return {"summary": summary}
+
+        def decrypt_summary(value: Optional[str]) -> Optional[str]:
+            if not value:
+                return None
+            encrypted_summary = decode_str(value) # Decode base64 to bytes
+            return decrypt_data(encrypted_summary, file_key).decode('utf-8')
+
+        final = decrypt_summary(encrypted_summary_str)
+        draft = decrypt_summary(encrypted_draft_str)
+        # After a failed refine the draft of that run is the newest summary there is
+        is_draft = status in ("draft", "failed") and draft is not None
+
+        return {
+            "summary": draft if is_draft else final,
+            "draft": draft,
+            "final": final,
+            "status": status,
+            "is_draft": is_draft,
+            "error": error
+        }
     except Exception as e:
         print(f"Summary decryption error: {e}")
         return {"summary": "Error: Could not decrypt summary."}
@@ -0,0 +1,231 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
+from app.api.sse import get_current_user_from_token
+from app.models.job import JobInDB, JobStatus, JobConfig
+from app.core.database import db
+from app.core.config import settings
+from app.core.crypto import encode_bytes
+from app.services.live import LiveSession
+from app.services.vad import SAMPLE_RATE
+from app.services.pipeline import job_pipeline
+from bson import ObjectId
+import os
+import json
+import asyncio
+from typing import Optional, Set
+from datetime import datetime
+
+router = APIRouter()
+
+# Streams shorter than this are not worth a full transcription job
+MIN_JOB_SECONDS = 1.0
+
+# Received chunks waiting for live ASR. Past this the socket is no longer read, so a
+# stalled ASR pushes back on the client instead of buffering the stream in memory
+MAX_QUEUED_CHUNKS = 64
+
+active_sessions: Set[int] = set()
+
+
+async def _start_decoder():
+    """ffmpeg pipe turning the browser's MediaRecorder chunks (webm/ogg Opus) into s16le 16 kHz mono."""
+    return await asyncio.create_subprocess_exec(
+        "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE
+    )
+
+
+async def _queue_job(session: LiveSession, job_id: str) -> Optional[str]:
+    """Turns the spooled stream into the upload of its job and queues the job; None when nothing is kept."""
+    jobs = db.get_db().jobs
+    if not await jobs.count_documents({"_id": ObjectId(job_id), "status": JobStatus.RECORDING}):
+        # Deleted while recording
+        session.discard_spool()
+        return None
+    if session.duration < MIN_JOB_SECONDS:
+        session.discard_spool()
+        await jobs.delete_one({"_id": ObjectId(job_id)})
+        return None
+    size = await asyncio.to_thread(session.store_recording)
+    result = await jobs.update_one(
+        {"_id": ObjectId(job_id), "status": JobStatus.RECORDING},
+        {"$set": {
+            "status": JobStatus.PENDING,
+            "status_message": None,
+            "size": size,
+            "language": session.language or "en"
+        }}
+    )
+    if not result.matched_count:
+        # Deleted while recording
+        os.remove(session.file_path)
+        return None
+    job_pipeline.submit(job_id, force=True)
+    return job_id
+
+
+@router.websocket("/ws")
+async def live_transcription(
+    websocket: WebSocket,
+    token: str = Query(...),
+    language: Optional[str] = Query(None),
+    format: str = Query("pcm"), # "pcm" (s16le 16 kHz mono) or "opus" (MediaRecorder webm/ogg)
+    job_name: Optional[str] = Query(None)
+):
+    """
+    Live transcription of an in-progress meeting. The client streams binary audio frames
+    and receives {"type": "interim" | "final", start, end, text} messages. Sending
+    {"type": "stop"} (or disconnecting) ends the stream; the recording then becomes a
+    regular job with full-quality ASR, alignment and diarization ({"type": "job", job_id}).
+
+    The job document exists from the start (status "recording") and every received frame
+    is spooled before ASR, so the job gets the whole stream even if live transcription
+    fails, and a restart recovers it (resume_interrupted_jobs).
+    """
+    try:
+        user = await get_current_user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    if len(active_sessions) >= settings.LIVE_MAX_SESSIONS:
+        await websocket.close(code=1013)
+        return
+
+    await websocket.accept()
+    user_dir = os.path.join(settings.TRANSCRIPT_STORAGE_PATH, "users", str(user.id))
+    upload_dir = os.path.join(user_dir, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    session = LiveSession(upload_dir, language)
+    started = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    job = JobInDB(
+        filename=session.filename,
+        original_filename=f"live_{started}.wav",
+        content_type="audio/wav",
+        file_path=session.file_path,
+        language=language or "en",
+        user_id=str(user.id),
+        file_key=encode_bytes(session.file_key),
+        job_name=job_name or f"Live recording {started}",
+        config=JobConfig(),
+        status=JobStatus.RECORDING,
+        status_message="Recording"
+    )
+    try:
+        new_job = await db.get_db().jobs.insert_one(job.model_dump(by_alias=True, exclude={"id"}))
+    except Exception as e:
+        print(f"Live session error: {e}")
+        session.discard_spool()
+        await websocket.close(code=1011)
+        return
+    job_id = str(new_job.inserted_id)
+    active_sessions.add(id(session))
+    connected = True
+
+    async def send(message: dict):
+        nonlocal connected
+        if not connected:
+            return
+        try:
+            await websocket.send_json(message)
+        except Exception:
+            connected = False
+
+    pcm_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_CHUNKS)
+
+    async def transcribe_loop():
+        while True:
+            pcm = await pcm_queue.get()
+            if pcm is None:
+                return
+            # Coalesce whatever queued up while the last ASR call ran
+            chunks = [pcm]
+            while not pcm_queue.empty():
+                more = pcm_queue.get_nowait()
+                if more is None:
+                    await pcm_queue.put(None)
+                    break
+                chunks.append(more)
+            # Keep draining the queue whatever happens, or the receive loop would block on it
+            try:
+                events = await session.feed(b"".join(chunks))
+            except Exception as e:
+                print(f"Live transcription error: {e}")
+                continue
+            for event in events:
+                await send(event)
+
+    decoder = None
+    reader = None
+    worker = None
+    try:
+        await session.warm_up()
+        if format != "pcm":
+            decoder = await _start_decoder()
+
+            async def read_decoded():
+                while chunk := await decoder.stdout.read(SAMPLE_RATE):
+                    await pcm_queue.put(session.receive(chunk))
+
+            reader = asyncio.create_task(read_decoded())
+        worker = asyncio.create_task(transcribe_loop())
+        await send({"type": "ready", "sample_rate": SAMPLE_RATE, "model": settings.LIVE_ASR_MODEL})
+
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    connected = False
+                    break
+                if message.get("bytes"):
+                    if decoder:
+                        decoder.stdin.write(message["bytes"])
+                        await decoder.stdin.drain()
+                    else:
+                        await pcm_queue.put(session.receive(message["bytes"]))
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if control.get("type") == "stop":
+                        break
+        except WebSocketDisconnect:
+            connected = False
+
+        # Drain the decoder and the ASR worker before closing the stream
+        if decoder:
+            decoder.stdin.close()
+            await reader
+            await decoder.wait()
+        await pcm_queue.put(None)
+        await worker
+        for event in await session.finish():
+            await send(event)
+    except Exception as e:
+        print(f"Live session error: {e}")
+        await send({"type": "error", "message": "Live transcription failed"})
+    finally:
+        active_sessions.discard(id(session))
+        if decoder and decoder.returncode is None:
+            decoder.kill()
+        for task in (reader, worker):
+            if task and not task.done():
+                task.cancel()
+
+    # The spool has the whole stream whatever happened to the live transcript
+    try:
+        queued = await _queue_job(session, job_id)
+        if queued:
+            await send({"type": "job", "job_id": queued, "duration": round(session.duration, 1)})
+        else:
+            await send({"type": "done", "job_id": None})
+    except Exception as e:
+        print(f"Live session error storing job {job_id}: {e}")
+        await send({"type": "error", "message": "Could not store the recording"})
+    if connected:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
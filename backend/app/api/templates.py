@@ -6,7 +6,7 @@ from pydantic import BaseModel
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.models.template import CustomTemplate, CreateTemplateRequest, UpdateTemplateRequest
-from app.services.templates import TEMPLATES
+from app.services.templates import TEMPLATES, invalidate_user_templates
 from app.core.database import db
 
 router = APIRouter()
@@ -66,6 +66,7 @@ async def create_template(request: CreateTemplateRequest, current_user: User = D
     )
     
     result = await db.get_db().templates.insert_one(new_template.model_dump(by_alias=True, exclude={"id"}))
+    invalidate_user_templates(str(current_user.id))
     return await db.get_db().templates.find_one({"_id": result.inserted_id})
 
 @router.delete("/{template_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -78,6 +79,7 @@ async def delete_template(template_id: str, current_user: User = Depends(get_cur
         "_id": ObjectId(template_id),
         "user_id": str(current_user.id)
     })
+    invalidate_user_templates(str(current_user.id))
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Template not found or not authorized")
@@ -95,6 +97,7 @@ async def update_template(template_id: str, request: UpdateTemplateRequest, curr
         {"_id": ObjectId(template_id), "user_id": str(current_user.id)},
         {"$set": update_data}
     )
+    invalidate_user_templates(str(current_user.id))
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Template not found or not authorized")
@@ -0,0 +1,38 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from pydantic import BaseModel
+
+from app.api.dependencies import get_current_user
+from app.models.user import User
+from app.services.voiceprints import voiceprint_store_for, voiceprint_path_for, voiceprint_lock
+
+router = APIRouter()
+
+class VoiceprintResponse(BaseModel):
+    name: str
+    meetings: int # Meetings the voice was learned from
+
+@router.get("", response_model=List[VoiceprintResponse])
+async def list_voiceprints(current_user: User = Depends(get_current_user)):
+    """
+    Speakers recognized automatically in new meetings (learned when speakers are renamed).
+    """
+    if not os.path.exists(voiceprint_path_for(str(current_user.id))):
+        return []
+    voiceprints = await voiceprint_store_for(str(current_user.id))
+    return [VoiceprintResponse(**v) for v in voiceprints.summary()]
+
+@router.delete("/{name}")
+async def delete_voiceprint(name: str, current_user: User = Depends(get_current_user)):
+    """
+    Forget a speaker's voice. Transcripts already named keep their names.
+    """
+    if not os.path.exists(voiceprint_path_for(str(current_user.id))):
+        raise HTTPException(status_code=404, detail="Voiceprint not found")
+    async with voiceprint_lock(str(current_user.id)):
+        voiceprints = await voiceprint_store_for(str(current_user.id))
+        if not voiceprints.forget_name(name):
+            raise HTTPException(status_code=404, detail="Voiceprint not found")
+        voiceprints.save()
+    return None
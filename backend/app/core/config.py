@@ -16,8 +16,79 @@ class Settings(BaseSettings):
     # Services
     WHISPERX_URL: str = "http://whisperx:8000"
     OLLAMA_URL: str = "http://host.docker.internal:11434"
+    # Comma-separated LLM endpoints, e.g. "ollama=http://gpu1:11434,openai=http://box2:8080/v1#model-name".
+    # Empty means a single Ollama backend at OLLAMA_URL.
+    LLM_BACKENDS: Optional[str] = None
+    LLM_MAX_CONCURRENT: int = 0 # Concurrent LLM requests across all backends (0 = one per backend)
     HF_TOKEN: Optional[str] = None
+
+    # Summarization (Ollama)
+    OLLAMA_TIMEOUT: int = 600 # Seconds per request before falling back to the next model
+    OLLAMA_MIN_CTX: int = 4096
+    OLLAMA_MAX_CTX: int = 32768 # Upper bound for num_ctx, KV cache grows with it
+    OLLAMA_NUM_PREDICT: int = 2048 # Output tokens reserved for the summary
+    OLLAMA_KEEP_ALIVE_IDLE: str = "5m" # Nothing queued behind this request
+    OLLAMA_KEEP_ALIVE_BUSY: str = "30m" # More summaries waiting, keep model loaded
+    SUMMARY_DRAFT_MODEL: Optional[str] = None # e.g. "qwen2.5:3b": quick draft first, large model refines it
+
+    # Transcript compaction before summarization
+    COMPACTION_MERGE_TURNS: bool = True
+    COMPACTION_DROP_FILLERS: bool = True
+    COMPACTION_COLLAPSE_LOOPS: bool = True
+    COMPACTION_ABBREVIATE_SPEAKERS: bool = False
+
+    # Long transcripts are summarized map-reduce style (per-chunk notes, then the template)
+    SUMMARY_MAP_REDUCE_THRESHOLD: int = 12000 # Transcript tokens above which chunk notes are used
+    SUMMARY_CHUNK_TOKENS: int = 4000 # Target chunk size for note extraction
     
+    # Transcription pipeline
+    ASR_WINDOW_SECONDS: int = 120 # ASR runs window by window (cut at silence) and publishes a partial transcript
+    PARALLEL_DIARIZATION: bool = True # Diarize alongside ASR instead of after alignment
+    ASR_THREADS: int = 0 # CTranslate2 threads for ASR per job (0 = split the CPU between PIPELINE_MAX_JOBS jobs)
+    TORCH_THREADS: int = 0 # torch threads for alignment and diarization (0 = automatic)
+    ASR_DRAFT_MODEL: Optional[str] = None # e.g. "distil-large-v3": draft transcript first, WHISPER_MODEL refines it in the background
+    ALIGN_WORKERS: int = 2 # Worker processes for windowed alignment (each holds a wav2vec2 model)
+    ALIGN_WINDOW_SECONDS: float = 60.0 # Audio per alignment window, bounds peak memory
+    ALIGN_BACKEND: str = "torch" # "torch" or "onnx" (int8 wav2vec2 on ONNX Runtime, CPU only, exported on first use)
+    ANCHOR_ASR_MODEL: Optional[str] = "small" # Fast model anchoring provided plain-text transcripts (None = spread the text evenly)
+    ANCHOR_CHUNK_WORDS: int = 40 # Longest chunk of provided text aligned as one segment
+    DIARIZE_BACKEND: str = "pyannote" # "pyannote" (WhisperX pipeline) or "onnx" (batched ONNX Runtime, CPU only, exported on first use)
+    DIARIZE_BATCH_SIZE: int = 32 # Windows per ONNX segmentation/embedding batch
+    DIARIZE_CLUSTER_SAMPLE: int = 4000 # Clean embeddings clustered exactly; past this a sample is clustered and k-means assigns the rest
+    VOICEPRINT_MATCH_THRESHOLD: Optional[float] = 0.75 # Cosine similarity naming a speaker after a known voiceprint (None = never)
+    VOICEPRINT_ANN_MIN: int = 1024 # Voiceprints past which a user's index is approximate (inverted file)
+    VAD_BACKEND: str = "silero" # "silero" (ONNX, bundled with faster-whisper) or "energy"
+    SPEECH_MAP: bool = True # ASR, alignment and diarization process only the speech regions
+    SPEECH_PAD_MS: int = 200 # Padding kept around every speech region
+    SPEECH_MAP_MAX_RATIO: float = 0.9 # Process the whole recording when speech covers more than this
+    DECODE_SELECTIVE: bool = True # Greedy first pass, re-decode only low-confidence segments with the job's beam_size
+    DECODE_FIRST_PASS_BEAM: int = 1
+    DECODE_LOGPROB_THRESHOLD: float = -1.0 # Segments below this average log probability are re-decoded
+    DECODE_COMPRESSION_THRESHOLD: float = 2.4 # ...or above this gzip compression ratio (repetition loops)
+    DECODE_NO_SPEECH_THRESHOLD: float = 0.6 # ...or above this no-speech probability
+
+    # Live streaming transcription (WebSocket)
+    ASR_WARM_MODELS: int = 2 # WhisperX models kept loaded between requests
+    LIVE_ASR_MODEL: str = "small" # Low-latency model for live interim/final segments
+    LIVE_PRELOAD: bool = True # Load the live model at startup
+    LIVE_MAX_SESSIONS: int = 4
+    LIVE_END_SILENCE_MS: int = 600 # Silence that closes an utterance
+    LIVE_MAX_UTTERANCE_SECONDS: float = 15.0
+    LIVE_INTERIM_SECONDS: float = 1.0 # New speech between interim hypotheses
+
+    # Cross-job pipelining: each stage has its own workers, so jobs overlap stage by stage
+    PIPELINE_MAX_JOBS: int = 3 # Jobs in flight at once (decoded audio is held in memory)
+    PIPELINE_MAX_QUEUED: int = 100 # Uploads are refused with 503 beyond this many waiting jobs (0 = unlimited)
+    PIPELINE_DECODE_WORKERS: int = 2
+    PIPELINE_ASR_WORKERS: int = 1
+    PIPELINE_ALIGN_WORKERS: int = 1
+    PIPELINE_DIARIZE_WORKERS: int = 1
+    PIPELINE_ASR_MEMORY_GB: float = 6.0 # Estimated peak RAM per running stage
+    PIPELINE_ALIGN_MEMORY_GB: float = 3.0
+    PIPELINE_DIARIZE_MEMORY_GB: float = 3.0
+    PIPELINE_MEMORY_GB: float = 0 # Memory budget for stages (0 = MemTotal minus reserve)
+    PIPELINE_MEMORY_RESERVE_GB: float = 2.0 # Left free for MongoDB, Ollama and the API
+
     # Storage
     TRANSCRIPT_STORAGE_PATH: str = "/transcripts"
 
@@ -1,5 +1,7 @@
 import os
 import base64
+from typing import BinaryIO, Iterable
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
@@ -25,6 +27,23 @@ def encrypt_data(data: bytes, key: bytes) -> bytes:
     ciphertext = aesgcm.encrypt(nonce, data, None)
     return nonce + ciphertext
 
+def encrypt_stream(chunks: Iterable[bytes], key: bytes, out: BinaryIO) -> int:
+    """
+    encrypt_data for data too large to hold in memory: writes the same nonce + ciphertext
+    + tag layout to `out` chunk by chunk. Returns the bytes written.
+    """
+    nonce = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+    out.write(nonce)
+    written = len(nonce)
+    for chunk in chunks:
+        data = encryptor.update(chunk)
+        out.write(data)
+        written += len(data)
+    tail = encryptor.finalize() + encryptor.tag
+    out.write(tail)
+    return written + len(tail)
+
 def decrypt_data(data: bytes, key: bytes) -> bytes:
     aesgcm = AESGCM(key)
     nonce = data[:12]
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -9,12 +10,28 @@ async def lifespan(app: FastAPI):
     # Startup
     db.connect()
     print("Starting up TranscribeLab Backend...")
+    # Jobs interrupted by the last shutdown resume from their checkpoints
+    from app.services.transcription import transcription_service
+    from app.services.pipeline import job_pipeline
+    job_pipeline.start(transcription_service.process_job, transcription_service.refine_job)
+    resume_task = asyncio.create_task(transcription_service.resume_interrupted_jobs())
+    warm_task = None
+    if settings.LIVE_PRELOAD:
+        # Live streaming needs its model loaded before the first meeting starts
+        from app.services.asr_models import asr_models
+        warm_task = asyncio.create_task(asyncio.to_thread(asr_models.get, settings.LIVE_ASR_MODEL))
     yield
+    resume_task.cancel()
+    if warm_task:
+        warm_task.cancel()
+    await job_pipeline.stop()
+    from app.services.alignment import alignment_engine
+    alignment_engine.shutdown()
     # Shutdown
     db.close()
     print("Shutting down...")
 
-from app.api import auth, jobs, sse, templates, utils
+from app.api import auth, jobs, sse, templates, utils, live, voiceprints
 
 app = FastAPI(
     title="TranscribeLab API",
@@ -46,6 +63,8 @@ app.include_router(templates.router, prefix="/templates", tags=["templates"])
 
 app.include_router(utils.router, prefix="/utils", tags=["utils"])
 app.include_router(sse.router, tags=["sse"])
+app.include_router(live.router, prefix="/live", tags=["live"])
+app.include_router(voiceprints.router, prefix="/voiceprints", tags=["voiceprints"])
 
 
 @app.get("/")
@@ -1,10 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from enum import Enum
 from datetime import datetime
 from bson import ObjectId
 
 class JobStatus(str, Enum):
+    RECORDING = "recording" # Live stream still being spooled
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
@@ -44,7 +45,19 @@ class JobInDB(JobBase):
     transcript_file_path: Optional[str] = None # Path to uploaded transcript (HiDock mode)
     config: JobConfig = Field(default_factory=JobConfig)
     duration: Optional[float] = None
+    checkpoint_stages: Optional[List[str]] = None # Pipeline stages with a saved checkpoint (decode, asr, align, diarize, finalize)
+    checkpoint_key: Optional[str] = None # Fingerprint of the inputs the checkpoints were built from
+    stage_timings: Optional[Dict[str, float]] = None # Wall seconds per pipeline stage of the last run
+    speech_map: Optional[Dict[str, Any]] = None # VAD speech regions (seconds), speech_seconds and backend
+    transcript_status: Optional[str] = None # draft, refining, final (two-pass ASR)
+    asr_model: Optional[str] = None # Whisper model behind the current transcript
+    recognized_speakers: Optional[List[str]] = None # Names given by voiceprint matching, never learned back
     summary_encrypted: Optional[str] = None
+    summary_draft_encrypted: Optional[str] = None # Quick draft from SUMMARY_DRAFT_MODEL, shown until the final one lands
+    summary_status: Optional[str] = None # drafting, draft, summarizing, final, failed
+    summary_error: Optional[str] = None # Why the last summarization failed (summary_status "failed")
+    summary_stats: Optional[Dict[str, Any]] = None # Token budget and LLM throughput of the last summary
+    summary_notes_path: Optional[str] = None # Encrypted per-chunk notes reused by re-summarization
     created_at: datetime = Field(default_factory=datetime.utcnow)
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
@@ -59,3 +72,4 @@ class Job(JobInDB):
     
 class TranscriptUpdate(BaseModel):
     segments: list
+    asr_pass: Optional[str] = None # asr_pass of the transcript the edits were made on
@@ -43,6 +43,7 @@ class UserInDB(UserBase):
 
     master_key_hash: str
     key_derivation_salt: str
+    voiceprint_key: Optional[str] = None # Key of the user's voiceprint store, created on first use
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
     is_superuser: bool = False
@@ -0,0 +1,203 @@
+import os
+import copy
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.vad import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Audio kept on each side of a window so the first and last words are not clipped
+WINDOW_PAD_SECONDS = 0.5
+
+# Alignment models cached inside a worker process, by (backend, language)
+_worker_models: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+_worker_threads = 1
+
+
+def _init_worker(threads: int):
+    global _worker_threads
+    import torch
+    torch.set_num_threads(max(1, threads))
+    _worker_threads = max(1, threads)
+
+
+def load_align_model(language: str, device: str, backend: str = "torch", threads: int = 1) -> Tuple[Any, Any]:
+    """
+    (model, metadata) for whisperx.align. backend "onnx" is the int8 ONNX Runtime export
+    (CPU only, see onnx_align); it falls back to the torch model if it cannot be built.
+    """
+    import whisperx
+    if backend == "onnx" and device == "cpu":
+        try:
+            from app.services.onnx_align import load_onnx_align_model
+            return load_onnx_align_model(language, threads)
+        except Exception as e:
+            logger.warning(f"ONNX alignment model unavailable for '{language}', using torch: {e}")
+    return whisperx.load_align_model(language_code=language, device=device)
+
+
+def _align_window(language: str, segments: List[dict], audio: np.ndarray, device: str, backend: str = "torch") -> dict:
+    """Runs in a worker process: aligns one window's segments against its audio slice."""
+    import whisperx
+    key = (backend, language)
+    if key not in _worker_models:
+        # One language at a time is the common case; don't let models pile up in the worker
+        _worker_models.clear()
+        _worker_models[key] = load_align_model(language, device, backend, _worker_threads)
+    model_a, metadata = _worker_models[key]
+    if model_a is None:
+        raise ValueError(f"No alignment model for language '{language}'")
+    return whisperx.align(segments, model_a, metadata, audio, device, return_char_alignments=False)
+
+
+def plan_windows(segments: List[dict], window_seconds: float) -> List[List[int]]:
+    """
+    Groups consecutive segments into windows of at most `window_seconds` of audio.
+    A segment longer than the window gets a window of its own.
+    """
+    windows: List[List[int]] = []
+    current: List[int] = []
+    window_start = None
+    for i, seg in enumerate(segments):
+        if current and seg["end"] - window_start > window_seconds:
+            windows.append(current)
+            current = []
+        if not current:
+            window_start = seg["start"]
+        current.append(i)
+    if current:
+        windows.append(current)
+    return windows
+
+
+class AlignmentEngine:
+    """
+    Windowed forced alignment. Consecutive segments are grouped into windows of about
+    ALIGN_WINDOW_SECONDS and each window is aligned against its own audio slice in a
+    worker process (ALIGN_WORKERS in parallel), so peak memory is bounded by the window
+    size and a segfault or OOM in the wav2vec2 model only loses that window: it is retried
+    once in a process of its own and otherwise keeps its segment-level timestamps.
+    """
+
+    def __init__(self, workers: int, window_seconds: float):
+        self.workers = max(1, workers)
+        self.window_seconds = window_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _new_pool(self, workers: int) -> ProcessPoolExecutor:
+        threads = settings.TORCH_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn: forking a process that already holds torch/CTranslate2 threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,)
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = self._new_pool(self.workers)
+        return self._pool
+
+    def _reset_pool(self, broken: ProcessPoolExecutor):
+        if self._pool is broken:
+            self._pool = None
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def align(
+        self,
+        segments: List[dict],
+        audio: np.ndarray,
+        language: str,
+        device: str = "cpu",
+        on_progress: Optional[Callable[[int, int], Any]] = None
+    ) -> Tuple[dict, int, int]:
+        """
+        Returns ({"segments", "word_segments"}, failed windows, total windows). Segments
+        of failed windows keep their original timestamps and have no word timings.
+        """
+        segments = [seg for seg in segments if seg.get("text", "").strip()]
+        windows = plan_windows(segments, self.window_seconds)
+        results: List[Optional[dict]] = [None] * len(windows)
+        slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        done = 0
+
+        async def run_window(index: int):
+            nonlocal done
+            members = [segments[i] for i in windows[index]]
+            offset = max(0.0, members[0]["start"] - WINDOW_PAD_SECONDS)
+            end = max(seg["end"] for seg in members) + WINDOW_PAD_SECONDS
+            window_audio = audio[int(offset * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+            shifted = [
+                {**{k: v for k, v in seg.items() if k != "words"}, "start": seg["start"] - offset, "end": seg["end"] - offset}
+                for seg in members
+            ]
+            for attempt in range(2):
+                async with slots:
+                    # The retry runs alone in its own process so one bad window cannot take others down again
+                    pool = self._get_pool() if attempt == 0 else self._new_pool(1)
+                    try:
+                        aligned = await loop.run_in_executor(
+                            pool, _align_window, language, shifted, window_audio, device, settings.ALIGN_BACKEND
+                        )
+                        results[index] = _shift(aligned, offset)
+                        break
+                    except BrokenProcessPool:
+                        # A worker crashed (segfault/OOM); every window it had in flight lands here
+                        logger.warning(f"Alignment worker crashed on window {index + 1}/{len(windows)} (attempt {attempt + 1})")
+                        self._reset_pool(pool)
+                    except Exception as e:
+                        logger.warning(f"Alignment failed on window {index + 1}/{len(windows)}: {e}")
+                        break
+                    finally:
+                        if attempt > 0:
+                            pool.shutdown(wait=False)
+            done += 1
+            if on_progress:
+                await on_progress(done, len(windows))
+
+        await asyncio.gather(*(run_window(i) for i in range(len(windows))))
+
+        aligned_segments, word_segments, failed = [], [], 0
+        for index, window in enumerate(windows):
+            result = results[index]
+            if result is None:
+                failed += 1
+                # Segment-level timestamps only for this window
+                aligned_segments.extend(copy.deepcopy(segments[i]) for i in window)
+                continue
+            aligned_segments.extend(result.get("segments", []))
+            word_segments.extend(result.get("word_segments", []))
+        return {"segments": aligned_segments, "word_segments": word_segments}, failed, len(windows)
+
+
+def _shift(result: dict, offset: float) -> dict:
+    """Window time -> recording time for segments, words and word_segments."""
+    items = list(result.get("word_segments") or [])
+    for seg in result.get("segments", []):
+        items.append(seg)
+        items.extend(seg.get("words") or [])
+    seen = set()
+    for item in items:
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        for key in ("start", "end"):
+            if item.get(key) is not None:
+                item[key] = round(item[key] + offset, 3)
+    return result
+
+
+alignment_engine = AlignmentEngine(settings.ALIGN_WORKERS, settings.ALIGN_WINDOW_SECONDS)
@@ -0,0 +1,117 @@
+import re
+import logging
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.asr_models import asr_models
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+(?:'\w+)?")
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+
+# A matching run must be at least this many words to count as an anchor
+MIN_ANCHOR_RUN = 3
+
+# Audio kept around each placed chunk, absorbs anchor interpolation error
+CHUNK_PAD_SECONDS = 1.0
+
+
+def tokens(text: str) -> List[str]:
+    return [w.lower() for w in WORD_RE.findall(text)]
+
+
+def split_chunks(text: str, max_words: int) -> List[str]:
+    """Sentences of the provided text, long ones cut every `max_words` words."""
+    chunks: List[str] = []
+    for sentence in SENTENCE_RE.split(text):
+        words = sentence.split()
+        for i in range(0, len(words), max(1, max_words)):
+            chunk = " ".join(words[i:i + max_words])
+            if WORD_RE.search(chunk):
+                chunks.append(chunk)
+            elif chunks and chunk:
+                # Lone punctuation or symbols: keep it with the previous chunk
+                chunks[-1] += " " + chunk
+    return chunks
+
+
+def draft_segments(audio: np.ndarray, language: Optional[str], threads: int = 4) -> List[Dict[str, Any]]:
+    """
+    Cheap hypothesis for anchoring: greedy decoding on the warm ANCHOR_ASR_MODEL.
+    Blocks while the model loads or runs; call it through asyncio.to_thread.
+    """
+    warm = asr_models.get(settings.ANCHOR_ASR_MODEL, None, threads)
+    with warm.configured({"beam_size": 1, "condition_on_previous_text": False}) as model:
+        return model.transcribe(audio, batch_size=8, language=language).get("segments", [])
+
+
+def _hypothesis_words(segments: List[Dict[str, Any]]) -> Tuple[List[str], List[float]]:
+    """Words of the draft with start times spread evenly over their segment."""
+    words, times = [], []
+    for seg in segments:
+        seg_words = tokens(seg.get("text", ""))
+        step = (seg["end"] - seg["start"]) / max(1, len(seg_words))
+        for i, word in enumerate(seg_words):
+            words.append(word)
+            times.append(seg["start"] + i * step)
+    return words, times
+
+
+def find_anchors(reference: List[str], hypothesis: List[str], times: List[float]) -> List[Tuple[int, float]]:
+    """
+    (reference word index, time) pairs where the draft agrees with the provided text
+    for at least MIN_ANCHOR_RUN words in a row. Monotonic in both index and time.
+    """
+    matcher = SequenceMatcher(None, hypothesis, reference)
+    anchors: List[Tuple[int, float]] = []
+    for block in matcher.get_matching_blocks():
+        if block.size < MIN_ANCHOR_RUN:
+            continue
+        for k in range(block.size):
+            t = times[block.a + k]
+            if not anchors or t >= anchors[-1][1]:
+                anchors.append((block.b + k, t))
+    return anchors
+
+
+def anchor_segments(
+    text: str,
+    duration: float,
+    draft: Optional[List[Dict[str, Any]]] = None,
+    max_words: int = 40
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Places the chunks of a provided transcript on the timeline so each can be aligned
+    against a short audio window instead of the whole recording. Chunk times are
+    interpolated between the anchors found in the `draft` (evenly over the recording
+    without one). Returns (segments, share of words that are anchors).
+    """
+    chunks = split_chunks(text, max_words)
+    bounds = [0]
+    for chunk in chunks:
+        bounds.append(bounds[-1] + len(tokens(chunk)))
+    total = bounds[-1]
+    if not chunks:
+        return [], 0.0
+
+    anchors: List[Tuple[int, float]] = []
+    if draft:
+        hyp_words, hyp_times = _hypothesis_words(draft)
+        anchors = find_anchors([w for chunk in chunks for w in tokens(chunk)], hyp_words, hyp_times)
+
+    # Word index -> time, pinned to where the draft (or the recording) starts and ends
+    points = dict(anchors)
+    points.setdefault(0, draft[0]["start"] if draft else 0.0)
+    points.setdefault(total, draft[-1]["end"] if draft else duration)
+    xs = sorted(points)
+    word_times = np.interp(np.arange(total + 1), xs, np.maximum.accumulate([points[x] for x in xs]))
+
+    segments = []
+    for k, chunk in enumerate(chunks):
+        start = max(0.0, float(word_times[bounds[k]]) - CHUNK_PAD_SECONDS)
+        end = min(duration, float(word_times[bounds[k + 1]]) + CHUNK_PAD_SECONDS)
+        segments.append({"text": chunk, "start": round(start, 3), "end": round(max(end, start + 0.5), 3)})
+    return segments, len(anchors) / max(1, total)
+
@@ -0,0 +1,127 @@
+import gc
+import time
+import logging
+import threading
+import dataclasses
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+import torch
+import whisperx
+from app.core.config import settings
+from app.services.stage_graph import thread_budget
+
+logger = logging.getLogger(__name__)
+
+
+def _with_options(options, overrides: Dict[str, Any]):
+    """Copy of faster-whisper TranscriptionOptions (NamedTuple or dataclass, by version) with overrides."""
+    overrides = {k: v for k, v in overrides.items() if v is not None and hasattr(options, k)}
+    if not overrides:
+        return options
+    if hasattr(options, "_replace"):
+        return options._replace(**overrides)
+    return dataclasses.replace(options, **overrides)
+
+
+class WarmModel:
+    """
+    A loaded WhisperX pipeline. Calls are serialized (the pipeline is not re-entrant), which
+    also lets every call run with its own decode and VAD options on the shared instance.
+    """
+
+    def __init__(self, key: Tuple, model):
+        self.key = key
+        self.model = model
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def transcribe(self, audio, **kwargs) -> dict:
+        with self.lock:
+            self.last_used = time.monotonic()
+            return self.model.transcribe(audio, **kwargs)
+
+    @contextmanager
+    def configured(self, options: Optional[Dict[str, Any]] = None, vad_params: Optional[Dict[str, float]] = None):
+        """
+        Holds the model and applies per-job decode options (beam_size, max_initial_timestamp...)
+        and VAD thresholds (vad_onset / vad_offset) for the block, restoring the defaults after.
+        Yields the pipeline.
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            pipeline = self.model
+            saved_options = pipeline.options
+            saved_vad = getattr(pipeline, "_vad_params", None)
+            try:
+                pipeline.options = _with_options(saved_options, options or {})
+                if vad_params and saved_vad is not None:
+                    pipeline._vad_params = {**saved_vad, **{k: v for k, v in vad_params.items() if v is not None}}
+                yield pipeline
+            finally:
+                pipeline.options = saved_options
+                if saved_vad is not None:
+                    pipeline._vad_params = saved_vad
+
+
+class ASRModelRegistry:
+    """
+    Keeps the most recently used WhisperX models loaded (LRU, ASR_WARM_MODELS entries)
+    so jobs and low-latency callers such as live streaming never pay the load time.
+    Models are loaded with default options and the process thread budget (thread_budget);
+    jobs apply their options per call (WarmModel.configured).
+    `get` blocks while loading; call it through asyncio.to_thread.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.compute_type = "float16" if self.device == "cuda" else "int8"
+        self._models: "OrderedDict[Tuple, WarmModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Tuple, threading.Lock] = {}
+
+    def get(self, name: str, language: Optional[str] = None, threads: Optional[int] = None) -> WarmModel:
+        key = (name, self.device, self.compute_type, language)
+        with self._lock:
+            warm = self._models.get(key)
+            if warm is not None:
+                self._models.move_to_end(key)
+                return warm
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # One loader per key; concurrent callers wait for it instead of loading twice
+        with loading:
+            with self._lock:
+                warm = self._models.get(key)
+            if warm is not None:
+                return warm
+            logger.info(f"Loading warm ASR model {name} ({self.device}, {self.compute_type}, language={language})")
+            if threads is None:
+                threads = thread_budget()["asr"]
+            model = whisperx.load_model(
+                name,
+                self.device,
+                compute_type=self.compute_type,
+                download_root=settings.TRANSCRIPT_STORAGE_PATH,
+                language=language,
+                threads=threads
+            )
+            warm = WarmModel(key, model)
+            with self._lock:
+                self._models[key] = warm
+                self._loading.pop(key, None)
+                while len(self._models) > self.capacity:
+                    evicted_key, _ = self._models.popitem(last=False)
+                    logger.info(f"Evicting warm ASR model {evicted_key[0]}")
+            gc.collect()
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+            return warm
+
+    def loaded(self) -> list:
+        with self._lock:
+            return [key[0] for key in self._models]
+
+
+asr_models = ASRModelRegistry(settings.ASR_WARM_MODELS)
@@ -0,0 +1,116 @@
+import os
+import struct
+from typing import Iterator, Optional
+from app.core.crypto import encrypt_data, decrypt_data, encrypt_stream
+from app.services.vad import SAMPLE_RATE
+
+# Raw PCM is appended to the encrypted spool in records of about one second
+SPOOL_RECORD_BYTES = SAMPLE_RATE * 2
+
+# AES-GCM nonce + tag around each record's PCM (see crypto.encrypt_data)
+RECORD_OVERHEAD = 12 + 16
+
+
+def spool_path_for(file_path: str) -> str:
+    """Spool of the live recording that becomes the job upload at `file_path`."""
+    return os.path.splitext(file_path)[0] + ".part"
+
+
+def _records(f) -> Iterator[bytes]:
+    while header := f.read(4):
+        (length,) = struct.unpack(">I", header)
+        record = f.read(length)
+        if len(record) < length:
+            return # Truncated tail from an interrupted write
+        yield record
+
+
+def read_spool(path: str, key: bytes) -> Iterator[bytes]:
+    """The spooled PCM, one decrypted record at a time."""
+    with open(path, "rb") as f:
+        for record in _records(f):
+            yield decrypt_data(record, key)
+
+
+def spooled_bytes(path: str) -> int:
+    """PCM bytes in the spool, from the record lengths alone."""
+    with open(path, "rb") as f:
+        return sum(len(record) - RECORD_OVERHEAD for record in _records(f))
+
+
+def wav_header(data_bytes: int) -> bytes:
+    """Canonical 44-byte header of a 16 kHz mono s16le WAV holding `data_bytes` of PCM."""
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_bytes, b"WAVE",
+        b"fmt ", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+        b"data", data_bytes
+    )
+
+
+def store_spool(path: str, file_path: str, key: bytes) -> int:
+    """
+    Writes a spooled stream as a regular encrypted job upload and removes the spool;
+    returns the upload size. Streams record by record, so memory stays flat however
+    long the recording is.
+    """
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        size = encrypt_stream(_wav_chunks(path, key), key, f)
+    os.replace(tmp_path, file_path)
+    os.remove(path)
+    return size
+
+
+def _wav_chunks(path: str, key: bytes) -> Iterator[bytes]:
+    yield wav_header(spooled_bytes(path))
+    yield from read_spool(path, key)
+
+
+def recover_recording(file_path: str, key: bytes) -> Optional[int]:
+    """
+    Turns the spool of a stream cut off by a restart into its job upload. Returns the
+    upload size, or None when neither the spool nor the upload survived.
+    """
+    path = spool_path_for(file_path)
+    if os.path.exists(path):
+        return store_spool(path, file_path, key)
+    if os.path.exists(file_path):
+        return os.path.getsize(file_path) # Stored, but the job was never queued
+    return None
+
+
+class AudioSpool:
+    """
+    Incrementally persisted stream audio: s16le PCM appended as length-prefixed
+    records, each encrypted with the job's file key. The job document holding that key
+    is created when the stream starts, so after a crash the spool is recovered into the
+    job (see recover_recording) and only the last unflushed second is lost.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        self.path = path
+        self.key = key
+        self.samples = 0
+        self._pending = bytearray()
+        self._file = open(path, "ab")
+
+    def append(self, pcm: bytes):
+        self._pending.extend(pcm)
+        self.samples += len(pcm) // 2
+        if len(self._pending) >= SPOOL_RECORD_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        record = encrypt_data(bytes(self._pending), self.key)
+        self._file.write(struct.pack(">I", len(record)) + record)
+        self._file.flush()
+        self._pending.clear()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
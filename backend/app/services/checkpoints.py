@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Optional, Dict, Any, List
+from app.core.crypto import encrypt_data, decrypt_data
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages. A job's `checkpoint_stages` lists the ones that completed.
+STAGES = ["decode", "vad", "asr", "align", "diarize", "finalize"]
+
+# Artifacts that are not stages: the transcript published while ASR is still running
+# and the speaker embeddings re-diarization re-clusters
+ARTIFACTS = STAGES + ["partial", "embeddings"]
+
+# Bump when the content of stage artifacts changes so old checkpoints are not resumed.
+CHECKPOINT_VERSION = "5"
+
+# Config keys left out of the fingerprint: the diarize checkpoint records the speaker
+# hints it was built with, so changing them re-clusters instead of restarting the job
+SPEAKER_CONFIG_KEYS = ("min_speakers", "max_speakers")
+
+
+def checkpoint_fingerprint(job: Dict[str, Any], model_name: str) -> str:
+    """
+    Identifies the inputs a job's checkpoints were built from (audio, transcript source,
+    model, language, config). Checkpoints with a different fingerprint are discarded.
+    """
+    transcript_text = job.get("transcript_text") or ""
+    config = job.get("config") or {}
+    if isinstance(config, dict):
+        config = {k: v for k, v in config.items() if k not in SPEAKER_CONFIG_KEYS}
+    parts = [
+        CHECKPOINT_VERSION,
+        job.get("file_path") or "",
+        job.get("transcript_file_path") or "",
+        hashlib.sha256(transcript_text.encode("utf-8")).hexdigest(),
+        model_name,
+        job.get("language") or "",
+        json.dumps(config, sort_keys=True, default=str),
+    ]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def checkpoint_base_for(job: Dict[str, Any], job_id: str) -> str:
+    """Checkpoints live next to the encrypted audio: {dir}/{filename}.{stage}.ckpt.enc"""
+    directory = os.path.dirname(job["file_path"])
+    return os.path.join(directory, job.get("filename") or job_id)
+
+
+def checkpoint_files(job: Dict[str, Any], job_id: str) -> List[str]:
+    """Every checkpoint path a job may have on disk (for deletion)."""
+    if not job.get("file_path"):
+        return []
+    base = checkpoint_base_for(job, job_id)
+    return [f"{base}.{stage}.ckpt.enc" for stage in ARTIFACTS]
+
+
+class CheckpointStore:
+    """
+    Encrypted per-stage artifacts of one job, written atomically with the job's file key.
+    "asr"/"align" hold the WhisperX result after that stage, "vad" the speech regions, "diarize" the speaker turns,
+    "decode" raw float32 audio, "partial" the segments transcribed so far and "embeddings"
+    the diarization segmentation and speaker embeddings (npz).
+    """
+
+    def __init__(self, base_path: str, file_key: bytes):
+        self.base_path = base_path
+        self.file_key = file_key
+
+    def path(self, stage: str) -> str:
+        return f"{self.base_path}.{stage}.ckpt.enc"
+
+    def exists(self, stage: str) -> bool:
+        return os.path.exists(self.path(stage))
+
+    def save_bytes(self, stage: str, data: bytes):
+        encrypted = encrypt_data(data, self.file_key)
+        tmp_path = self.path(stage) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encrypted)
+        os.replace(tmp_path, self.path(stage))
+
+    def load_bytes(self, stage: str) -> Optional[bytes]:
+        if not self.exists(stage):
+            return None
+        try:
+            with open(self.path(stage), "rb") as f:
+                return decrypt_data(f.read(), self.file_key)
+        except Exception as e:
+            logger.warning(f"Could not read checkpoint {self.path(stage)}: {e}")
+            return None
+
+    def save_json(self, stage: str, data: Dict[str, Any]):
+        self.save_bytes(stage, json.dumps(data).encode("utf-8"))
+
+    def load_json(self, stage: str) -> Optional[Dict[str, Any]]:
+        data = self.load_bytes(stage)
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError as e:
+            logger.warning(f"Corrupt checkpoint {self.path(stage)}: {e}")
+            return None
+
+    def discard(self, stages: Optional[List[str]] = None):
+        for stage in stages or ARTIFACTS:
+            for path in (self.path(stage), self.path(stage) + ".tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def paths(self) -> List[str]:
+        return [self.path(stage) for stage in ARTIFACTS if self.exists(stage)]
@@ -0,0 +1,248 @@
+import re
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.services.token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Hesitation sounds that carry no content for a summary. Only single sounds that are
+# never words: "like", "bueno" and the like are often meaningful, and "er", "ah" or
+# "mm" are also abbreviations or quoted ("the ER", 'said "ah"').
+FILLERS: Dict[str, List[str]] = {
+    "en": ["um", "umm", "uh", "uhh", "uhm", "erm", "hmm", "mhm", "mm-hmm"],
+    "es": ["eh", "ehm", "em", "emm", "mmm", "hmm"],
+}
+
+# Discourse markers, dropped only when they stand alone as a clause ("You know, the
+# budget...", "..., o sea, ..."), never inside one ("Do you know where", "I mean it")
+DISCOURSE_MARKERS: Dict[str, List[str]] = {
+    "en": ["you know", "i mean"],
+    "es": ["o sea"],
+}
+
+_FILLER_PATTERNS: Dict[str, re.Pattern] = {}
+
+# Disfluent repetitions: a single letter repeated ("I I think") or a word said three or
+# more times in a row ("the the the"). Two in a row ("had had", "that that") is often
+# grammatical, and comma-separated repeats ("No, no, no") are deliberate, so both stay.
+# Letters only and case-sensitive: "2 2 servers", "5 5 5 1234" and "Plan B b" are content.
+_STUTTER = re.compile(r"\b(?:([^\W\d_])(?:\s+\1\b)+|([^\W\d_]{2,})(?:\s+\2\b){2,})", re.UNICODE)
+_SPACES = re.compile(r"\s{2,}")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([,.;:!?])")
+_DUPLICATE_PUNCT = re.compile(r"([,.;:!?])(?:\s*[,;])+")
+_LEADING_PUNCT = re.compile(r"^[\s,;.]+")
+
+# Whisper loops are usually short phrases repeated back to back
+# ("Thank you. Thank you. Thank you."), so n-grams up to 8 words catch them.
+# Single words repeated a few times are usually emphasis ("very very very good"),
+# so they only count as a loop from LOOP_MIN_UNIGRAM_REPEATS on.
+# Speaker placeholders of the neutral lines: a form transcripts and notes never contain
+# on their own ("AWS S3", "the S2 model"), so only placeholders get names substituted
+NEUTRAL_SPEAKER = "[[S{}]]"
+
+LOOP_MAX_NGRAM = 8
+LOOP_MIN_REPEATS = 3
+LOOP_MIN_UNIGRAM_REPEATS = 8
+
+# A repeat that follows clause punctuation ("No, no, no") is said on purpose
+_CLAUSE_END = (",", ";", ":")
+
+
+def _filler_pattern(language: str) -> Optional[re.Pattern]:
+    if language not in FILLERS:
+        return None
+    if language not in _FILLER_PATTERNS:
+        words = sorted(FILLERS[language], key=len, reverse=True)
+        alternation = "|".join(re.escape(w) for w in words)
+        markers = "|".join(re.escape(m) for m in sorted(DISCOURSE_MARKERS.get(language, []), key=len, reverse=True))
+        # Fillers are removed together with the commas that usually surround them;
+        # markers only between clause punctuation (or the start/end of the text)
+        standalone = rf"|(?:(?<=^)|,|(?<=[.;:!?]))\s*(?:{markers})(?=\s*(?:[,.;:!?]|$)),?" if markers else ""
+        _FILLER_PATTERNS[language] = re.compile(
+            rf",?\s*(?<![\w-])(?:{alternation})(?![\w-]),?{standalone}",
+            re.IGNORECASE | re.UNICODE
+        )
+    return _FILLER_PATTERNS[language]
+
+
+def _tidy(text: str) -> str:
+    text = _SPACES.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT.sub(r"\1", text)
+    text = _DUPLICATE_PUNCT.sub(r"\1", text)
+    text = _LEADING_PUNCT.sub("", text)
+    return text.strip()
+
+
+def drop_fillers(text: str, language: str = "en") -> Tuple[str, int]:
+    """Removes filler words and immediate word repetitions. Returns (text, removed_count)."""
+    removed = 0
+    pattern = _filler_pattern(language)
+    if pattern is not None:
+        text, removed = pattern.subn("", text)
+    text, stutters = _STUTTER.subn(lambda m: m.group(1) or m.group(2), text)
+    return _tidy(text), removed + stutters
+
+
+def _normalize_word(word: str) -> str:
+    return word.strip(".,;:!?¿¡\"'").lower()
+
+
+def collapse_loops(text: str, max_ngram: int = LOOP_MAX_NGRAM, min_repeats: int = LOOP_MIN_REPEATS) -> Tuple[str, int]:
+    """
+    Collapses an n-gram repeated `min_repeats` or more times in a row into a single copy
+    (LOOP_MIN_UNIGRAM_REPEATS for single words). N-grams with numbers are never collapsed,
+    and a comma between two copies ends the run. Returns (text, collapsed_count).
+    """
+    words = text.split()
+    if len(words) < min_repeats:
+        return text, 0
+
+    norm = [_normalize_word(w) for w in words]
+    numeric = [any(c.isdigit() for c in w) for w in words]
+    clause_end = [w.endswith(_CLAUSE_END) for w in words]
+    out: List[str] = []
+    collapsed = 0
+    i = 0
+    while i < len(words):
+        best_n = 0
+        best_reps = 0
+        for n in range(1, max_ngram + 1):
+            needed = max(min_repeats, LOOP_MIN_UNIGRAM_REPEATS) if n == 1 else min_repeats
+            if i + n * min_repeats > len(words):
+                break
+            gram = norm[i:i + n]
+            if not any(gram) or any(numeric[i:i + n]):
+                continue
+            reps = 1
+            while not clause_end[i + reps * n - 1] and norm[i + reps * n:i + (reps + 1) * n] == gram:
+                reps += 1
+            # Prefer the pattern that swallows the most words
+            if reps >= needed and reps * n > best_reps * best_n:
+                best_n, best_reps = n, reps
+        if best_n:
+            out.extend(words[i:i + best_n])
+            i += best_n * best_reps
+            collapsed += 1
+        else:
+            out.append(words[i])
+            i += 1
+    return " ".join(out), collapsed
+
+
+def merge_turns(turns: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Joins consecutive turns by the same speaker into one."""
+    merged: List[Dict[str, str]] = []
+    for turn in turns:
+        if merged and merged[-1]["speaker"] == turn["speaker"]:
+            merged[-1]["text"] = f"{merged[-1]['text']} {turn['text']}".strip()
+        else:
+            merged.append(dict(turn))
+    return merged
+
+
+def abbreviate_speakers(turns: List[Dict[str, str]], label: str = "S{}") -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    """Replaces speaker labels with S1, S2, ... (`label` numbered) in order of first appearance."""
+    mapping: Dict[str, str] = {}
+    for turn in turns:
+        if turn["speaker"] not in mapping:
+            mapping[turn["speaker"]] = label.format(len(mapping) + 1)
+    return [{"speaker": mapping[t["speaker"]], "text": t["text"]} for t in turns], mapping
+
+
+def default_options() -> Dict[str, bool]:
+    return {
+        "merge_turns": settings.COMPACTION_MERGE_TURNS,
+        "drop_fillers": settings.COMPACTION_DROP_FILLERS,
+        "collapse_loops": settings.COMPACTION_COLLAPSE_LOOPS,
+        "abbreviate_speakers": settings.COMPACTION_ABBREVIATE_SPEAKERS,
+    }
+
+
+def compact_transcript(
+    segments: List[Dict[str, Any]],
+    language: str = "en",
+    options: Optional[Dict[str, bool]] = None
+) -> Dict[str, Any]:
+    """
+    Turns WhisperX segments into the "Speaker: text" lines sent to the LLM,
+    removing content that only costs prefill tokens.
+
+    Returns a dict with:
+      - lines: list of "Speaker: text" strings
+      - legend: speaker abbreviation legend ("" if not abbreviated)
+      - text: legend + lines, ready to be used as the transcript prompt
+      - neutral_lines: the lines with [[S1]], [[S2]], ... (order of first appearance) for
+        every speaker, whatever `abbreviate_speakers` says; unchanged by speaker renames
+      - speakers: {placeholder: speaker name} for neutral_lines
+      - stats: token counts before/after and what each stage removed
+    """
+    opts = default_options()
+    if options:
+        opts.update(options)
+
+    raw_turns = [
+        {"speaker": s.get("speaker", "Unknown"), "text": (s.get("text") or "").strip()}
+        for s in segments
+    ]
+    original_text = "\n".join(f"{t['speaker']}: {t['text']}" for t in raw_turns)
+    stats = {
+        "segments": len(raw_turns),
+        "fillers_removed": 0,
+        "loops_collapsed": 0,
+    }
+
+    turns = raw_turns
+    if opts["drop_fillers"]:
+        cleaned = []
+        for t in turns:
+            text, removed = drop_fillers(t["text"], language)
+            stats["fillers_removed"] += removed
+            cleaned.append({"speaker": t["speaker"], "text": text})
+        turns = cleaned
+
+    turns = [t for t in turns if t["text"]]
+
+    if opts["merge_turns"]:
+        turns = merge_turns(turns)
+
+    # Loops often span several Whisper segments, so collapse after merging
+    if opts["collapse_loops"]:
+        collapsed_turns = []
+        for t in turns:
+            text, collapsed = collapse_loops(t["text"])
+            stats["loops_collapsed"] += collapsed
+            collapsed_turns.append({"speaker": t["speaker"], "text": text})
+        turns = collapsed_turns
+
+    neutral_turns, neutral = abbreviate_speakers(turns, NEUTRAL_SPEAKER)
+    neutral_lines = [f"{t['speaker']}: {t['text']}" for t in neutral_turns]
+    legend = ""
+    if opts["abbreviate_speakers"]:
+        turns, mapping = abbreviate_speakers(turns)
+        legend = "SPEAKERS: " + ", ".join(f"{short} = {name}" for name, short in mapping.items())
+
+    lines = [f"{t['speaker']}: {t['text']}" for t in turns]
+    text = "\n".join(([legend] if legend else []) + lines)
+
+    original_tokens = estimate_tokens(original_text, language)
+    compacted_tokens = estimate_tokens(text, language)
+    stats.update({
+        "turns": len(lines),
+        "original_tokens": original_tokens,
+        "compacted_tokens": compacted_tokens,
+        "reduction_ratio": round(1 - compacted_tokens / original_tokens, 3) if original_tokens else 0.0,
+        "options": opts,
+    })
+    logger.info(
+        f"Transcript compaction: {original_tokens} -> {compacted_tokens} tokens "
+        f"({stats['reduction_ratio']:.1%} saved, {stats['segments']} segments -> {stats['turns']} turns)"
+    )
+    return {
+        "lines": lines,
+        "legend": legend,
+        "text": text,
+        "neutral_lines": neutral_lines,
+        "speakers": {placeholder: name for name, placeholder in neutral.items()},
+        "stats": stats,
+    }
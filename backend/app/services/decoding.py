@@ -0,0 +1,137 @@
+import zlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.vad import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Whisper's temperature fallback schedule for re-decoded segments
+FALLBACK_TEMPERATURES = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
+
+def compression_ratio(text: str) -> float:
+    """Same measure as Whisper: repetitive (hallucinated) text compresses too well."""
+    data = text.encode("utf-8")
+    if not data:
+        return 0.0
+    return len(data) / len(zlib.compress(data))
+
+
+class ScoringModel:
+    """
+    Stands in for the CTranslate2 model inside a WhisperX pipeline and records the
+    average log probability and no-speech probability of every sequence the batched
+    first pass generates. Everything else is delegated to the wrapped model.
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def start_recording(self) -> List[Dict[str, float]]:
+        self._local.scores = []
+        return self._local.scores
+
+    def stop_recording(self):
+        self._local.scores = None
+
+    def generate(self, *args, **kwargs):
+        scores = getattr(self._local, "scores", None)
+        if scores is None:
+            return self._model.generate(*args, **kwargs)
+        kwargs.setdefault("return_scores", True)
+        kwargs.setdefault("return_no_speech_prob", True)
+        results = self._model.generate(*args, **kwargs)
+        for item in results:
+            # With the default length penalty the score is the mean token log probability
+            scores.append({
+                "avg_logprob": float(item.scores[0]) if item.scores else 0.0,
+                "no_speech_prob": float(getattr(item, "no_speech_prob", 0.0)),
+            })
+        return results
+
+
+def attach_scorer(pipeline) -> Optional[ScoringModel]:
+    """Wraps the pipeline's CTranslate2 model once; None if the pipeline has an unexpected shape."""
+    whisper = getattr(pipeline, "model", None)
+    if whisper is None or not hasattr(whisper, "model"):
+        return None
+    if not isinstance(whisper.model, ScoringModel):
+        whisper.model = ScoringModel(whisper.model)
+    return whisper.model
+
+
+def is_low_confidence(segment: Dict[str, Any], metrics: Dict[str, float]) -> bool:
+    if compression_ratio(segment.get("text", "")) > settings.DECODE_COMPRESSION_THRESHOLD:
+        return True
+    if metrics["avg_logprob"] < settings.DECODE_LOGPROB_THRESHOLD:
+        return True
+    return metrics["no_speech_prob"] > settings.DECODE_NO_SPEECH_THRESHOLD
+
+
+def selective_transcribe(
+    pipeline,
+    audio: np.ndarray,
+    language: Optional[str],
+    batch_size: int,
+    beam_size: int,
+    condition_on_previous_text: bool = False,
+    max_initial_timestamp: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Greedy (or small-beam) batched first pass, then only the low-confidence segments
+    (avg logprob, compression ratio, no-speech probability) are decoded again with
+    `beam_size` and the temperature fallback. Returns the WhisperX result plus
+    `redecoded` / `dropped` counts.
+    """
+    scorer = attach_scorer(pipeline)
+    scores = scorer.start_recording() if scorer else None
+    try:
+        result = pipeline.transcribe(audio, batch_size=batch_size, language=language)
+    finally:
+        if scorer:
+            scorer.stop_recording()
+
+    segments = result.get("segments", [])
+    result["redecoded"] = result["dropped"] = 0
+    if scores is None or len(scores) != len(segments):
+        # One generated sequence per VAD chunk is what WhisperX does; anything else cannot be paired
+        if scorer:
+            logger.warning(f"Confidence scores do not match segments ({len(scores)} vs {len(segments)}), keeping first pass")
+        return result
+
+    kept = []
+    for segment, metrics in zip(segments, scores):
+        if not is_low_confidence(segment, metrics):
+            kept.append(segment)
+            continue
+        start, end = int(segment["start"] * SAMPLE_RATE), int(segment["end"] * SAMPLE_RATE)
+        redecoded, _ = pipeline.model.transcribe(
+            audio[start:end],
+            language=language or result.get("language"),
+            beam_size=beam_size,
+            temperature=FALLBACK_TEMPERATURES,
+            compression_ratio_threshold=settings.DECODE_COMPRESSION_THRESHOLD,
+            log_prob_threshold=settings.DECODE_LOGPROB_THRESHOLD,
+            no_speech_threshold=settings.DECODE_NO_SPEECH_THRESHOLD,
+            condition_on_previous_text=condition_on_previous_text,
+            max_initial_timestamp=1.0 if max_initial_timestamp is None else max_initial_timestamp,
+            without_timestamps=True,
+            vad_filter=False
+        )
+        text = "".join(part.text for part in redecoded).strip()
+        result["redecoded"] += 1
+        if not text:
+            # faster-whisper judged the chunk to be silence: drop the hallucinated text
+            result["dropped"] += 1
+            continue
+        segment["text"] = " " + text
+        kept.append(segment)
+    result["segments"] = kept
+    return result
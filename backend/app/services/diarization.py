@@ -0,0 +1,515 @@
+import io
+import os
+import json
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.core.config import settings
+from app.services.vad import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Bump when the export changes so cached models are rebuilt
+EXPORT_VERSION = "1"
+
+PIPELINE_NAME = "pyannote/speaker-diarization-3.1"
+
+# pyannote/speaker-diarization-3.1 hyper-parameters
+CHUNK_STEP_RATIO = 0.1 # Segmentation windows overlap by 90%
+CLUSTERING_THRESHOLD = 0.7045654963945799 # Centroid linkage distance on L2-normalized embeddings
+MIN_CLUSTER_SIZE = 12
+MIN_ACTIVE_RATIO = 0.2 # Clean (non-overlapped) speech needed for an embedding to shape the clusters
+REFINE_ITERATIONS = 10 # k-means passes over all embeddings after clustering a sample
+
+
+def powerset_mapping(num_classes: int, max_set_size: int) -> np.ndarray:
+    """pyannote's powerset classes (empty set, singles, pairs...) as rows of active local speakers."""
+    from itertools import combinations
+    rows = []
+    for size in range(max_set_size + 1):
+        for subset in combinations(range(num_classes), size):
+            row = np.zeros(num_classes, dtype=np.uint8)
+            row[list(subset)] = 1
+            rows.append(row)
+    return np.stack(rows)
+
+
+def onnx_model_dir() -> str:
+    return os.path.join(settings.TRANSCRIPT_STORAGE_PATH, "onnx", "diarize")
+
+
+def onnx_model_paths() -> Tuple[str, str, str]:
+    """(segmentation model, int8 embedding model, metadata JSON)."""
+    base = os.path.join(onnx_model_dir(), f"v{EXPORT_VERSION}")
+    return base + ".segmentation.onnx", base + ".embedding.int8.onnx", base + ".json"
+
+
+def export_diarization_models():
+    """
+    Exports the networks of pyannote/speaker-diarization-3.1 (needs HF_TOKEN and the
+    accepted model agreements): the segmentation model as ONNX and the WeSpeaker ResNet
+    embedding network as int8 ONNX. The fbank front end of the embedding model stays
+    outside the graph and runs on torchaudio.
+    """
+    import torch
+    from pyannote.audio import Pipeline
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    seg_path, emb_path, meta_path = onnx_model_paths()
+    pipeline = Pipeline.from_pretrained(PIPELINE_NAME, use_auth_token=settings.HF_TOKEN)
+    if pipeline is None:
+        raise ValueError(f"Could not load {PIPELINE_NAME}: check HF_TOKEN and the model agreements")
+    segmentation = pipeline._segmentation.model.eval()
+    embedding = pipeline._embedding.model_.eval()
+    chunk_samples = int(segmentation.specifications.duration * SAMPLE_RATE)
+
+    class Embedding(torch.nn.Module):
+        """fbank features + frame weights -> speaker embedding."""
+
+        def __init__(self, resnet):
+            super().__init__()
+            self.resnet = resnet
+
+        def forward(self, fbank, weights):
+            return self.resnet(fbank, weights=weights)[1]
+
+    os.makedirs(onnx_model_dir(), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=onnx_model_dir()) as tmp, torch.inference_mode():
+        waveforms = torch.zeros(2, 1, chunk_samples)
+        num_frames = segmentation(waveforms).shape[1]
+        tmp_seg = os.path.join(tmp, "segmentation.onnx")
+        torch.onnx.export(
+            segmentation, waveforms, tmp_seg,
+            input_names=["waveforms"], output_names=["scores"],
+            dynamic_axes={"waveforms": {0: "batch"}, "scores": {0: "batch"}},
+            opset_version=17
+        )
+
+        fbank = embedding.compute_fbank(waveforms)
+        tmp_emb = os.path.join(tmp, "embedding.onnx")
+        tmp_emb_int8 = os.path.join(tmp, "embedding.int8.onnx")
+        torch.onnx.export(
+            Embedding(embedding.resnet), (fbank, torch.ones(2, num_frames)), tmp_emb,
+            input_names=["fbank", "weights"], output_names=["embeddings"],
+            dynamic_axes={"fbank": {0: "batch"}, "weights": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=17
+        )
+        quantize_dynamic(tmp_emb, tmp_emb_int8, weight_type=QuantType.QInt8)
+        os.replace(tmp_seg, seg_path)
+        os.replace(tmp_emb_int8, emb_path)
+
+    specifications = segmentation.specifications
+    frames = getattr(segmentation, "receptive_field", None) or segmentation.example_output.frames
+    metadata = {
+        "chunk_samples": chunk_samples,
+        "num_frames": int(num_frames),
+        "frame_step": float(frames.step),
+        "frame_duration": float(frames.duration),
+        # Powerset class -> active local speakers
+        "powerset": powerset_mapping(len(specifications.classes), specifications.powerset_max_classes).tolist(),
+    }
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+class Segmentation:
+    """Binarized local speaker activity of every overlapping window, (chunks, frames, local speakers)."""
+
+    def __init__(self, masks: np.ndarray, chunk_step: float, frame_step: float, frame_duration: float, duration: float):
+        self.masks = masks
+        self.chunk_step = chunk_step
+        self.frame_step = frame_step
+        self.frame_duration = frame_duration
+        self.duration = duration
+
+
+class Embeddings:
+    """One embedding per active (chunk, local speaker) pair; `clean` marks those allowed to shape clusters."""
+
+    def __init__(self, pairs: np.ndarray, vectors: np.ndarray, clean: np.ndarray):
+        self.pairs = pairs
+        self.vectors = vectors
+        self.clean = clean
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-8)
+
+
+def _cluster_centroids(
+    x: np.ndarray,
+    num_speakers: Optional[int] = None,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None
+) -> np.ndarray:
+    """
+    Speaker centroids of L2-normalized embeddings. With a known speaker count, Ward's
+    linkage cut at exactly that many clusters; otherwise centroid linkage at the pyannote
+    threshold with small clusters dropped, re-cut with Ward's when min/max move the count.
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+
+    if len(x) < 2:
+        return x.copy()
+    if num_speakers:
+        # Centroid linkage has inversions, so cutting it at k clusters may give fewer;
+        # Ward's linkage is monotonic and gives exactly k
+        clusters = fcluster(linkage(x, method="ward"), min(num_speakers, len(x)), criterion="maxclust") - 1
+        return np.stack([x[clusters == c].mean(axis=0) for c in np.unique(clusters)])
+
+    tree = linkage(x, method="centroid", metric="euclidean")
+    clusters = fcluster(tree, CLUSTERING_THRESHOLD, criterion="distance") - 1
+    min_size = min(MIN_CLUSTER_SIZE, max(1, round(0.1 * len(x))))
+    sizes = np.bincount(clusters)
+    large = np.flatnonzero(sizes >= min_size)
+    if len(large) == 0:
+        large = np.array([int(np.argmax(sizes))])
+
+    k = len(large)
+    if min_speakers:
+        k = max(k, min_speakers)
+    if max_speakers:
+        k = min(k, max_speakers)
+    if k != len(large):
+        return _cluster_centroids(x, num_speakers=k)
+    return np.stack([x[clusters == c].mean(axis=0) for c in large])
+
+
+def refine_centroids(x: np.ndarray, centroids: np.ndarray, iterations: int = REFINE_ITERATIONS) -> np.ndarray:
+    """
+    Spherical k-means from the given centroids over all (normalized) embeddings: linear in
+    their number. A centroid that loses all its embeddings keeps its position.
+    """
+    centroids = _normalize(centroids)
+    assigned = None
+    for _ in range(iterations):
+        nearest = np.argmax(x @ centroids.T, axis=1)
+        if assigned is not None and np.array_equal(nearest, assigned):
+            break
+        assigned = nearest
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, x)
+        moved = np.bincount(nearest, minlength=len(centroids)) > 0
+        centroids[moved] = _normalize(sums[moved])
+    return centroids
+
+
+def cluster_embeddings(
+    embeddings: Embeddings,
+    num_chunks: int,
+    num_local: int,
+    num_speakers: Optional[int] = None,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None
+) -> np.ndarray:
+    """
+    Speaker index of every (chunk, local speaker) pair, -1 when inactive. Agglomerative
+    clustering of the clean embeddings (as pyannote 3.1, see _cluster_centroids), then
+    every pair assigned to its closest centroid without giving two local speakers of the
+    same window the same speaker.
+    Linkage needs memory and time quadratic in the embeddings, so past
+    DIARIZE_CLUSTER_SAMPLE clean embeddings (about an hour of speech) only an evenly
+    spaced sample is clustered and k-means over all of them refines the centroids.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    labels = np.full((num_chunks, num_local), -1, dtype=np.int32)
+    if len(embeddings.vectors) == 0:
+        return labels
+    x = _normalize(embeddings.vectors.astype(np.float32))
+    train = np.flatnonzero(embeddings.clean)
+    if len(train) < 2:
+        train = np.arange(len(x))
+
+    sample = train
+    limit = max(2, settings.DIARIZE_CLUSTER_SAMPLE)
+    if len(train) > limit:
+        # Pairs are in time order, so an even stride covers the whole recording
+        sample = train[np.linspace(0, len(train) - 1, limit).astype(int)]
+    centroids = _cluster_centroids(x[sample], num_speakers, min_speakers, max_speakers)
+    if len(sample) < len(train):
+        centroids = refine_centroids(x[train], centroids)
+
+    centroids = _normalize(centroids)
+    similarity = x @ centroids.T
+    # Constrained assignment per window: local speakers of one window are different people
+    order = np.argsort(embeddings.pairs[:, 0], kind="stable")
+    chunk_ids = embeddings.pairs[order, 0]
+    bounds = np.flatnonzero(np.diff(chunk_ids)) + 1
+    for group in np.split(order, bounds):
+        if len(group) == 1 or len(group) > len(centroids):
+            best = np.argmax(similarity[group], axis=1)
+        else:
+            rows, cols = linear_sum_assignment(-similarity[group])
+            best = cols[np.argsort(rows)]
+        labels[embeddings.pairs[group, 0], embeddings.pairs[group, 1]] = best
+    return labels
+
+
+def reconstruct(segmentation: Segmentation, labels: np.ndarray) -> pd.DataFrame:
+    """
+    Speaker turns from the clustered windows: per frame, the speakers with the highest
+    averaged activity, as many as the windows say are speaking. Same columns as
+    WhisperX's DiarizationPipeline (start, end, speaker), so assign_word_speakers works.
+    """
+    masks = segmentation.masks
+    num_chunks, num_frames, _ = masks.shape
+    num_speakers = int(labels.max()) + 1 if labels.size and labels.max() >= 0 else 0
+    if num_speakers == 0:
+        return pd.DataFrame(columns=["start", "end", "speaker"])
+
+    offsets = np.rint(np.arange(num_chunks) * segmentation.chunk_step / segmentation.frame_step).astype(int)
+    total = int(offsets[-1]) + num_frames
+    activity = np.zeros((num_speakers, total), dtype=np.float32)
+    coverage = np.zeros(total, dtype=np.float32)
+    counts = np.zeros(total, dtype=np.float32)
+    for c in range(num_chunks):
+        window = slice(offsets[c], offsets[c] + num_frames)
+        coverage[window] += 1
+        counts[window] += masks[c].sum(axis=1)
+        for s in np.flatnonzero(labels[c] >= 0):
+            activity[labels[c, s], window] += masks[c, :, s]
+
+    coverage = np.maximum(coverage, 1)
+    activity /= coverage
+    speaking = np.minimum(np.rint(counts / coverage), num_speakers).astype(int)
+    rank = np.argsort(np.argsort(-activity, axis=0, kind="stable"), axis=0, kind="stable")
+    active = (rank < speaking[None, :]) & (activity > 0)
+
+    # Only the frames inside the recording
+    last = min(total, int(np.ceil(segmentation.duration / segmentation.frame_step)))
+    active = active[:, :last]
+    centre = segmentation.frame_duration / 2
+    turns = []
+    for k in range(num_speakers):
+        edges = np.diff(np.concatenate([[0], active[k].astype(np.int8), [0]]))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            turns.append((
+                round(start * segmentation.frame_step + centre, 3),
+                round(min(segmentation.duration, (end - 1) * segmentation.frame_step + centre + segmentation.frame_step), 3),
+                k
+            ))
+    turns.sort()
+    # SPEAKER_00 is whoever speaks first
+    names: Dict[int, str] = {}
+    for _, _, k in turns:
+        names.setdefault(k, f"SPEAKER_{len(names):02d}")
+    return pd.DataFrame(
+        [{"start": s, "end": e, "speaker": names[k]} for s, e, k in turns],
+        columns=["start", "end", "speaker"]
+    )
+
+
+class OnnxDiarizer:
+    """
+    pyannote 3.1-style diarization with both networks on ONNX Runtime (CPU): windows are
+    segmented and embedded in batches of DIARIZE_BATCH_SIZE, clustering and reconstruction
+    are vectorized NumPy/SciPy. Models are exported on first use (HF_TOKEN) and stay loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segmentation = None
+        self._embedding = None
+        self._meta: Dict[str, Any] = {}
+
+    def _load(self, threads: int):
+        with self._lock:
+            if self._segmentation is not None:
+                return
+            import onnxruntime as ort
+            seg_path, emb_path, meta_path = onnx_model_paths()
+            if not all(os.path.exists(p) for p in (seg_path, emb_path, meta_path)):
+                logger.info("Exporting diarization models to ONNX")
+                export_diarization_models()
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = max(1, threads)
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            with open(meta_path, encoding="utf-8") as f:
+                self._meta = json.load(f)
+            self._segmentation = ort.InferenceSession(seg_path, options, providers=["CPUExecutionProvider"])
+            self._embedding = ort.InferenceSession(emb_path, options, providers=["CPUExecutionProvider"])
+
+    def _chunks(self, audio: np.ndarray) -> Tuple[np.ndarray, int]:
+        """Overlapping windows over the recording (the last one zero-padded) and the step in samples."""
+        size = self._meta["chunk_samples"]
+        step = int(size * CHUNK_STEP_RATIO)
+        count = 1 + max(0, int(np.ceil((len(audio) - size) / step)))
+        padded = np.zeros((count - 1) * step + size, dtype=np.float32)
+        padded[:len(audio)] = audio
+        return np.lib.stride_tricks.sliding_window_view(padded, size)[::step], step
+
+    def segment(self, audio: np.ndarray, batch_size: int) -> Segmentation:
+        chunks, step = self._chunks(audio)
+        mapping = np.array(self._meta["powerset"], dtype=np.uint8)
+        masks = np.empty((len(chunks), self._meta["num_frames"], mapping.shape[1]), dtype=np.uint8)
+        for i in range(0, len(chunks), batch_size):
+            batch = np.ascontiguousarray(chunks[i:i + batch_size])[:, None, :]
+            (scores,) = self._segmentation.run(["scores"], {"waveforms": batch})
+            # Powerset: the most likely set of active local speakers per frame
+            masks[i:i + len(batch)] = mapping[np.argmax(scores, axis=-1)]
+        return Segmentation(
+            masks, step / SAMPLE_RATE, self._meta["frame_step"], self._meta["frame_duration"], len(audio) / SAMPLE_RATE
+        )
+
+    def embed(self, audio: np.ndarray, segmentation: Segmentation, batch_size: int) -> Embeddings:
+        import torch
+        import torchaudio.compliance.kaldi as kaldi
+
+        chunks, _ = self._chunks(audio)
+        masks = segmentation.masks
+        num_frames = masks.shape[1]
+        overlap = masks.sum(axis=2) > 1
+        pairs = np.argwhere(masks.any(axis=1)) # (chunk, local speaker) with any activity
+        clean_masks = masks[pairs[:, 0], :, pairs[:, 1]] & ~overlap[pairs[:, 0]]
+        clean_frames = clean_masks.sum(axis=1)
+        clean = clean_frames >= MIN_ACTIVE_RATIO * num_frames
+        # Weight by clean speech when there is enough of it, as pyannote's exclude_overlap
+        weights = np.where(
+            (clean_frames > 0)[:, None], clean_masks, masks[pairs[:, 0], :, pairs[:, 1]]
+        ).astype(np.float32)
+
+        vectors: List[np.ndarray] = []
+        fbank_cache: Dict[int, np.ndarray] = {}
+        for i in range(0, len(pairs), batch_size):
+            batch = pairs[i:i + batch_size]
+            features = []
+            for c in batch[:, 0]:
+                if c not in fbank_cache:
+                    # Same front end as pyannote's WeSpeaker model (kaldi fbank, mean-normalized);
+                    # computed once per window, shared by its local speakers
+                    waveform = torch.from_numpy(np.ascontiguousarray(chunks[c]) * 32768.0)[None]
+                    fbank = kaldi.fbank(
+                        waveform, num_mel_bins=80, frame_length=25, frame_shift=10, dither=0.0,
+                        sample_frequency=SAMPLE_RATE, window_type="hamming", use_energy=False
+                    ).numpy()
+                    fbank_cache = {c: fbank - fbank.mean(axis=0, keepdims=True)}
+                features.append(fbank_cache[c])
+            (out,) = self._embedding.run(
+                ["embeddings"], {"fbank": np.stack(features).astype(np.float32), "weights": weights[i:i + len(batch)]}
+            )
+            vectors.append(out)
+        dim = vectors[0].shape[1] if vectors else 0
+        return Embeddings(
+            pairs.astype(np.int32),
+            np.concatenate(vectors) if vectors else np.zeros((0, dim), dtype=np.float32),
+            clean
+        )
+
+    def extract(self, audio: np.ndarray, threads: int = 4) -> "DiarizationFeatures":
+        """The expensive part: both networks over the whole recording. Blocks; call it through asyncio.to_thread."""
+        self._load(threads)
+        audio = np.asarray(audio, dtype=np.float32)
+        segmentation = self.segment(audio, settings.DIARIZE_BATCH_SIZE)
+        return DiarizationFeatures(segmentation, self.embed(audio, segmentation, settings.DIARIZE_BATCH_SIZE))
+
+    def __call__(
+        self,
+        audio: np.ndarray,
+        num_speakers: Optional[int] = None,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+        threads: int = 4
+    ) -> pd.DataFrame:
+        """Drop-in for whisperx.diarize.DiarizationPipeline. Blocks; call it through asyncio.to_thread."""
+        return diarize_features(self.extract(audio, threads), num_speakers, min_speakers, max_speakers)
+
+
+class DiarizationFeatures:
+    """
+    Segmentation and speaker embeddings of a recording: everything clustering needs.
+    Stored (encrypted) as the "embeddings" checkpoint so a re-diarization with other
+    speaker limits only re-clusters.
+    """
+
+    def __init__(self, segmentation: Segmentation, embeddings: Embeddings):
+        self.segmentation = segmentation
+        self.embeddings = embeddings
+
+    def to_bytes(self) -> bytes:
+        seg, emb = self.segmentation, self.embeddings
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            version=np.array(EXPORT_VERSION),
+            timing=np.array([seg.chunk_step, seg.frame_step, seg.frame_duration, seg.duration], dtype=np.float64),
+            masks=seg.masks,
+            pairs=emb.pairs,
+            vectors=emb.vectors.astype(np.float32),
+            clean=emb.clean
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional["DiarizationFeatures"]:
+        """None if the data comes from other model exports."""
+        with np.load(io.BytesIO(data)) as arrays:
+            if str(arrays["version"]) != EXPORT_VERSION:
+                return None
+            chunk_step, frame_step, frame_duration, duration = arrays["timing"].tolist()
+            return cls(
+                Segmentation(arrays["masks"], chunk_step, frame_step, frame_duration, duration),
+                Embeddings(arrays["pairs"], arrays["vectors"], arrays["clean"])
+            )
+
+
+def diarize_features(
+    features: DiarizationFeatures,
+    num_speakers: Optional[int] = None,
+    min_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None
+) -> pd.DataFrame:
+    """Speaker turns from extracted features: clustering and reconstruction only (seconds)."""
+    segmentation = features.segmentation
+    labels = cluster_embeddings(
+        features.embeddings, *segmentation.masks.shape[::2], num_speakers, min_speakers, max_speakers
+    )
+    return reconstruct(segmentation, labels)
+
+
+def speaker_centroids(features: DiarizationFeatures, turns: List[Dict[str, Any]], min_embeddings: int = 1) -> Dict[str, np.ndarray]:
+    """
+    Normalized mean clean embedding of every speaker in `turns` (start, end, speaker, on
+    the features' time base): diarization turns, or transcript segments after renames.
+    An embedding belongs to the speaker whose turns hold most of its active frames;
+    speakers with fewer than `min_embeddings` embeddings are left out.
+    """
+    segmentation, embeddings = features.segmentation, features.embeddings
+    turns = sorted((t for t in turns if t.get("speaker")), key=lambda t: t["start"])
+    if not turns or len(embeddings.vectors) == 0:
+        return {}
+    names = sorted({t["speaker"] for t in turns})
+    starts = np.array([t["start"] for t in turns])
+    ends = np.array([t["end"] for t in turns])
+    owners = np.array([names.index(t["speaker"]) for t in turns])
+
+    used = np.flatnonzero(embeddings.clean)
+    if len(used) == 0:
+        used = np.arange(len(embeddings.vectors))
+    pairs = embeddings.pairs[used]
+    active = segmentation.masks[pairs[:, 0], :, pairs[:, 1]]
+    rows, frames = np.nonzero(active)
+    times = pairs[rows, 0] * segmentation.chunk_step + frames * segmentation.frame_step + segmentation.frame_duration / 2
+    turn = np.searchsorted(starts, times, side="right") - 1
+    inside = (turn >= 0) & (times < ends[np.maximum(turn, 0)])
+    votes = np.zeros((len(used), len(names)), dtype=np.int32)
+    np.add.at(votes, (rows[inside], owners[turn[inside]]), 1)
+    best = np.argmax(votes, axis=1)
+    # Most of the embedding's speech has to fall in that speaker's turns
+    agreed = votes[np.arange(len(used)), best] * 2 > active.sum(axis=1)
+
+    x = _normalize(embeddings.vectors[used].astype(np.float32))
+    centroids = {}
+    for i, name in enumerate(names):
+        members = agreed & (best == i)
+        if members.sum() >= max(1, min_embeddings):
+            centroids[name] = _normalize(x[members].mean(axis=0, keepdims=True))[0]
+    return centroids
+
+
+onnx_diarizer = OnnxDiarizer()
@@ -0,0 +1,138 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.core.crypto import generate_key
+from app.services.vad import SAMPLE_RATE, StreamingVAD
+from app.services.audio_spool import AudioSpool, spool_path_for, store_spool
+from app.services.asr_models import asr_models
+
+logger = logging.getLogger(__name__)
+
+
+class LiveSession:
+    """
+    One live transcription stream. PCM chunks go through a rolling VAD; the utterance in
+    progress gets an interim hypothesis every LIVE_INTERIM_SECONDS of new audio and a
+    final one when the VAD closes it. All ASR runs on the warm LIVE_ASR_MODEL.
+
+    Audio is spooled as it is received (`receive`), independently of ASR, so the full
+    job gets the whole stream even when live transcription lags or fails.
+    """
+
+    def __init__(self, upload_dir: str, language: Optional[str] = None):
+        self.language = language
+        self.file_key = generate_key()
+        self.filename = f"{datetime.utcnow().timestamp()}_live.wav"
+        self.file_path = os.path.join(upload_dir, self.filename + ".enc")
+        self.spool = AudioSpool(spool_path_for(self.file_path), self.file_key)
+        self._carry = b"" # Odd trailing byte of the last frame
+        self.vad = StreamingVAD(
+            end_silence_ms=settings.LIVE_END_SILENCE_MS,
+            max_utterance_s=settings.LIVE_MAX_UTTERANCE_SECONDS
+        )
+        self.segments: List[Dict[str, Any]] = []
+        # Rolling buffer of the audio not yet finalized; buffer[0] is absolute sample `offset`
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0
+        self._last_interim = 0
+        self._model = None
+
+    async def warm_up(self):
+        self._model = await asyncio.to_thread(asr_models.get, settings.LIVE_ASR_MODEL, self.language)
+
+    def _slice(self, start: int, end: int) -> np.ndarray:
+        return self._buffer[max(0, start - self._offset):max(0, end - self._offset)]
+
+    def _trim(self, keep_from: int):
+        drop = keep_from - self._offset
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._offset = keep_from
+
+    async def _transcribe(self, audio: np.ndarray) -> str:
+        if len(audio) < SAMPLE_RATE // 4:
+            return ""
+        try:
+            result = await asyncio.to_thread(self._model.transcribe, audio, batch_size=1, language=self.language)
+        except Exception as e:
+            # Only this utterance is lost from the live view; the full job transcribes it again
+            logger.warning(f"Live ASR failed on {len(audio) / SAMPLE_RATE:.1f}s of audio: {e}")
+            return ""
+        if not self.language and result.get("language"):
+            self.language = result["language"]
+        return " ".join(seg["text"].strip() for seg in result.get("segments", [])).strip()
+
+    async def _final(self, start: int, end: int) -> Optional[Dict[str, Any]]:
+        text = await self._transcribe(self._slice(start, end))
+        self._trim(end)
+        self._last_interim = 0
+        if not text:
+            return None
+        segment = {"start": round(start / SAMPLE_RATE, 2), "end": round(end / SAMPLE_RATE, 2), "text": text}
+        self.segments.append(segment)
+        return {"type": "final", **segment}
+
+    def receive(self, data: bytes) -> bytes:
+        """Spools s16le 16 kHz mono PCM as it arrives; returns it cut to whole samples, for `feed`."""
+        data = self._carry + data
+        cut = len(data) - len(data) % 2
+        self._carry = data[cut:]
+        if cut:
+            self.spool.append(data[:cut])
+        return data[:cut]
+
+    async def feed(self, pcm: bytes) -> List[Dict[str, Any]]:
+        """Runs received PCM through VAD and ASR and returns the messages to push to the client."""
+        if not pcm:
+            return []
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        self._buffer = np.concatenate([self._buffer, audio])
+
+        events = []
+        for start, end in self.vad.feed(audio):
+            final = await self._final(start, end)
+            if final:
+                events.append(final)
+
+        active = self.vad.active_start
+        if active is None:
+            # Nothing being said: keep only a little pre-roll
+            self._trim(max(self._offset, self.vad.position - self.vad.pre_roll))
+        elif self.vad.position - max(active, self._last_interim) >= settings.LIVE_INTERIM_SECONDS * SAMPLE_RATE:
+            self._last_interim = self.vad.position
+            text = await self._transcribe(self._slice(active, self.vad.position))
+            if text:
+                events.append({
+                    "type": "interim",
+                    "start": round(active / SAMPLE_RATE, 2),
+                    "end": round(self.vad.position / SAMPLE_RATE, 2),
+                    "text": text
+                })
+        return events
+
+    async def finish(self) -> List[Dict[str, Any]]:
+        """Finalizes the utterance in progress."""
+        events = []
+        for start, end in self.vad.flush():
+            final = await self._final(start, end)
+            if final:
+                events.append(final)
+        return events
+
+    @property
+    def duration(self) -> float:
+        return self.spool.samples / SAMPLE_RATE
+
+    def store_recording(self) -> int:
+        """Writes the whole stream as a regular encrypted job upload; returns its size."""
+        self.spool.close()
+        return store_spool(self.spool.path, self.file_path, self.file_key)
+
+    def discard_spool(self):
+        self.spool.close()
+        if os.path.exists(self.spool.path):
+            os.remove(self.spool.path)
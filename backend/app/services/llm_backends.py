@@ -0,0 +1,296 @@
+import abc
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import aiohttp
+from typing import Optional, Dict, Any, List, Set, Tuple
+from app.core.config import settings
+from app.services.token_budget import parse_ollama_metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds an endpoint is skipped after a connection error or timeout
+UNHEALTHY_COOLDOWN = 30.0
+
+# Request priorities (lower goes first when the backends are saturated)
+PRIORITY_DRAFT = 0
+PRIORITY_NORMAL = 5
+PRIORITY_REFINE = 10
+
+
+class LLMBackendError(Exception):
+    """A backend could not produce a response. `unreachable` marks connection errors and timeouts."""
+
+    def __init__(self, message: str, unreachable: bool = False):
+        super().__init__(message)
+        self.unreachable = unreachable
+
+
+class LLMBackend(abc.ABC):
+    """
+    One inference endpoint. Drivers implement `_generate`, returning the response text
+    and metrics in the same shape as token_budget.parse_ollama_metrics.
+    """
+    kind = "base"
+
+    def __init__(self, url: str, model_override: Optional[str] = None):
+        self.url = url.rstrip("/")
+        self.model_override = model_override
+        self.in_flight = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.url}"
+
+    def is_healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def model_for(self, model: str) -> str:
+        """The model actually requested from this endpoint for `model`."""
+        return self.model_override or model
+
+    async def generate(self, model: str, system: str, prompt: str, options: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        self.in_flight += 1
+        try:
+            return await self._generate(self.model_for(model), system, prompt, options)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            self.unhealthy_until = time.monotonic() + UNHEALTHY_COOLDOWN
+            raise LLMBackendError(f"{self.name} unreachable: {type(e).__name__} {e}", unreachable=True)
+        finally:
+            self.in_flight -= 1
+
+    @abc.abstractmethod
+    async def _generate(self, model: str, system: str, prompt: str, options: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        ...
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama's native /api/generate. Honours num_ctx and keep_alive."""
+    kind = "ollama"
+
+    async def _generate(self, model, system, prompt, options):
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "system": system,
+            "stream": False,
+            "keep_alive": options["keep_alive"],
+            "options": {
+                "num_ctx": options["num_ctx"],
+                "num_predict": options["num_predict"]
+            }
+        }
+        timeout = aiohttp.ClientTimeout(total=settings.OLLAMA_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.post(f"{self.url}/api/generate", json=payload) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise LLMBackendError(f"Model {model} failed on {self.name} ({resp.status}): {error_text}")
+                data = await resp.json()
+                return data.get("response", "No response from AI."), parse_ollama_metrics(data)
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Any server exposing /v1/chat/completions (llama.cpp server, vLLM, LM Studio).
+    Context size is fixed when those servers start, so num_ctx/keep_alive are not sent.
+    """
+    kind = "openai"
+
+    def __init__(self, url: str, model_override: Optional[str] = None):
+        super().__init__(url, model_override)
+        if not self.url.endswith("/v1"):
+            self.url = f"{self.url}/v1"
+
+    async def _generate(self, model, system, prompt, options):
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": options["num_predict"],
+            "stream": False
+        }
+        timeout = aiohttp.ClientTimeout(total=settings.OLLAMA_TIMEOUT)
+        started = time.perf_counter()
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.post(f"{self.url}/chat/completions", json=payload) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise LLMBackendError(f"Model {model} failed on {self.name} ({resp.status}): {error_text}")
+                data = await resp.json()
+        elapsed = time.perf_counter() - started
+
+        choices = data.get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content") or "No response from AI."
+        return text, self._metrics(data, elapsed)
+
+    @staticmethod
+    def _metrics(data: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+        usage = data.get("usage") or {}
+        # llama.cpp server reports its own timings; other servers only report usage
+        timings = data.get("timings") or {}
+        prompt_ms = timings.get("prompt_ms")
+        predicted_ms = timings.get("predicted_ms")
+        return {
+            "prompt_eval_count": timings.get("prompt_n", usage.get("prompt_tokens")),
+            "eval_count": timings.get("predicted_n", usage.get("completion_tokens")),
+            "prompt_eval_duration": round(prompt_ms / 1000, 3) if prompt_ms is not None else None,
+            "eval_duration": round(predicted_ms / 1000, 3) if predicted_ms is not None else None,
+            "load_duration": None,
+            "total_duration": round(elapsed, 3),
+            "prefill_tokens_per_sec": round(timings["prompt_per_second"], 2) if timings.get("prompt_per_second") else None,
+            "tokens_per_sec": round(timings["predicted_per_second"], 2) if timings.get("predicted_per_second") else None,
+        }
+
+
+class PriorityGate:
+    """
+    Limits concurrent LLM requests. When all slots are taken, waiters are woken
+    by priority (lowest value first), then in arrival order.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before we were cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        # Hand the slot directly to the next live waiter, otherwise free it
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+
+BACKEND_DRIVERS = {
+    OllamaBackend.kind: OllamaBackend,
+    OpenAICompatibleBackend.kind: OpenAICompatibleBackend,
+}
+
+
+class BackendPool:
+    """
+    Spreads requests over several endpoints: the healthy endpoint with the fewest
+    requests in flight is tried first, the others are tried in turn if it fails.
+    """
+
+    def __init__(self, backends: List[LLMBackend], max_concurrent: Optional[int] = None):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+        self.gate = PriorityGate(max_concurrent or len(backends))
+        self._next = 0
+
+    def _ordered(self) -> List[LLMBackend]:
+        # Rotate the starting point so ties are broken round-robin
+        start = self._next % len(self.backends)
+        self._next += 1
+        rotated = self.backends[start:] + self.backends[:start]
+        healthy = [b for b in rotated if b.is_healthy()]
+        unhealthy = [b for b in rotated if not b.is_healthy()]
+        return sorted(healthy, key=lambda b: b.in_flight) + unhealthy
+
+    async def generate(
+        self,
+        model: str,
+        system: str,
+        prompt: str,
+        options: Dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        attempted: Optional[Set[Tuple[str, str]]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Returns (text, metrics) with metrics["backend"] set; raises LLMBackendError if every
+        endpoint failed. `attempted` collects the (endpoint, model) pairs tried, across calls:
+        a fallback model that an endpoint's "#model" override maps to a model already tried
+        there is not sent again.
+        """
+        if attempted is None:
+            attempted = set()
+        await self.gate.acquire(priority)
+        try:
+            errors = []
+            for backend in self._ordered():
+                pair = (backend.name, backend.model_for(model))
+                if pair in attempted:
+                    continue
+                attempted.add(pair)
+                try:
+                    text, metrics = await backend.generate(model, system, prompt, options)
+                    metrics["backend"] = backend.name
+                    return text, metrics
+                except LLMBackendError as e:
+                    logger.warning(str(e))
+                    errors.append(str(e))
+            raise LLMBackendError("; ".join(errors) or f"Every endpoint already failed with {model}")
+        finally:
+            self.gate.release()
+
+
+def parse_backends(spec: Optional[str]) -> List[LLMBackend]:
+    """
+    Parses LLM_BACKENDS, e.g. "ollama=http://gpu1:11434,openai=http://box2:8080/v1#qwen2.5-32b-instruct".
+    The optional "#model" suffix replaces the requested model name on that endpoint (the
+    primary and the fallback model alike, so the fallback is not retried there).
+    Falls back to a single Ollama backend at OLLAMA_URL.
+    """
+    if not spec:
+        return [OllamaBackend(settings.OLLAMA_URL)]
+
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, url = entry.partition("=")
+        if not url:
+            kind, url = "ollama", kind
+        url, _, model_override = url.partition("#")
+        driver = BACKEND_DRIVERS.get(kind.strip().lower())
+        if driver is None:
+            raise ValueError(f"Unknown LLM backend '{kind}'. Supported: {', '.join(BACKEND_DRIVERS)}")
+        backends.append(driver(url.strip(), model_override.strip() or None))
+    return backends
+
+
+_pool: Optional[BackendPool] = None
+
+
+def get_backend_pool() -> BackendPool:
+    global _pool
+    if _pool is None:
+        _pool = BackendPool(parse_backends(settings.LLM_BACKENDS), settings.LLM_MAX_CONCURRENT or None)
+        logger.info(f"LLM backends: {', '.join(b.name for b in _pool.backends)}")
+    return _pool
+
+
+def reset_backend_pool():
+    """Rebuild the pool from settings on next use (tests, benchmarks, config reload)."""
+    global _pool
+    _pool = None
@@ -0,0 +1,109 @@
+import os
+import json
+import logging
+import tempfile
+from types import SimpleNamespace
+from typing import Any, Dict, Tuple
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump when the export changes so cached models are rebuilt
+EXPORT_VERSION = "1"
+
+
+def onnx_model_dir() -> str:
+    return os.path.join(settings.TRANSCRIPT_STORAGE_PATH, "onnx", "align")
+
+
+def onnx_model_paths(language: str) -> Tuple[str, str]:
+    """(quantized model, metadata JSON) of a language's cached alignment model."""
+    base = os.path.join(onnx_model_dir(), f"wav2vec2-{language}-v{EXPORT_VERSION}")
+    return base + ".int8.onnx", base + ".json"
+
+
+def export_align_model(language: str) -> str:
+    """
+    Exports the language's WhisperX alignment model (torchaudio or Hugging Face wav2vec2)
+    to ONNX, quantizes the weights to int8 and caches it with the CTC dictionary.
+    Writes are atomic, so concurrent workers exporting the same language are harmless.
+    """
+    import torch
+    import whisperx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_path, meta_path = onnx_model_paths(language)
+    model_a, metadata = whisperx.load_align_model(language_code=language, device="cpu")
+    if model_a is None:
+        raise ValueError(f"No alignment model for language '{language}'")
+
+    class Emissions(torch.nn.Module):
+        """Waveform -> CTC emissions, whatever the wrapped model returns."""
+
+        def __init__(self, model, model_type: str):
+            super().__init__()
+            self.model = model
+            self.model_type = model_type
+
+        def forward(self, waveform):
+            if self.model_type == "torchaudio":
+                return self.model(waveform)[0]
+            return self.model(waveform).logits
+
+    os.makedirs(onnx_model_dir(), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=onnx_model_dir()) as tmp:
+        fp32_path = os.path.join(tmp, "model.onnx")
+        int8_path = os.path.join(tmp, "model.int8.onnx")
+        logger.info(f"Exporting {language} alignment model to ONNX")
+        with torch.inference_mode():
+            torch.onnx.export(
+                Emissions(model_a.eval(), metadata["type"]),
+                torch.zeros(1, 16000),
+                fp32_path,
+                input_names=["waveform"],
+                output_names=["emissions"],
+                dynamic_axes={"waveform": {0: "batch", 1: "samples"}, "emissions": {0: "batch", 1: "frames"}},
+                opset_version=17
+            )
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        os.replace(int8_path, model_path)
+
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"language": metadata["language"], "dictionary": metadata["dictionary"]}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return model_path
+
+
+class OnnxAlignModel:
+    """
+    The quantized alignment model on ONNX Runtime, callable the way whisperx.align calls
+    a Hugging Face model (waveform tensor in, object with `.logits` out).
+    """
+
+    def __init__(self, path: str, threads: int):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        # Windows run one after another in this process; parallelism comes from ALIGN_WORKERS
+        options.intra_op_num_threads = max(1, threads)
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, waveform) -> SimpleNamespace:
+        import torch
+        inputs = waveform.detach().cpu().numpy().astype(np.float32)
+        (emissions,) = self.session.run(["emissions"], {"waveform": inputs})
+        return SimpleNamespace(logits=torch.from_numpy(emissions))
+
+
+def load_onnx_align_model(language: str, threads: int) -> Tuple[OnnxAlignModel, Dict[str, Any]]:
+    """(model, metadata) for whisperx.align, exporting the language on first use."""
+    model_path, meta_path = onnx_model_paths(language)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        export_align_model(language)
+    with open(meta_path, encoding="utf-8") as f:
+        metadata = json.load(f)
+    metadata["type"] = "huggingface"
+    return OnnxAlignModel(model_path, threads), metadata
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import itertools
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds between memory checks while a stage waits for RAM
+MEMORY_POLL_INTERVAL = 2.0
+
+# Dispatch order: uploads first, background work (two-pass ASR refinement) when nothing else waits
+PRIORITY_FOREGROUND = 0
+PRIORITY_BACKGROUND = 10
+
+
+class PipelineFull(Exception):
+    """Raised by JobPipeline.submit when PIPELINE_MAX_QUEUED jobs are already waiting."""
+
+
+def read_meminfo() -> Dict[str, float]:
+    """MemTotal / MemAvailable from /proc/meminfo in GB (empty off Linux)."""
+    values = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("MemTotal", "MemAvailable"):
+                    values[key] = int(rest.split()[0]) / 1024 / 1024 # kB -> GB
+    except OSError:
+        pass
+    return values
+
+
+class StagePool:
+    """Worker slots for one stage type (asr, align, diarize...) shared by all jobs."""
+
+    def __init__(self, name: str, workers: int, memory_gb: float):
+        self.name = name
+        self.workers = max(1, workers)
+        self.memory_gb = memory_gb
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+
+
+class JobPipeline:
+    """
+    Cross-job pipelined executor. Up to PIPELINE_MAX_JOBS jobs are in flight at once and
+    every heavy stage takes a slot from its own pool, so job B can be in ASR while job A
+    aligns and job C diarizes. Stages also wait until their estimated memory fits
+    (committed estimates and /proc/meminfo MemAvailable), unless nothing else is running.
+    Jobs beyond the admission limit wait in a queue; past PIPELINE_MAX_QUEUED, submit()
+    refuses new work so the API can push back on uploads. Background submissions run
+    the background processor and are only dispatched when no foreground job is waiting.
+    """
+
+    def __init__(self):
+        self.pools: Dict[str, StagePool] = {
+            "decode": StagePool("decode", settings.PIPELINE_DECODE_WORKERS, 1.0),
+            "asr": StagePool("asr", settings.PIPELINE_ASR_WORKERS, settings.PIPELINE_ASR_MEMORY_GB),
+            "align": StagePool("align", settings.PIPELINE_ALIGN_WORKERS, settings.PIPELINE_ALIGN_MEMORY_GB),
+            "diarize": StagePool("diarize", settings.PIPELINE_DIARIZE_WORKERS, settings.PIPELINE_DIARIZE_MEMORY_GB),
+        }
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        # (job_id, background) keys
+        self.queued: Set[Tuple[str, bool]] = set()
+        self.active: Set[Tuple[str, bool]] = set()
+        self._order = itertools.count()
+        self._tasks: Set[asyncio.Task] = set()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._processor: Optional[Callable[[str], Awaitable[None]]] = None
+        self._background_processor: Optional[Callable[[str], Awaitable[None]]] = None
+        self._memory_changed: Optional[asyncio.Event] = None
+        self._committed_gb = 0.0
+
+    def start(
+        self,
+        processor: Callable[[str], Awaitable[None]],
+        background_processor: Optional[Callable[[str], Awaitable[None]]] = None
+    ):
+        """
+        Starts dispatching queued jobs to `processor` (TranscriptionService.process_job)
+        and background submissions to `background_processor` (TranscriptionService.refine_job).
+        """
+        self._processor = processor
+        self._background_processor = background_processor
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        tasks = list(self._tasks) + ([self._dispatcher] if self._dispatcher else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    def _waiting(self, background: bool) -> int:
+        return sum(1 for _, is_background in self.queued if is_background == background)
+
+    def is_full(self) -> bool:
+        return bool(settings.PIPELINE_MAX_QUEUED) and self._waiting(False) >= settings.PIPELINE_MAX_QUEUED
+
+    def submit(self, job_id: str, force: bool = False, background: bool = False):
+        """
+        Queues a job for processing. `force` bypasses PIPELINE_MAX_QUEUED (startup recovery).
+        `background` queues it for the background processor at low priority.
+        """
+        key = (job_id, background)
+        if key in self.queued or key in self.active:
+            return
+        if not force and not background and self.is_full():
+            raise PipelineFull(f"{self._waiting(False)} jobs already waiting")
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+        self.queued.add(key)
+        priority = PRIORITY_BACKGROUND if background else PRIORITY_FOREGROUND
+        self.queue.put_nowait((priority, next(self._order), job_id, background))
+
+    async def _dispatch(self):
+        admission = asyncio.Semaphore(max(1, settings.PIPELINE_MAX_JOBS))
+        while True:
+            await admission.acquire()
+            # Take the job only once a slot is free, so a later upload still overtakes background work
+            _, _, job_id, background = await self.queue.get()
+            key = (job_id, background)
+            self.queued.discard(key)
+            self.active.add(key)
+            task = asyncio.create_task(self._run(key, admission))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Tuple[str, bool], admission: asyncio.Semaphore):
+        job_id, background = key
+        processor = self._background_processor if background else self._processor
+        try:
+            if processor is not None:
+                await processor(job_id)
+        except Exception as e:
+            # The processors record their own failures; this only guards the dispatcher
+            logger.exception(f"Pipeline job {job_id} crashed: {e}")
+        finally:
+            self.active.discard(key)
+            admission.release()
+
+    def _memory_fits(self, need_gb: float) -> bool:
+        if not any(pool.running for pool in self.pools.values()):
+            # Never block when idle, even if the estimate exceeds the machine
+            return True
+        meminfo = read_meminfo()
+        reserve = settings.PIPELINE_MEMORY_RESERVE_GB
+        budget = settings.PIPELINE_MEMORY_GB or (meminfo.get("MemTotal", 0) - reserve)
+        if budget > 0 and self._committed_gb + need_gb > budget:
+            return False
+        available = meminfo.get("MemAvailable")
+        return available is None or available - reserve >= need_gb
+
+    async def _wait_for_memory(self, pool: StagePool):
+        if self._memory_changed is None:
+            self._memory_changed = asyncio.Event()
+        while not self._memory_fits(pool.memory_gb):
+            self._memory_changed.clear()
+            try:
+                await asyncio.wait_for(self._memory_changed.wait(), MEMORY_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def slot(self, stage: str):
+        """Holds a worker slot (and the memory estimate) of `stage` for the duration of the block."""
+        pool = self.pools.get(stage)
+        if pool is None:
+            yield
+            return
+        pool.waiting += 1
+        try:
+            await pool.semaphore.acquire()
+        finally:
+            pool.waiting -= 1
+        try:
+            await self._wait_for_memory(pool)
+            pool.running += 1
+            self._committed_gb += pool.memory_gb
+            try:
+                yield
+            finally:
+                pool.running -= 1
+                pool.completed += 1
+                self._committed_gb -= pool.memory_gb
+                if self._memory_changed is not None:
+                    self._memory_changed.set()
+        finally:
+            pool.semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "queued": self._waiting(False),
+            "active": sum(1 for _, background in self.active if not background),
+            "background_queued": self._waiting(True),
+            "background_active": sum(1 for _, background in self.active if background),
+            "committed_memory_gb": round(self._committed_gb, 1),
+            "stages": {
+                name: {"workers": p.workers, "running": p.running, "waiting": p.waiting, "completed": p.completed}
+                for name, p in self.pools.items()
+            },
+        }
+
+
+job_pipeline = JobPipeline()
@@ -0,0 +1,184 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.services.templates import MeetingTemplate
+
+logger = logging.getLogger(__name__)
+
+STYLE_GUIDE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core", "style_guide.txt")
+
+# Fallback guide if file missing
+DEFAULT_STYLE_GUIDE = "Avoid: weave, delve, tapestry, in conclusion. Be concise."
+
+# Compiled system prompts, LRU-bounded. Keys include a hash of the template
+# content and the style guide version, so a stale entry can never be served.
+MAX_COMPILED_PROMPTS = 256
+_compiled_prompts: "OrderedDict[Tuple[str, str, str, str], str]" = OrderedDict()
+
+# (mtime, text, version) of the last style guide read from disk
+_style_guide: Optional[Tuple[float, str, str]] = None
+
+PROMPT_STRINGS = {
+    "en": {
+        "role": "You are an expert meeting secretary. Your goal is to summarize the provided transcript.",
+        "style_header": "CRITICAL STYLE INSTRUCTIONS (DO NOT IGNORE):",
+        "structure_header": "REQUIRED OUTPUT STRUCTURE:",
+        "no_fluff": "Do not use phrases like 'In this meeting', 'The speakers discussed'. Just state the facts.",
+        "metadata_header": "MANDATORY METADATA FROM USER:",
+        "date": "USER PROVIDED DATE: {value} (You MUST use this date in the summary header, ignoring any date in the transcript)",
+        "participants": "USER PROVIDED PARTICIPANTS: {value} (You MUST use these participants, ignoring transcript speakers if they differ)",
+        "notes": "USER NOTES: {value} (Include this information)",
+        "transcript_header": "TRANSCRIPT:",
+        "instruction": "INSTRUCTION: Summarize the above transcript following the structure and style guide strictly.",
+        "notes_header": "NOTES EXTRACTED FROM THE TRANSCRIPT (in chronological order):",
+        "notes_instruction": "INSTRUCTION: Summarize the meeting described by the notes above following the structure and style guide strictly.",
+        "chunk_header": "TRANSCRIPT EXCERPT:",
+        "chunk_instruction": "INSTRUCTION: Extract the notes for this excerpt.",
+        "notes_role": (
+            "You are an expert meeting secretary. You receive one excerpt of a longer meeting transcript. "
+            "Write factual notes covering everything a final summary may need: decisions, action items with owner "
+            "and deadline, open questions, key discussion points, figures, dates and names. "
+            "Use short bullet points, keep the speaker labels exactly as written (such as [[S1]]), and do not add anything not said in the excerpt."
+        ),
+    },
+    "es": {
+        "role": "Eres un experto secretario de actas. Tu objetivo es resumir la transcripción proporcionada.",
+        "style_header": "INSTRUCCIONES DE ESTILO CRÍTICAS (NO IGNORAR):",
+        "structure_header": "ESTRUCTURA DE SALIDA REQUERIDA:",
+        "no_fluff": "No uses frases como 'En esta reunión', 'Los oradores discutieron'. Solo expón los hechos.",
+        "metadata_header": "MANDATORY METADATA FROM USER:",
+        "date": "USER PROVIDED DATE: {value} (You MUST use this date in the summary header, ignoring any date in the transcript)",
+        "participants": "USER PROVIDED PARTICIPANTS: {value} (You MUST use these participants, ignoring transcript speakers if they differ)",
+        "notes": "USER NOTES: {value} (Include this information)",
+        "transcript_header": "TRANSCRIPCIÓN:",
+        "instruction": "INSTRUCCIÓN: Resume la transcripción anterior siguiendo estrictamente la estructura y la guía de estilo.",
+        "notes_header": "NOTAS EXTRAÍDAS DE LA TRANSCRIPCIÓN (en orden cronológico):",
+        "notes_instruction": "INSTRUCCIÓN: Resume la reunión descrita en las notas anteriores siguiendo estrictamente la estructura y la guía de estilo.",
+        "chunk_header": "FRAGMENTO DE TRANSCRIPCIÓN:",
+        "chunk_instruction": "INSTRUCCIÓN: Extrae las notas de este fragmento.",
+        "notes_role": (
+            "Eres un experto secretario de actas. Recibes un fragmento de la transcripción de una reunión más larga. "
+            "Escribe notas factuales con todo lo que un resumen final pueda necesitar: decisiones, tareas con responsable "
+            "y fecha, preguntas abiertas, puntos clave de discusión, cifras, fechas y nombres. "
+            "Usa viñetas breves, conserva las etiquetas de los oradores exactamente como aparecen (como [[S1]]) y no añadas nada que no se haya dicho en el fragmento."
+        ),
+    },
+}
+
+CRITICAL_METADATA_INSTRUCTION = (
+    "CRITICAL INSTRUCTION: If 'USER PROVIDED DATE' or 'USER PROVIDED PARTICIPANTS' are present in the "
+    "MANDATORY METADATA FROM USER block of the request, you MUST use them exactly as written in the output header. "
+    "Do not infer them from the text if user provided them."
+)
+
+
+def _strings(language: str) -> dict:
+    return PROMPT_STRINGS.get(language, PROMPT_STRINGS["en"])
+
+
+def load_style_guide() -> Tuple[str, str]:
+    """
+    Returns (style_guide_text, version). The file is only re-read when its mtime changes.
+    """
+    global _style_guide
+    try:
+        mtime = os.path.getmtime(STYLE_GUIDE_PATH)
+    except OSError:
+        return DEFAULT_STYLE_GUIDE, "default"
+
+    if _style_guide is None or _style_guide[0] != mtime:
+        try:
+            with open(STYLE_GUIDE_PATH, "r", encoding="utf-8") as f:
+                text = f.read()
+        except Exception as e:
+            logger.warning(f"Could not load style guide: {e}")
+            return DEFAULT_STYLE_GUIDE, "default"
+        version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        _style_guide = (mtime, text, version)
+        logger.info(f"Loaded style guide version {version}")
+    return _style_guide[1], _style_guide[2]
+
+
+def _template_fingerprint(template: MeetingTemplate) -> str:
+    content = "\x00".join([template.name, template.system_instruction, template.output_structure])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_system_prompt(template: MeetingTemplate, language: str) -> str:
+    """
+    Builds (or returns the cached) system prompt for a template and language.
+    Contains only static text, so it is byte-identical across requests and Ollama
+    can reuse the KV cache for this prefix. Per-request metadata goes in the user prompt.
+    """
+    style_guide, style_version = load_style_guide()
+    key = (template.name, language, _template_fingerprint(template), style_version)
+
+    cached = _compiled_prompts.get(key)
+    if cached is not None:
+        _compiled_prompts.move_to_end(key)
+        return cached
+
+    s = _strings(language)
+    system_prompt = (
+        f"{s['role']}\n"
+        f"MEETING TYPE: {template.name}\n"
+        f"{template.system_instruction}\n\n"
+        f"{s['style_header']}\n"
+        f"{style_guide}\n\n"
+        f"{s['structure_header']}\n"
+        f"{template.output_structure}\n\n"
+        f"{s['no_fluff']}\n"
+        f"{CRITICAL_METADATA_INSTRUCTION}"
+    )
+
+    _compiled_prompts[key] = system_prompt
+    if len(_compiled_prompts) > MAX_COMPILED_PROMPTS:
+        _compiled_prompts.popitem(last=False)
+    return system_prompt
+
+
+def compile_notes_prompt(language: str) -> str:
+    """System prompt for the per-chunk note extraction (map) step. Independent of the template."""
+    return _strings(language)["notes_role"]
+
+
+def build_user_prompt(
+    transcript_text: str,
+    language: str = "en",
+    source: str = "transcript",
+    context_date: Optional[str] = None,
+    context_participants: Optional[str] = None,
+    context_notes: Optional[str] = None
+) -> str:
+    """
+    Per-request part of the prompt: user metadata followed by the transcript.
+    `source` is "transcript", "notes" (reduce step) or "chunk" (map step).
+    """
+    s = _strings(language)
+    header, instruction = s["transcript_header"], s["instruction"]
+    if source == "notes":
+        header, instruction = s["notes_header"], s["notes_instruction"]
+    elif source == "chunk":
+        header, instruction = s["chunk_header"], s["chunk_instruction"]
+
+    context_lines = []
+    if context_date:
+        context_lines.append(s["date"].format(value=context_date))
+    if context_participants:
+        context_lines.append(s["participants"].format(value=context_participants))
+    if context_notes:
+        context_lines.append(s["notes"].format(value=context_notes))
+
+    metadata = ""
+    if context_lines:
+        metadata = s["metadata_header"] + "\n" + "\n".join(context_lines) + "\n\n"
+
+    return f"{metadata}{header}\n{transcript_text}\n\n{instruction}"
+
+
+def clear_prompt_cache():
+    global _style_guide
+    _compiled_prompts.clear()
+    _style_guide = None
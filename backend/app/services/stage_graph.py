@@ -0,0 +1,78 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StageGraph:
+    """
+    Minimal DAG executor for pipeline stages. Every stage is an async callable that
+    receives its dependencies' results as keyword arguments and starts as soon as
+    they have all finished, so independent branches run concurrently.
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self.stages: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()):
+        deps = tuple(deps)
+        # Dependencies must be added first, which also rules out cycles
+        missing = [d for d in deps if d not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' added twice")
+        self.stages[name] = (fn, deps)
+
+    async def run(self) -> Dict[str, Any]:
+        """Runs every stage and returns {stage: result}. The first failure cancels the rest and is re-raised."""
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            fn, deps = self.stages[name]
+            if deps:
+                await asyncio.gather(*(tasks[d] for d in deps))
+            started = time.perf_counter()
+            results[name] = await fn(**{d: results[d] for d in deps})
+            self.timings[name] = round(time.perf_counter() - started, 3)
+            logger.info(f"{self.name}: stage '{name}' finished in {self.timings[name]}s")
+
+        for name in self.stages:
+            tasks[name] = asyncio.create_task(run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return results
+
+
+def thread_budget(cpu_count: Optional[int] = None) -> Dict[str, int]:
+    """
+    Splits the CPU between the CTranslate2 ASR threads and the torch threads used by
+    alignment and diarization. Up to PIPELINE_MAX_JOBS jobs run at once, so each gets
+    that share of the cores; when diarization runs alongside ASR, ASR gets the larger
+    part (it is the longer branch). The budget is fixed for the process: torch threads
+    are process-global and a warm ASR model keeps the threads it was loaded with.
+    ASR_THREADS / TORCH_THREADS override the automatic split.
+    """
+    cpus = max(1, (cpu_count or os.cpu_count() or 1) // max(1, settings.PIPELINE_MAX_JOBS))
+    if settings.HF_TOKEN and settings.PARALLEL_DIARIZATION:
+        asr_threads = max(1, (cpus * 2) // 3)
+        torch_threads = max(1, cpus - asr_threads)
+    else:
+        asr_threads = cpus
+        torch_threads = cpus
+    return {
+        "asr": settings.ASR_THREADS or asr_threads,
+        "torch": settings.TORCH_THREADS or torch_threads,
+    }
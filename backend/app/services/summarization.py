@@ -1,25 +1,16 @@
 
 import os
-import aiohttp
 import logging
-from typing import Optional
-from app.core.config import settings
+from typing import Optional, Dict, Any, Tuple
+from app.services.token_budget import build_budget, track_request
+from app.services.llm_backends import get_backend_pool, PRIORITY_NORMAL
+from app.services.prompts import load_style_guide, compile_system_prompt, compile_notes_prompt, build_user_prompt
 
 logger = logging.getLogger(__name__)
 
-# Fallback guide if file missing
-DEFAULT_STYLE_GUIDE = "Avoid: weave, delve, tapestry, in conclusion. Be concise."
-
 async def get_style_guide() -> str:
-    try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        guide_path = os.path.join(current_dir, "..", "core", "style_guide.txt")
-        if os.path.exists(guide_path):
-            with open(guide_path, "r", encoding="utf-8") as f:
-                return f.read()
-    except Exception as e:
-        logger.warning(f"Could not load style guide: {e}")
-    return DEFAULT_STYLE_GUIDE
+    style_guide, _ = load_style_guide()
+    return style_guide
 
 from app.services.templates import get_template
 
@@ -33,92 +24,109 @@ async def generate_summary(
     user_id: Optional[str] = None,
     context_date: Optional[str] = None,
     context_participants: Optional[str] = None,
-    context_notes: Optional[str] = None
+    context_notes: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    source: str = "transcript",
+    priority: int = PRIORITY_NORMAL
 ) -> str:
     """
     Generates a summary using Ollama with the "Signs of AI" style guide AND meeting template injected.
+    If `stats` is given it is filled with the token budget and Ollama's timing metrics.
+    `source="notes"` tells the model it is reading extracted notes instead of the raw transcript.
+    `priority` orders queued requests when the LLM backends are busy (see llm_backends).
     """
-    style_guide = await get_style_guide()
+    if stats is None:
+        stats = {}
     template = await get_template(meeting_type, language, user_id)
     
-    ollama_url = settings.OLLAMA_URL
-    
-    # Adjust system prompt based on language
-    role_instruction = "You are an expert meeting secretary. Your goal is to summarize the provided transcript."
-    style_header = "CRITICAL STYLE INSTRUCTIONS (DO NOT IGNORE):"
-    structure_header = "REQUIRED OUTPUT STRUCTURE:"
-    no_fluff_instruction = "Do not use phrases like 'In this meeting', 'The speakers discussed'. Just state the facts."
-    
-    if language == "es":
-        role_instruction = "Eres un experto secretario de actas. Tu objetivo es resumir la transcripción proporcionada."
-        style_header = "INSTRUCCIONES DE ESTILO CRÍTICAS (NO IGNORAR):"
-        structure_header = "ESTRUCTURA DE SALIDA REQUERIDA:"
-        no_fluff_instruction = "No uses frases como 'En esta reunión', 'Los oradores discutieron'. Solo expón los hechos."
+    # Static prefix (cached per template/language/style guide) + per-request user prompt
+    system_prompt = compile_system_prompt(template, language)
+    user_prompt = build_user_prompt(
+        transcript_text,
+        language,
+        source=source,
+        context_date=context_date,
+        context_participants=context_participants,
+        context_notes=context_notes
+    )
 
-    # Build Context String
-    context_str = ""
-    if context_date:
-        context_str += f"USER PROVIDED DATE: {context_date} (You MUST use this date in the summary header, ignoring any date in the transcript)\n"
-    if context_participants:
-        context_str += f"USER PROVIDED PARTICIPANTS: {context_participants} (You MUST use these participants, ignoring transcript speakers if they differ)\n"
-    if context_notes:
-        context_str += f"USER NOTES: {context_notes} (Include this information)\n"
+    response, used_model = await _call_llm(system_prompt, user_prompt, language, model, stats, priority)
+    if response is None:
+        # If we get here, all models failed
+        logger.error(f"All summarization models failed. Last error: {used_model}")
+        return f"Error: Could not generate summary. AI Service unavailable. Details: {used_model}"
 
-    system_prompt = (
-        f"{role_instruction}\n"
-        f"MEETING TYPE: {template.name}\n"
-        f"MANDATORY METADATA FROM USER:\n{context_str}\n"
-        f"{template.system_instruction}\n\n"
-        f"{style_header}\n"
-        f"{style_guide}\n\n"
-        f"{structure_header}\n"
-        f"{template.output_structure}\n\n"
-        f"{no_fluff_instruction}\n"
-        "CRITICAL INSTRUCTION: If 'USER PROVIDED DATE' or 'USER PROVIDED PARTICIPANTS' are present above, you MUST use them exactly as written in the output header. Do not infer them from the text if user provided them."
-    )
-    
-    user_prompt = f"TRANSCRIPT:\n{transcript_text}\n\nINSTRUCTION: Summarize the above transcript following the structure and style guide strictly."
-    if language == "es":
-        user_prompt = f"TRANSCRIPCIÓN:\n{transcript_text}\n\nINSTRUCCIÓN: Resume la transcripción anterior siguiendo estrictamente la estructura y la guía de estilo."
+    # Append Metadata
+    metadata = f"\n\n---\n**Summary Details:**\n- Model: {used_model}\n- Template: {template.name} ({language})"
+    return response + metadata
 
-    # Models to try: first the requested one, then the fallback
-    models_to_try = [model]
-    if model != "llama3.1:latest":
-        models_to_try.append("llama3.1:latest")
+async def generate_notes(
+    transcript_chunk: str,
+    language: str = "en",
+    model: str = OLLAMA_MODEL,
+    stats: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_NORMAL
+) -> Optional[str]:
+    """
+    Map step of long-transcript summarization: extracts template-independent notes
+    from one chunk of the transcript. Returns None if every model failed.
+    """
+    if stats is None:
+        stats = {}
+    system_prompt = compile_notes_prompt(language)
+    user_prompt = build_user_prompt(transcript_chunk, language, source="chunk")
+    response, used_model = await _call_llm(system_prompt, user_prompt, language, model, stats, priority)
+    if response is None:
+        logger.error(f"Note extraction failed. Last error: {used_model}")
+    return response
+
+async def _call_llm(
+    system_prompt: str,
+    user_prompt: str,
+    language: str,
+    model: str,
+    stats: Dict[str, Any],
+    priority: int = PRIORITY_NORMAL
+) -> Tuple[Optional[str], str]:
+    """
+    Sends one prompt to the configured LLM backends, falling back to the secondary model on failure.
+    Returns (response_text, model_used), or (None, last_error) if every model failed.
+    """
+    pool = get_backend_pool()
+
+    async with track_request():
+        # Size the context window to the actual prompt instead of Ollama's default
+        budget = build_budget(system_prompt, user_prompt, language)
+        stats.update(budget)
+
+        # Models to try: first the requested one, then the fallback
+        models_to_try = [model]
+        if model != "llama3.1:latest":
+            models_to_try.append("llama3.1:latest")
         
-    last_error = None
-    
-    for current_model in models_to_try:
-        try:
-            logger.info(f"Generating summary with model: {current_model}")
-            payload = {
-                "model": current_model,
-                "prompt": user_prompt,
-                "system": system_prompt,
-                "stream": False
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=600) # 10 minutes
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(f"{ollama_url}/api/generate", json=payload) as resp:
-                    if resp.status != 200:
-                        error_text = await resp.text()
-                        logger.warning(f"Ollama Error with {current_model} ({resp.status}): {error_text}")
-                        last_error = f"Model {current_model} failed: {error_text}"
-                        continue # Try next model
-                    
-                    data = await resp.json()
-                    summary_text = data.get("response", "No response from AI.")
-                    
-                    # Append Metadata
-                    metadata = f"\n\n---\n**Summary Details:**\n- Model: {current_model}\n- Template: {template.name} ({language})"
-                    return summary_text + metadata
+        last_error = None
+        # (endpoint, model) pairs already tried, so an endpoint serving a fixed model is not asked twice
+        attempted = set()
+
+        for current_model in models_to_try:
+            try:
+                logger.info(f"Generating with model: {current_model}")
+                response_text, metrics = await pool.generate(
+                    current_model, system_prompt, user_prompt, budget, priority, attempted
+                )
+
+                stats.update(metrics)
+                stats["model"] = current_model
+                logger.info(
+                    f"LLM call with {current_model} on {metrics['backend']}: num_ctx={budget['num_ctx']} "
+                    f"prompt_tokens={metrics['prompt_eval_count']} (est. {budget['estimated_total_tokens']}) "
+                    f"eval_tokens={metrics['eval_count']} tok/s={metrics['tokens_per_sec']}"
+                )
+                return response_text, current_model
                     
-        except Exception as e:
-            logger.warning(f"Summarization failed with {current_model}: {e}")
-            last_error = str(e)
-            continue
+            except Exception as e:
+                logger.warning(f"Summarization failed with {current_model}: {e}")
+                last_error = str(e)
+                continue
             
-    # If we get here, all models failed
-    logger.error(f"All summarization models failed. Last error: {last_error}")
-    return f"Error: Could not generate summary. AI Service unavailable. Details: {last_error}"
+    return None, last_error
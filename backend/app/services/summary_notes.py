@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+from app.core.crypto import encrypt_data, decrypt_data
+from app.services.token_budget import estimate_tokens
+from app.services.summarization import generate_summary, generate_notes, OLLAMA_MODEL
+from app.services.llm_backends import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# Bump when the note extraction prompt changes so old notes are not reused.
+NOTES_PROMPT_VERSION = "3"
+
+# Speaker placeholders of compaction's neutral lines ([[S1]], [[S2]], ...), in that exact form
+SPEAKER_PLACEHOLDER = re.compile(r"\[\[S\d+\]\]")
+
+# Chunk boundaries are content-defined: a line closes a chunk when its hash hits
+# the divisor (and the chunk is big enough), so an edit only moves the boundaries
+# around the edited line instead of shifting every chunk after it.
+ASSUMED_TOKENS_PER_LINE = 40
+
+
+def split_chunks(lines: List[str], language: str = "en", target_tokens: Optional[int] = None) -> List[str]:
+    """Groups transcript lines into chunks of roughly `target_tokens` with stable boundaries."""
+    if target_tokens is None:
+        target_tokens = settings.SUMMARY_CHUNK_TOKENS
+    min_tokens = target_tokens // 2
+    max_tokens = target_tokens * 2
+    divisor = max(2, (target_tokens - min_tokens) // ASSUMED_TOKENS_PER_LINE)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for line in lines:
+        line_tokens = estimate_tokens(line, language)
+        if current and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+        line_hash = int(hashlib.sha1(line.encode("utf-8")).hexdigest()[:8], 16)
+        if current_tokens >= min_tokens and line_hash % divisor == 0:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def chunk_key(chunk: str, language: str, model: str) -> str:
+    content = "\x00".join([NOTES_PROMPT_VERSION, language, model, chunk])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def notes_path_for(transcript_path: str) -> str:
+    base = transcript_path[:-len(".json.enc")] if transcript_path.endswith(".json.enc") else transcript_path
+    return f"{base}.notes.enc"
+
+
+class NotesStore:
+    """
+    Encrypted per-job cache of chunk notes ({chunk_key: notes}), stored next to the transcript
+    with the job's file key.
+    """
+
+    def __init__(self, path: str, file_key: bytes):
+        self.path = path
+        self.file_key = file_key
+
+    def load(self) -> Dict[str, str]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                data = decrypt_data(f.read(), self.file_key)
+            return json.loads(data.decode("utf-8"))
+        except Exception as e:
+            logger.warning(f"Could not read summary notes cache {self.path}: {e}")
+            return {}
+
+    def save(self, notes: Dict[str, str]):
+        encrypted = encrypt_data(json.dumps(notes).encode("utf-8"), self.file_key)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encrypted)
+        os.replace(tmp_path, self.path)
+
+
+async def summarize_transcript(
+    compacted: Dict[str, Any],
+    meeting_type: str = "General Meeting",
+    language: str = "en",
+    model: str = OLLAMA_MODEL,
+    user_id: Optional[str] = None,
+    context_date: Optional[str] = None,
+    context_participants: Optional[str] = None,
+    context_notes: Optional[str] = None,
+    notes_store: Optional[NotesStore] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_NORMAL
+) -> str:
+    """
+    Summarizes a compacted transcript (see compaction.compact_transcript).
+
+    Short transcripts go to the LLM in one call. Long ones are map-reduced: each chunk is
+    turned into template-independent notes (cached in `notes_store` by chunk content hash),
+    and only the final reduce step uses the meeting template. Switching templates or editing
+    a few lines therefore re-runs the reduce step plus the chunks that actually changed.
+    Chunks name speakers by placeholder ([[S1]], [[S2]], ...) and the current names are put into
+    the notes before the reduce step, so renaming a speaker re-runs no chunk.
+    """
+    if stats is None:
+        stats = {}
+    context = {
+        "context_date": context_date,
+        "context_participants": context_participants,
+        "context_notes": context_notes,
+    }
+
+    transcript_tokens = estimate_tokens(compacted["text"], language)
+    if transcript_tokens <= settings.SUMMARY_MAP_REDUCE_THRESHOLD:
+        stats["mode"] = "single"
+        return await generate_summary(
+            compacted["text"], meeting_type=meeting_type, language=language,
+            model=model, user_id=user_id, stats=stats, priority=priority, **context
+        )
+
+    chunks = split_chunks(compacted["neutral_lines"], language)
+    cached_notes = notes_store.load() if notes_store else {}
+    keys = [chunk_key(chunk, language, model) for chunk in chunks]
+
+    notes: List[str] = []
+    map_stats = {"chunks": len(chunks), "reused": 0, "generated": 0, "failed": 0}
+    for index, (chunk, key) in enumerate(zip(chunks, keys)):
+        if key in cached_notes:
+            notes.append(cached_notes[key])
+            map_stats["reused"] += 1
+            continue
+        logger.info(f"Extracting notes for chunk {index + 1}/{len(chunks)}")
+        chunk_notes = await generate_notes(chunk, language, model, priority=priority)
+        if chunk_notes is None:
+            # Keep going with the raw chunk rather than dropping part of the meeting
+            map_stats["failed"] += 1
+            notes.append(chunk)
+            continue
+        cached_notes[key] = chunk_notes
+        notes.append(chunk_notes)
+        map_stats["generated"] += 1
+
+    if notes_store and map_stats["generated"]:
+        # Keep only notes for the current chunks so the cache does not grow with every edit
+        current = set(keys)
+        notes_store.save({k: v for k, v in cached_notes.items() if k in current})
+
+    logger.info(
+        f"Map step: {map_stats['chunks']} chunks, {map_stats['reused']} reused, "
+        f"{map_stats['generated']} generated, {map_stats['failed']} failed"
+    )
+
+    speakers = compacted["speakers"]
+
+    def named(text: str) -> str:
+        return SPEAKER_PLACEHOLDER.sub(lambda m: speakers.get(m.group(0), m.group(0)), text)
+
+    notes_text = "\n\n".join(f"[{i + 1}/{len(notes)}]\n{named(n.strip())}" for i, n in enumerate(notes))
+
+    stats["mode"] = "map_reduce"
+    stats["map"] = map_stats
+    return await generate_summary(
+        notes_text, meeting_type=meeting_type, language=language,
+        model=model, user_id=user_id, stats=stats, source="notes", priority=priority, **context
+    )
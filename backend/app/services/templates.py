@@ -1,5 +1,6 @@
 
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from app.core.database import db
 
 class MeetingTemplate:
@@ -162,24 +163,48 @@ TEMPLATES: Dict[str, Dict[str, MeetingTemplate]] = {
     }
 }
 
+# Custom template lookups, keyed by (user_id, name, language), LRU-bounded.
+# A cached None means "no custom template, use the built-in one".
+# Entries are dropped by invalidate_user_templates() from the template CRUD endpoints.
+MAX_CACHED_TEMPLATES = 1024
+_custom_template_cache: "OrderedDict[Tuple[str, str, str], Optional[MeetingTemplate]]" = OrderedDict()
+
+def invalidate_user_templates(user_id: str):
+    """Forget cached custom templates of a user after one was created, updated or deleted."""
+    for key in [k for k in _custom_template_cache if k[0] == user_id]:
+        del _custom_template_cache[key]
+
 async def get_template(meeting_type: str, language: str = "en", user_id: Optional[str] = None) -> MeetingTemplate:
     # 1. Try to fetch custom template if user_id is provided
     if user_id:
-        try:
-            custom_template = await db.get_db().templates.find_one({
-                "user_id": user_id,
-                "name": meeting_type,
-                "language": language
-            })
-            
-            if custom_template:
-                return MeetingTemplate(
-                    name=custom_template["name"],
-                    system_instruction=custom_template["system_instruction"],
-                    output_structure="" # Custom templates generally bake structure into system_instruction or description
-                )
-        except Exception as e:
-            print(f"Error fetching custom template: {e}")
+        cache_key = (user_id, meeting_type, language)
+        if cache_key in _custom_template_cache:
+            _custom_template_cache.move_to_end(cache_key)
+            cached = _custom_template_cache[cache_key]
+            if cached is not None:
+                return cached
+        else:
+            try:
+                custom_template = await db.get_db().templates.find_one({
+                    "user_id": user_id,
+                    "name": meeting_type,
+                    "language": language
+                })
+                
+                template = None
+                if custom_template:
+                    template = MeetingTemplate(
+                        name=custom_template["name"],
+                        system_instruction=custom_template["system_instruction"],
+                        output_structure="" # Custom templates generally bake structure into system_instruction or description
+                    )
+                _custom_template_cache[cache_key] = template
+                if len(_custom_template_cache) > MAX_CACHED_TEMPLATES:
+                    _custom_template_cache.popitem(last=False)
+                if template:
+                    return template
+            except Exception as e:
+                print(f"Error fetching custom template: {e}")
 
     # 2. Fallback to Built-in
     # Default to English if language not found
@@ -0,0 +1,131 @@
+import re
+import math
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough BPE behaviour for Qwen/Llama tokenizers on meeting text:
+# short words are a single token, long words split every ~6 chars,
+# punctuation is its own token. Spanish runs slightly longer than English.
+_TOKEN_PIECE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+LANGUAGE_FACTOR = {"en": 1.0, "es": 1.1}
+
+# Ollama allocates the KV cache for the full num_ctx, so we round up to a
+# coarse step to avoid reloading the model for every slightly different size.
+CTX_STEP = 2048
+SAFETY_MARGIN = 1.1
+
+# Number of generate_summary calls currently waiting on / talking to Ollama.
+_pending_requests = 0
+
+
+def estimate_tokens(text: Optional[str], language: str = "en") -> int:
+    """
+    Cheap, tokenizer-free estimate of how many tokens `text` will use.
+    Errs on the high side so num_ctx is never undersized.
+    """
+    if not text:
+        return 0
+    count = 0
+    for piece in _TOKEN_PIECE.findall(text):
+        count += 1 + (len(piece) - 1) // 6
+    # Newlines are usually separate tokens in transcripts ("Speaker: ..." lines)
+    count += text.count("\n")
+    return int(math.ceil(count * LANGUAGE_FACTOR.get(language, 1.0)))
+
+
+def compute_num_ctx(prompt_tokens: int, num_predict: Optional[int] = None) -> int:
+    """
+    Smallest context window (rounded to CTX_STEP) that fits the prompt plus
+    the reserved output tokens, clamped to the configured bounds.
+    """
+    if num_predict is None:
+        num_predict = settings.OLLAMA_NUM_PREDICT
+    needed = int((prompt_tokens + num_predict) * SAFETY_MARGIN)
+    num_ctx = int(math.ceil(needed / CTX_STEP)) * CTX_STEP
+    num_ctx = max(settings.OLLAMA_MIN_CTX, min(num_ctx, settings.OLLAMA_MAX_CTX))
+    if needed > settings.OLLAMA_MAX_CTX:
+        logger.warning(
+            f"Prompt needs ~{needed} tokens but OLLAMA_MAX_CTX is {settings.OLLAMA_MAX_CTX}. "
+            "The transcript will be truncated by Ollama."
+        )
+    return num_ctx
+
+
+def pick_keep_alive(queue_depth: int) -> str:
+    """
+    Keep the model resident longer while more summaries are queued behind
+    this one, so back-to-back requests don't pay the model load again.
+    """
+    if queue_depth > 1:
+        return settings.OLLAMA_KEEP_ALIVE_BUSY
+    return settings.OLLAMA_KEEP_ALIVE_IDLE
+
+
+def queue_depth() -> int:
+    return _pending_requests
+
+
+@asynccontextmanager
+async def track_request():
+    """Counts in-flight summarization requests for keep_alive decisions."""
+    global _pending_requests
+    _pending_requests += 1
+    try:
+        yield _pending_requests
+    finally:
+        _pending_requests -= 1
+
+
+def build_budget(system_prompt: str, user_prompt: str, language: str = "en") -> Dict[str, Any]:
+    """
+    Estimates prompt size and picks num_ctx / keep_alive for one request.
+    """
+    system_tokens = estimate_tokens(system_prompt, language)
+    prompt_tokens = estimate_tokens(user_prompt, language)
+    total = system_tokens + prompt_tokens
+    return {
+        "estimated_system_tokens": system_tokens,
+        "estimated_prompt_tokens": prompt_tokens,
+        "estimated_total_tokens": total,
+        "num_ctx": compute_num_ctx(total),
+        "num_predict": settings.OLLAMA_NUM_PREDICT,
+        "keep_alive": pick_keep_alive(queue_depth()),
+        "queue_depth": queue_depth(),
+    }
+
+
+def _ns_to_s(value) -> Optional[float]:
+    if value is None:
+        return None
+    return round(value / 1e9, 3)
+
+
+def parse_ollama_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts token counts and throughput from an /api/generate response.
+    Durations are reported by Ollama in nanoseconds.
+    """
+    prompt_eval_count = data.get("prompt_eval_count")
+    eval_count = data.get("eval_count")
+    prompt_eval_s = _ns_to_s(data.get("prompt_eval_duration"))
+    eval_s = _ns_to_s(data.get("eval_duration"))
+
+    metrics = {
+        "prompt_eval_count": prompt_eval_count,
+        "eval_count": eval_count,
+        "prompt_eval_duration": prompt_eval_s,
+        "eval_duration": eval_s,
+        "load_duration": _ns_to_s(data.get("load_duration")),
+        "total_duration": _ns_to_s(data.get("total_duration")),
+        "prefill_tokens_per_sec": None,
+        "tokens_per_sec": None,
+    }
+    if prompt_eval_count and prompt_eval_s:
+        metrics["prefill_tokens_per_sec"] = round(prompt_eval_count / prompt_eval_s, 2)
+    if eval_count and eval_s:
+        metrics["tokens_per_sec"] = round(eval_count / eval_s, 2)
+    return metrics
@@ -0,0 +1,160 @@
+import re
+from typing import Iterable, List, Optional, TypedDict, Union
+
+# "00:02:39 - 00:03:41 Unknown Speaker:" (the text follows on the next lines)
+HIDOCK_HEADER = re.compile(r'(\d+:\d{2}:\d{2})\s*-\s*(\d+:\d{2}:\d{2})\s+(.+):\s*$')
+# "00:00:01,000 --> 00:00:04,250" (SRT) or "00:01.000 --> 00:04.250 align:start" (WebVTT)
+CUE_TIMING = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})')
+VOICE_TAG = re.compile(r'<v(?:\.[^\s>]*)?\s+([^>]+)>')
+MARKUP = re.compile(r'<[^>]*>')
+
+# WebVTT blocks that are not cues
+VTT_SKIPPED_BLOCKS = ("NOTE", "STYLE", "REGION")
+
+# Lines longer than this are never headers; keeps the regexes off large text lines
+MAX_HEADER_LENGTH = 256
+
+
+class ImportedSegment(TypedDict, total=False):
+    start: float
+    end: float
+    text: str
+    speaker: str
+
+
+class ImportedTranscript:
+    """A parsed transcript: timed `segments`, or only `text` when the format is "plain"."""
+
+    def __init__(self, format: str, segments: List[ImportedSegment], text: str = ""):
+        self.format = format
+        self.segments = segments
+        self.text = text
+
+
+def parse_timestamp(value: str) -> float:
+    """Seconds of "01:02:03", "01:02:03,250" or "02:03.250"."""
+    seconds = 0.0
+    for part in value.strip().replace(",", ".").split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class TranscriptParser:
+    """
+    Single-pass, line-oriented parser for HiDock TXT, SRT, WebVTT and plain text.
+    Feed it lines (in any chunking of a stream, e.g. a file object) and call finish().
+    Every line is looked at once with anchored patterns, so the cost is linear in the
+    input however the file is formatted. Text before the first cue or header is
+    treated as a preamble and dropped; a file without any becomes plain text.
+    """
+
+    def __init__(self):
+        self.format: Optional[str] = None
+        self.segments: List[ImportedSegment] = []
+        self._plain: List[str] = []
+        self._current: Optional[ImportedSegment] = None
+        self._body: List[str] = []
+        # First line after a blank line: a cue identifier if a timing line follows, else text
+        self._pending: Optional[str] = None
+        self._after_blank = True
+        self._skipping = False
+        self._first = True
+
+    def _close(self):
+        if self._current is not None:
+            text = " ".join(self._body).strip()
+            if text:
+                self._current["text"] = text
+                self.segments.append(self._current)
+        self._current = None
+        self._body = []
+
+    def _text(self, line: str):
+        if self._current is None:
+            if not self.segments:
+                self._plain.append(line)
+            return
+        if self.format in ("srt", "vtt") and "<" in line:
+            voice = VOICE_TAG.search(line)
+            if voice and "speaker" not in self._current:
+                self._current["speaker"] = voice.group(1).strip()
+            line = MARKUP.sub("", line)
+        self._body.append(line.strip())
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            self._text(self._pending)
+            self._pending = None
+
+    def feed(self, line: str):
+        stripped = line.strip()
+        if self._first and stripped:
+            self._first = False
+            if stripped.lstrip("\ufeff").startswith("WEBVTT"):
+                self.format = "vtt"
+                self._skipping = True # Header block
+                return
+
+        if not stripped:
+            self._flush_pending()
+            self._after_blank = True
+            self._skipping = False
+            if self._current is None and not self.segments:
+                self._plain.append(line.rstrip("\r\n"))
+            return
+        if self._skipping:
+            return
+
+        short = len(stripped) <= MAX_HEADER_LENGTH
+        if short and "-->" in stripped:
+            timing = CUE_TIMING.match(stripped)
+            if timing:
+                # The held line was the cue number / identifier
+                self._pending = None
+                self._close()
+                self.format = self.format or "srt"
+                self._current = {"start": parse_timestamp(timing.group(1)), "end": parse_timestamp(timing.group(2))}
+                self._after_blank = False
+                return
+        if short and stripped[0].isdigit() and self.format in (None, "hidock"):
+            header = HIDOCK_HEADER.match(stripped)
+            if header:
+                self._flush_pending()
+                self._close()
+                self.format = "hidock"
+                self._current = {
+                    "start": parse_timestamp(header.group(1)),
+                    "end": parse_timestamp(header.group(2)),
+                    "speaker": header.group(3).strip()
+                }
+                self._after_blank = False
+                return
+
+        if self._after_blank:
+            self._after_blank = False
+            if self.format == "vtt" and stripped.split(" ", 1)[0] in VTT_SKIPPED_BLOCKS:
+                self._skipping = True
+                return
+            if self.format in ("srt", "vtt") or self.format is None and short:
+                # Might be a cue identifier; decided by the next line
+                self._flush_pending()
+                self._pending = stripped
+                return
+        self._flush_pending()
+        self._text(line.rstrip("\r\n"))
+
+    def finish(self) -> ImportedTranscript:
+        self._flush_pending()
+        self._close()
+        if not self.segments:
+            return ImportedTranscript("plain", [], "\n".join(self._plain).strip())
+        return ImportedTranscript(self.format, self.segments)
+
+
+def parse_transcript(source: Union[str, Iterable[str]]) -> ImportedTranscript:
+    """Parses a whole transcript (str) or a stream of lines (file object, generator)."""
+    lines = source.splitlines() if isinstance(source, str) else source
+    parser = TranscriptParser()
+    for line in lines:
+        parser.feed(line)
+    return parser.finish()
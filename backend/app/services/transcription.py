@@ -1,18 +1,35 @@
+import io
 import os
 import json
 import logging
 import asyncio
-from typing import Optional, List
+from bisect import bisect_left, bisect_right
+from typing import Optional, List, Tuple, Dict
 from app.core.config import settings
 from app.core.database import db
 from app.core.crypto import decrypt_data, decode_str, encrypt_data, encode_bytes, generate_key
 from app.models.job import JobStatus, JobInDB
+from app.services.checkpoints import CheckpointStore, checkpoint_fingerprint, checkpoint_base_for
+from app.services.stage_graph import StageGraph, thread_budget
+from app.services.pipeline import job_pipeline
+from app.services.vad import split_at_silence, speech_regions, silero_speech_regions, SpeechMap, SAMPLE_RATE
+from app.services.asr_models import asr_models
+from app.services.decoding import selective_transcribe
+from app.services.alignment import alignment_engine
+from app.services.anchors import draft_segments, anchor_segments
+from app.services.transcript_import import parse_transcript
+from app.services.diarization import onnx_diarizer, diarize_features, speaker_centroids, DiarizationFeatures
+from app.services.voiceprints import voiceprint_store_for, voiceprint_lock, is_named, MIN_EMBEDDINGS
+from app.services.audio_spool import recover_recording
 from bson import ObjectId
 from datetime import datetime
 import whisperx
 import whisperx.diarize
+import numpy as np
+import pandas as pd
 import torch
 import gc
+import copy
 
 # Patch for PyTorch 2.6+ to allow loading models with custom globals (trusted source)
 import torch
@@ -47,6 +64,130 @@ os.environ["TORCH_SKIP_WEIGHTS_ONLY_CHECK"] = "1"
 
 logger = logging.getLogger(__name__)
 
+
+def diarization_records(diarize_segments) -> list:
+    """Speaker turns of a diarization DataFrame as plain dicts (for checkpoints)."""
+    return [
+        {"start": float(row.start), "end": float(row.end), "speaker": row.speaker}
+        for row in diarize_segments.itertuples()
+    ]
+
+
+def speaker_params(job: dict) -> Dict[str, Optional[int]]:
+    """
+    Speaker count hints for diarization: the exact count given at upload (num_speakers)
+    wins over the job config's min/max bounds. Missing or non-positive values mean unknown.
+    """
+    config = job.get("config") if isinstance(job.get("config"), dict) else {}
+
+    def positive(value) -> Optional[int]:
+        return int(value) if isinstance(value, (int, float)) and value >= 1 else None
+
+    num_speakers = positive(job.get("num_speakers"))
+    low, high = positive(config.get("min_speakers")), positive(config.get("max_speakers"))
+    if num_speakers:
+        low = high = None
+    elif low and high and low > high:
+        low, high = high, low
+    return {"num_speakers": num_speakers, "min_speakers": low, "max_speakers": high}
+
+
+def speaker_renames(edited: list, base: list) -> Dict[str, str]:
+    """
+    Speaker renames made on one version of a transcript, as {base label: new name}.
+    Every edited segment votes, weighted by time overlap, for the `base` speaker
+    (diarization turns or segments of another version) it covers.
+    """
+    base = sorted((b for b in base if b.get("speaker")), key=lambda b: b["start"])
+    if not base:
+        return {}
+    starts = [b["start"] for b in base]
+    longest = max(b["end"] - b["start"] for b in base)
+    votes: Dict[Tuple[str, str], float] = {}
+    for seg in edited:
+        name, start, end = seg.get("speaker"), seg.get("start"), seg.get("end")
+        if not name or start is None or end is None:
+            continue
+        for b in base[bisect_left(starts, start - longest):bisect_right(starts, end)]:
+            overlap = min(end, b["end"]) - max(start, b["start"])
+            if overlap > 0:
+                votes[(b["speaker"], name)] = votes.get((b["speaker"], name), 0.0) + overlap
+
+    best: Dict[str, Tuple[str, float]] = {}
+    for (label, name), weight in votes.items():
+        if label not in best or weight > best[label][1]:
+            best[label] = (name, weight)
+    return {label: name for label, (name, _) in best.items() if name != label}
+
+
+def apply_speaker_renames(result: dict, renames: Dict[str, str]) -> dict:
+    for seg in result.get("segments", []):
+        if seg.get("speaker") in renames:
+            seg["speaker"] = renames[seg["speaker"]]
+        for word in seg.get("words") or []:
+            if word.get("speaker") in renames:
+                word["speaker"] = renames[word["speaker"]]
+    return result
+
+
+def unknown_speaker(speaker: Optional[str]) -> bool:
+    """No label, or HiDock's "Unknown Speaker"."""
+    return not speaker or "unknown" in speaker.lower()
+
+
+def labelled_speakers(result: dict) -> bool:
+    """True when a provided transcript names the speaker of every segment, so diarization has nothing to add."""
+    speakers = [seg.get("speaker") for seg in result.get("segments", [])]
+    return bool(speakers) and not any(unknown_speaker(s) for s in speakers)
+
+
+def provided_speakers(result: dict) -> list:
+    """Speakers of every segment and word of `result`, for keep_provided_speakers."""
+    return [
+        {"speaker": seg.get("speaker"), "words": [w.get("speaker") for w in seg.get("words") or []]}
+        for seg in result.get("segments", [])
+    ]
+
+
+def keep_provided_speakers(result: dict, provided: list) -> dict:
+    """
+    Puts back the names a partly labelled transcript gave (`provided`, taken before the
+    diarized speakers were assigned); segments it left as "Unknown Speaker" keep theirs.
+    """
+    for seg, before in zip(result.get("segments", []), provided):
+        if unknown_speaker(before["speaker"]):
+            continue
+        seg["speaker"] = before["speaker"]
+        for word, speaker in zip(seg.get("words") or [], before["words"]):
+            word["speaker"] = speaker or before["speaker"]
+    return result
+
+
+def assign_block_speakers(result: dict, blocks: list) -> dict:
+    """
+    Puts the speakers of the provided timestamped blocks back on an aligned result
+    (alignment may split blocks into sentences and drops extra keys): every segment
+    and word takes the speaker of the block its midpoint falls in.
+    """
+    blocks = sorted((b for b in blocks if b.get("speaker")), key=lambda b: b["start"])
+    if not blocks:
+        return result
+    starts = [b["start"] for b in blocks]
+
+    def speaker_at(start: float, end: float) -> str:
+        return blocks[max(0, bisect_right(starts, (start + end) / 2) - 1)]["speaker"]
+
+    for seg in result.get("segments", []):
+        seg["speaker"] = speaker_at(seg["start"], seg["end"])
+        for word in seg.get("words") or []:
+            word["speaker"] = speaker_at(word["start"], word["end"]) if word.get("start") is not None else seg["speaker"]
+    return result
+
+
+async def _no_progress(job_id, message, percent=None):
+    """Progress sink of background refinement: the job is already completed."""
+
+
 class TranscriptionService:
     def __init__(self):
         # We will load models on demand to save memory when idle, 
@@ -67,10 +208,19 @@ class TranscriptionService:
              
         self.batch_size = 4 
 
+        # torch threads are process-global: set once for every job the pipeline runs at once
+        self.threads = thread_budget()
+        torch.set_num_threads(self.threads["torch"])
+
     async def process_job(self, job_id: str):
         """
         Main entry point for embedded background processing of a job via WhisperX.
         Includes Transcription -> Alignment -> Diarization.
+
+        The stages form a DAG (see StageGraph): diarization only needs the decoded audio,
+        so it runs alongside ASR and alignment and its speaker turns are merged at the end.
+        Every stage saves an encrypted checkpoint and is recorded in `checkpoint_stages`,
+        so a retry or a restart resumes instead of starting over.
         """
         logger.info(f"Starting processing for job {job_id}")
         
@@ -91,219 +241,163 @@ class TranscriptionService:
             }}
         )
 
-        temp_audio_path = None
         try:
-            # 2. Decrypt Audio File
             encrypted_file_key = job.get("file_key")
             if not encrypted_file_key:
                 raise ValueError("Encyption key (file_key) is missing. This recording might be from an older version and cannot be recovered. Please delete it and upload again.")
                 
             file_key = decode_str(encrypted_file_key)
-            
-            file_path = job["file_path"]
-            with open(file_path, "rb") as f:
-                encrypted_content = f.read()
-            
-            audio_data = decrypt_data(encrypted_content, file_key)
-            
-            # Write decrypted audio to temp file for WhisperX
-            # (whisperx.load_audio needs a file path usually)
-            ext = "wav"
-            if job.get('original_filename'):
-                ext = job['original_filename'].split('.')[-1]
-            elif job.get('filename'):
-                ext = job['filename'].split('.')[-1]
-                
-            temp_audio_path = f"/tmp/{job_id}_temp.{ext}"
-            with open(temp_audio_path, "wb") as f:
-                 f.write(audio_data)
 
-            # 3. Optimize Execution Config & Load Config
+            # Load Config
             raw_config = job.get("config", {})
             config = raw_config if isinstance(raw_config, dict) else {}
             model_name = os.getenv("WHISPER_MODEL", "large-v3") # Default to large-v3 as properly set now
-            
-            logger.info(f"Loading WhisperX model: {model_name} on {self.device} ({self.compute_type})")
-            
-            result = {}
-            segments = []
-            
-            # CHECK FOR HIDOCK MODE (Transcript File provided)
-            # If transcript_file_path is present, we skip ASR.
-            transcript_file_path = job.get("transcript_file_path")
-            
-            if transcript_file_path and os.path.exists(transcript_file_path):
-                 await self.update_progress(job_id, "HiDock Mode: Loading Transcript...", 10)
-                 
-                 # Decrypt/Read transcript file
-                 try:
-                     with open(transcript_file_path, "rb") as tf:
-                         enc_trans_content = tf.read()
-                     trans_bytes = decrypt_data(enc_trans_content, file_key)
-                     trans_text = trans_bytes.decode('utf-8')
-                 except Exception:
-                     # Fallback if not encrypted (dev testing?)
-                     with open(transcript_file_path, "r", encoding="utf-8") as tf:
-                         trans_text = tf.read()
-
-                 # Parse HiDock TXT format:
-                 # "00:02:39 - 00:03:41 Unknown Speaker:\n\nText content here..."
-                 import re
-                 
-                 def parse_hhmmss(t_str):
-                     parts = t_str.strip().split(':')
-                     return int(parts[0])*3600 + int(parts[1])*60 + int(parts[2])
-                 
-                 hidock_pattern = re.compile(
-                     r'(\d{2}:\d{2}:\d{2})\s*-\s*(\d{2}:\d{2}:\d{2})\s+(.+?):\s*\n\s*\n(.*?)(?=\n\d{2}:\d{2}:\d{2}\s*-|\Z)',
-                     re.DOTALL
-                 )
-                 matches = hidock_pattern.findall(trans_text)
-                 
-                 if matches:
-                     # Structured HiDock format detected
-                     await self.update_progress(job_id, f"HiDock Mode: Parsed {len(matches)} segments with timestamps.", 15)
-                     segments = []
-                     for m in matches:
-                         start = parse_hhmmss(m[0])
-                         end = parse_hhmmss(m[1])
-                         speaker = m[2].strip()
-                         text_content = m[3].strip()
-                         if text_content:
-                             segments.append({
-                                 "start": float(start), 
-                                 "end": float(end), 
-                                 "text": text_content,
-                                 "speaker": speaker
-                             })
-                     
-                     result = {"segments": segments, "language": job.get("language", "en")}
-                     logger.info(f"HiDock TXT parsed: {len(segments)} segments")
-                 else:
-                     # Plain text fallback — no HiDock structure detected
-                     # Create one giant segment; alignment will break it down by words.
-                     await self.update_progress(job_id, "HiDock Mode (Plain TXT): Pre-loading audio for alignment setup...", 12)
-                     audio = await asyncio.to_thread(whisperx.load_audio, temp_audio_path)
-                     duration = len(audio) / 16000.0
-                     
-                     segments = [{"text": trans_text.strip(), "start": 0.0, "end": duration}]
-                     result = {"segments": segments, "language": job.get("language", "en")}
-
-            # CHECK FOR LEGACY ALIGNMENT MODE (Text provided in DB field)
-            elif job.get("transcript_text"):
-                await self.update_progress(job_id, "Skipping Transcription (Text provided). Preparing for Alignment...", 10)
-                text = job["transcript_text"]
-                import re
-                sentences = re.split(r'(?<=[.!?])\s+', text)
-                segments = [{"text": s.strip(), "start": 0.0, "end": 0.0} for s in sentences if s.strip()]
-                result = {"segments": segments, "language": job.get("language", "en")} 
-            
-            else:
-                # 4. Transcribe (ASR)
-                await self.update_progress(job_id, f"Transcribing with {model_name}...", 5)
-                # Load model with specific VAD settings if possible (WhisperX load_model has limited params)
-                # We apply VAD settings during Diarization mostly, but ASR has vad_filter too.
-                vad_options = {
-                    "vad_onset": config.get("vad_onset", 0.5),
-                    "vad_offset": config.get("vad_offset", 0.363)
-                }
-                
-                model = await asyncio.to_thread(
-                    whisperx.load_model,
-                    model_name, 
-                    self.device, 
-                    compute_type=self.compute_type, 
-                    download_root=settings.TRANSCRIPT_STORAGE_PATH,
-                    vad_options=vad_options
+            run_asr = not job.get("transcript_file_path") and not job.get("transcript_text")
+
+            # Two-pass ASR: a fast draft now, WHISPER_MODEL refines it in the background (refine_job)
+            two_pass = run_asr and bool(settings.ASR_DRAFT_MODEL) and settings.ASR_DRAFT_MODEL != model_name
+            if two_pass:
+                model_name = settings.ASR_DRAFT_MODEL
+
+            # Checkpoints are only resumed if they were built from the same inputs
+            store = CheckpointStore(checkpoint_base_for(job, job_id), file_key)
+            fingerprint = checkpoint_fingerprint(job, model_name)
+            completed = set(job.get("checkpoint_stages") or [])
+            if job.get("checkpoint_key") != fingerprint:
+                store.discard()
+                completed = set()
+                await db.get_db().jobs.update_one(
+                    {"_id": ObjectId(job_id)},
+                    {"$set": {"checkpoint_key": fingerprint, "checkpoint_stages": []}}
                 )
-                
-                # Ensure audio is loaded if not already
-                if 'audio' not in locals():
-                    audio = await asyncio.to_thread(whisperx.load_audio, temp_audio_path)
-                
-                # Update progress before heavy work
-                await self.update_progress(job_id, "Transcribing audio (this may take a while)...", 20)
-                result = await asyncio.to_thread(model.transcribe, audio, batch_size=self.batch_size)
-                
-                # Free ASR model
-                del model
-                gc.collect()
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            
-            # 4. Alignment (Optional phase)
-            try:
-                await self.update_progress(job_id, "Aligning text...", 60)
-                if 'audio' not in locals():
-                     audio = await asyncio.to_thread(whisperx.load_audio, temp_audio_path)
-                logger.info(f"Loading alignment model for language {result['language']}...")
-                model_a, metadata = await asyncio.to_thread(whisperx.load_align_model, language_code=result["language"], device=self.device)
-                
-                if model_a is not None:
-                    logger.info("Performing alignment...")
-                    result = await asyncio.to_thread(whisperx.align, result["segments"], model_a, metadata, audio, self.device, return_char_alignments=False)
-                    # Free alignment model
-                    del model_a
-                    gc.collect()
-                    if self.device == "cuda":
-                        torch.cuda.empty_cache()
-                else:
-                    logger.warning(f"whisperx.load_align_model returned None for {result['language']}. Skipping.")
-            except Exception as align_error:
-                import traceback
-                logger.warning(f"Alignment phase failed for job {job_id}: {align_error}")
-                # We save the align error but continue to allow the job to finish with basic transcription
+            if completed:
+                logger.info(f"Job {job_id}: resuming with checkpoints for {sorted(completed)}")
+
+            # Stages whose output was reused or recomputed in this run
+            reused = set()
+
+            def resume(stage: str, deps: List[str]) -> Optional[dict]:
+                # A stage is reused only if everything it depends on was reused too
+                if stage not in completed or any(d not in reused for d in deps):
+                    return None
+                checkpoint = store.load_json(stage)
+                if checkpoint is None or checkpoint.get("error"):
+                    return None
+                reused.add(stage)
+                return checkpoint
+
+            # Pipeline DAG: decode -> (asr -> align) || diarize -> merge
+            run_diarize = bool(settings.HF_TOKEN)
+            parallel = settings.PARALLEL_DIARIZATION
+            diarize_params = speaker_params(job)
+
+            async def decode_stage():
+                # Decoding is deterministic, so re-decoding does not invalidate later stages
+                audio = await self._decode_stage(job_id, job, store, file_key)
+                reused.add("decode")
+                if "decode" not in completed:
+                    await self._mark_stage(job_id, "decode")
+                return audio
+
+            async def vad_stage(decode):
+                # Standalone VAD, kept out of the ASR model so VAD settings never force a reload.
+                # Returns the speech map later stages compact the audio with (None = whole recording)
+                checkpoint = resume("vad", ["decode"])
+                if checkpoint:
+                    return self._compaction(SpeechMap.from_dict(checkpoint["map"]))
+                speech, backend = await asyncio.to_thread(self._speech_map, decode, config)
+                store.save_json("vad", {"map": speech.to_dict(), "backend": backend})
+                reused.add("vad")
                 await db.get_db().jobs.update_one(
                     {"_id": ObjectId(job_id)},
-                    {"$set": {"status_message": f"Alignment skipped due to error: {str(align_error)}"}}
+                    {"$set": {"speech_map": {
+                        **speech.to_dict(),
+                        "speech_seconds": round(speech.speech_seconds, 1),
+                        "backend": backend
+                    }}}
                 )
+                await self._mark_stage(job_id, "vad")
+                logger.info(f"Job {job_id}: {speech.speech_seconds:.0f}s of speech in {speech.duration:.0f}s ({backend} VAD)")
+                return self._compaction(speech)
 
-            # 5. Diarization (Optional phase)
-            # Check if HF_TOKEN is present
-            if settings.HF_TOKEN:
-                try:
-                    await self.update_progress(job_id, "Diarizing speakers (Loading model)...", 80)
-                    diarize_model = await asyncio.to_thread(whisperx.diarize.DiarizationPipeline, use_auth_token=settings.HF_TOKEN, device=self.device)
-                    
-                    await self.update_progress(job_id, "Diarizing speakers (Processing)...", 90)
-                    
-                    # Ensure audio is loaded (if ASR/Align skipped or failed)
-                    if 'audio' not in locals():
-                         audio = await asyncio.to_thread(whisperx.load_audio, temp_audio_path)
-                    
-                    min_speakers = config.get("min_speakers")
-                    max_speakers = config.get("max_speakers")
-                    
-                    diarize_segments = await asyncio.to_thread(diarize_model, audio, min_speakers=min_speakers, max_speakers=max_speakers)
-                    
-                    result = await asyncio.to_thread(whisperx.assign_word_speakers, diarize_segments, result)
-                    
-                    # Free diarize model
-                    del diarize_model
-                    gc.collect()
-                    if self.device == "cuda":
-                        torch.cuda.empty_cache()
-                except Exception as diarize_error:
-                    logger.warning(f"Diarization phase failed for job {job_id}: {diarize_error}")
-                    await db.get_db().jobs.update_one(
-                        {"_id": ObjectId(job_id)},
-                        {"$set": {"status_message": f"Diarization skipped. This usually happens if the HF_TOKEN is invalid or models haven't been accepted on HuggingFace: {str(diarize_error)}"}}
+            async def asr_stage(decode, vad):
+                checkpoint = resume("asr", ["decode", "vad"])
+                if checkpoint:
+                    await self.update_progress(job_id, "Resuming: transcription loaded from checkpoint", 55)
+                    return checkpoint["result"]
+                # Provided transcripts are only parsed, they do not need an ASR worker
+                async with job_pipeline.slot("asr" if run_asr else None):
+                    result = await self._asr_stage(
+                        job_id, job, config, model_name, decode, file_key, self.threads["asr"], store, speech=vad
                     )
-            else:
-                logger.warning("HF_TOKEN not found, skipping diarization")
+                store.save_json("asr", {"result": result})
+                await self._mark_stage(job_id, "asr")
+                return result
+
+            async def align_stage(asr, decode, vad):
+                checkpoint = resume("align", ["asr"])
+                if checkpoint:
+                    await self.update_progress(job_id, "Resuming: alignment loaded from checkpoint", 75)
+                    return checkpoint["result"]
+                async with job_pipeline.slot("align"):
+                    # Provided transcripts may hold text the VAD missed, align them on the full audio
+                    result, align_error = await self._align_stage(job_id, asr, decode, speech=vad if run_asr else None)
+                if not run_asr and not all(unknown_speaker(s.get("speaker")) for s in asr["segments"]):
+                    result = assign_block_speakers(result, asr["segments"])
+                store.save_json("align", {"result": result, "error": align_error})
+                await self._mark_stage(job_id, "align")
+                return result
+
+            async def diarize_stage(decode, vad, **upstream):
+                checkpoint = resume("diarize", ["decode", "vad"])
+                if checkpoint and checkpoint.get("params") == diarize_params:
+                    await self.update_progress(job_id, "Resuming: diarization loaded from checkpoint")
+                    return checkpoint["diarization"]
+                if "asr" in upstream and labelled_speakers(upstream["asr"]):
+                    # HiDock transcript already names every speaker; align_stage keeps them
+                    logger.info(f"Job {job_id}: speakers provided by the transcript, skipping diarization")
+                    store.save_json("diarize", {"diarization": None, "params": diarize_params, "error": None})
+                    await self._mark_stage(job_id, "diarize")
+                    return None
+                # Percentages belong to the ASR branch while both run
+                async with job_pipeline.slot("diarize" if run_diarize else None):
+                    turns, diarize_error = await self._diarize_stage(
+                        job_id, decode, diarize_params, report_percent=not (parallel and run_asr), speech=vad, store=store,
+                        user_id=job.get("user_id")
+                    )
+                store.save_json("diarize", {"diarization": turns, "params": diarize_params, "error": diarize_error})
+                await self._mark_stage(job_id, "diarize")
+                return turns
+
+            async def merge_stage(align, diarize):
+                if not diarize:
+                    return align
+                await self.update_progress(job_id, "Assigning speakers...", 93)
+                # A partly labelled transcript keeps its names; diarization fills in the unknown ones
+                provided = provided_speakers(align) if not run_asr else None
+                result = await asyncio.to_thread(whisperx.assign_word_speakers, pd.DataFrame(diarize), align)
+                return keep_provided_speakers(result, provided) if provided else result
 
-            # 7. Encrypt Result
+            graph = StageGraph(f"job {job_id}")
+            graph.add("decode", decode_stage)
+            graph.add("vad", vad_stage, deps=["decode"])
+            graph.add("asr", asr_stage, deps=["decode", "vad"])
+            graph.add("align", align_stage, deps=["asr", "decode", "vad"])
+            # Diarization only needs the audio; run it after alignment when memory is tight.
+            # With a provided transcript it waits for the (instant) parse to see if speakers are labelled
+            diarize_deps = ["decode", "vad"] if parallel else ["decode", "vad", "align"]
+            if job.get("transcript_file_path"):
+                diarize_deps.append("asr")
+            graph.add("diarize", diarize_stage, deps=diarize_deps)
+            graph.add("merge", merge_stage, deps=["align", "diarize"])
+            result = (await graph.run())["merge"]
+
+            # Encrypt Result
             await self.update_progress(job_id, "Finalizing...", 95)
-            result_json = json.dumps(result).encode('utf-8')
-            encrypted_transcript = encrypt_data(result_json, file_key)
-            
-            transcript_filename = f"{job.get('filename', job_id)}.json.enc"
-            transcript_path = os.path.join(os.path.dirname(file_path), transcript_filename)
-            
-            with open(transcript_path, "wb") as f:
-                f.write(encrypted_transcript)
+            result["asr_pass"] = "draft" if two_pass else "final"
+            transcript_path = self._write_transcript(job, job_id, result, file_key)
                 
-            # 8. Update Job
+            # Update Job
             # Calculate duration
             # WhisperX result doesn't always have global duration, we can get it from segments
             duration = 0
@@ -314,14 +408,22 @@ class TranscriptionService:
                 {"_id": ObjectId(job_id)},
                 {"$set": {
                     "status": JobStatus.COMPLETED,
-                    "status_message": "Completed", # Clear message
+                    "status_message": "Draft ready, refining in the background" if two_pass else "Completed", # Clear message
                     "progress": 100,
                     "completed_at": datetime.utcnow(),
                     "transcript_path": transcript_path,
-                    "duration": duration
-                }}
+                    "transcript_status": "draft" if two_pass else "final",
+                    "asr_model": model_name if run_asr else None,
+                    "duration": duration,
+                    "stage_timings": graph.timings
+                },
+                "$addToSet": {"checkpoint_stages": "finalize"}}
             )
+            # Decoded audio is large and cheap to recreate; the stage results stay for diarize-only runs
+            store.discard(["decode", "partial"])
             logger.info(f"Job {job_id} completed successfully")
+            if two_pass:
+                job_pipeline.submit(job_id, background=True)
 
         except Exception as e:
             import traceback
@@ -335,10 +437,566 @@ class TranscriptionService:
                     "progress": 0
                 }}
             )
-        finally:
-            # Cleanup temp file
-            if temp_audio_path and os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
+
+    async def _mark_stage(self, job_id: str, stage: str):
+        await db.get_db().jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$addToSet": {"checkpoint_stages": stage}}
+        )
+
+    def _audio_extension(self, job: dict) -> str:
+        ext = "wav"
+        if job.get('original_filename'):
+            ext = job['original_filename'].split('.')[-1]
+        elif job.get('filename'):
+            ext = job['filename'].split('.')[-1]
+        return ext
+
+    async def _decode_stage(self, job_id: str, job: dict, store: CheckpointStore, file_key: bytes, save: bool = True, report_progress: bool = True) -> np.ndarray:
+        """Decrypted, resampled 16 kHz mono audio, from the checkpoint when available."""
+        progress = self.update_progress if report_progress else _no_progress
+        cached = store.load_bytes("decode")
+        if cached is not None:
+            logger.info(f"Job {job_id}: decoded audio loaded from checkpoint")
+            return np.frombuffer(cached, dtype=np.float32)
+
+        async with job_pipeline.slot("decode"):
+            await progress(job_id, "Decoding audio...", 3)
+            with open(job["file_path"], "rb") as f:
+                encrypted_content = f.read()
+            audio_data = decrypt_data(encrypted_content, file_key)
+
+            # Write decrypted audio to temp file for WhisperX
+            # (whisperx.load_audio needs a file path usually)
+            temp_audio_path = f"/tmp/{job_id}_temp.{self._audio_extension(job)}"
+            try:
+                with open(temp_audio_path, "wb") as f:
+                     f.write(audio_data)
+                audio = await asyncio.to_thread(whisperx.load_audio, temp_audio_path)
+            finally:
+                # Cleanup temp file
+                if os.path.exists(temp_audio_path):
+                    os.remove(temp_audio_path)
+
+        if save:
+            store.save_bytes("decode", audio.astype(np.float32).tobytes())
+        return audio
+
+    async def _asr_stage(
+        self,
+        job_id: str,
+        job: dict,
+        config: dict,
+        model_name: str,
+        audio: np.ndarray,
+        file_key: bytes,
+        threads: int = 4,
+        store: Optional[CheckpointStore] = None,
+        window_slot: Optional[str] = None,
+        speech: Optional[SpeechMap] = None,
+        report_progress: bool = True
+    ) -> dict:
+        """
+        `window_slot` takes the pipeline slot per window instead of leaving it to the
+        caller, so background refinement gives way to uploads between windows.
+        With a `speech` map only the speech regions are transcribed; segment times are
+        mapped back to the original recording.
+        """
+        progress = self.update_progress if report_progress else _no_progress
+        # CHECK FOR HIDOCK MODE (Transcript File provided)
+        # If transcript_file_path is present, we skip ASR.
+        transcript_file_path = job.get("transcript_file_path")
+        
+        if transcript_file_path and os.path.exists(transcript_file_path):
+             await progress(job_id, "HiDock Mode: Loading Transcript...", 10)
+             
+             # Decrypt/Read transcript file
+             try:
+                 with open(transcript_file_path, "rb") as tf:
+                     enc_trans_content = tf.read()
+                 trans_bytes = decrypt_data(enc_trans_content, file_key)
+                 trans_text = trans_bytes.decode('utf-8')
+             except Exception:
+                 # Fallback if not encrypted (dev testing?)
+                 with open(transcript_file_path, "r", encoding="utf-8") as tf:
+                     trans_text = tf.read()
+
+             # HiDock TXT ("00:02:39 - 00:03:41 Unknown Speaker:" blocks), SRT or WebVTT;
+             # anything else is plain text
+             parsed = parse_transcript(io.StringIO(trans_text))
+             
+             if parsed.segments:
+                 await progress(job_id, f"HiDock Mode: Parsed {len(parsed.segments)} {parsed.format.upper()} segments with timestamps.", 15)
+                 segments = [dict(seg) for seg in parsed.segments]
+                 if parsed.format == "hidock":
+                     # Timestamps are whole seconds: a block can run up to a second past `end`
+                     for seg in segments:
+                         seg["end"] += 1.0
+                 
+                 logger.info(f"Transcript import ({parsed.format}): {len(segments)} segments")
+                 return {"segments": segments, "language": job.get("language", "en")}
+
+             # Plain text fallback — no HiDock structure detected
+             # Anchor the text on the timeline so it is aligned in short windows
+             await progress(job_id, "HiDock Mode (Plain TXT): Preparing for alignment...", 12)
+             return await self._anchored_transcript(job_id, job, parsed.text, audio, threads)
+
+        # CHECK FOR LEGACY ALIGNMENT MODE (Text provided in DB field)
+        if job.get("transcript_text"):
+            await progress(job_id, "Skipping Transcription (Text provided). Preparing for Alignment...", 10)
+            return await self._anchored_transcript(job_id, job, job["transcript_text"], audio, threads)
+
+        # Transcribe (ASR) on the shared warm model; this job's options are applied per call
+        logger.info(f"Using WhisperX model: {model_name} on {self.device} ({self.compute_type})")
+        await progress(job_id, f"Transcribing with {model_name}...", 5)
+        vad_params = {
+            "vad_onset": config.get("vad_onset", 0.5),
+            "vad_offset": config.get("vad_offset", 0.363)
+        }
+        # Selective decoding: cheap first pass, the job's beam only for low-confidence segments
+        beam_size = config.get("beam_size") or 5
+        condition_on_previous_text = bool(config.get("condition_on_previous_text", False))
+        decode_options = {
+            "beam_size": settings.DECODE_FIRST_PASS_BEAM if settings.DECODE_SELECTIVE else beam_size,
+            "condition_on_previous_text": condition_on_previous_text,
+            "max_initial_timestamp": config.get("max_initial_silence")
+        }
+        warm = await asyncio.to_thread(asr_models.get, model_name)
+
+        def transcribe_window(window: np.ndarray, language: Optional[str]) -> dict:
+            with warm.configured(decode_options, vad_params) as model:
+                if settings.DECODE_SELECTIVE:
+                    return selective_transcribe(
+                        model, window, language, self.batch_size, beam_size, condition_on_previous_text,
+                        max_initial_timestamp=config.get("max_initial_silence")
+                    )
+                return model.transcribe(window, batch_size=self.batch_size, language=language)
+        
+        # Transcribe window by window (cut at silences) so finished segments can be read
+        # while the rest of the file is still being transcribed
+        if speech is not None:
+            audio = speech.compact(audio)
+        windows = split_at_silence(audio, settings.ASR_WINDOW_SECONDS)
+        total_seconds = len(audio) / SAMPLE_RATE
+        segments, language, done_until = [], None, 0
+        redecoded = dropped = 0
+        partial = store.load_json("partial") if store else None
+        if partial and partial.get("windows") == len(windows):
+            segments, language, done_until = partial["segments"], partial["language"], partial["processed_until"]
+            logger.info(f"Job {job_id}: resuming ASR at {done_until / SAMPLE_RATE:.0f}s from the partial transcript")
+
+        await progress(job_id, "Transcribing audio (this may take a while)...", 20)
+        for start, end in windows:
+            if end <= done_until:
+                continue
+            async with job_pipeline.slot(window_slot):
+                window_result = await asyncio.to_thread(transcribe_window, audio[start:end], language)
+            redecoded += window_result.get("redecoded", 0)
+            dropped += window_result.get("dropped", 0)
+            # Keep the language detected on the first window for the rest of the file
+            language = language or window_result.get("language")
+            offset = start / SAMPLE_RATE
+            for seg in window_result["segments"]:
+                seg["start"] = round(seg["start"] + offset, 3)
+                seg["end"] = round(seg["end"] + offset, 3)
+            if speech is not None:
+                speech.result_to_original(window_result)
+            segments.extend(window_result["segments"])
+            done_until = end
+
+            if store:
+                store.save_json("partial", {
+                    "segments": segments,
+                    "language": language,
+                    "processed_until": done_until,
+                    "windows": len(windows),
+                    "duration": total_seconds
+                })
+            processed = end / SAMPLE_RATE
+            await progress(
+                job_id,
+                f"Transcribing audio ({processed / 60:.0f} of {total_seconds / 60:.0f} min)...",
+                20 + int(40 * end / max(1, len(audio)))
+            )
+        result = {"segments": segments, "language": language or job.get("language", "en")}
+        if settings.DECODE_SELECTIVE:
+            logger.info(f"Job {job_id}: re-decoded {redecoded} low-confidence segment(s) with beam {beam_size}, dropped {dropped} as silence")
+        
+        # The model stays warm in asr_models for the next job
+        return result
+
+    async def _anchored_transcript(self, job_id: str, job: dict, text: str, audio: np.ndarray, threads: int) -> dict:
+        """
+        Provided text without timestamps, cut into sentence chunks placed on the timeline.
+        A greedy pass of the small ANCHOR_ASR_MODEL gives anchor points where it agrees
+        with the text; without it (or if it fails) the text is spread evenly.
+        """
+        language = job.get("language", "en")
+        duration = len(audio) / SAMPLE_RATE
+        draft = None
+        if settings.ANCHOR_ASR_MODEL:
+            await self.update_progress(job_id, f"Placing alignment anchors with {settings.ANCHOR_ASR_MODEL}...", 12)
+            try:
+                async with job_pipeline.slot("asr"):
+                    draft = await asyncio.to_thread(draft_segments, audio, language, threads)
+            except Exception as e:
+                logger.warning(f"Job {job_id}: anchor pass failed, spreading the text evenly: {e}")
+        segments, anchored = await asyncio.to_thread(anchor_segments, text, duration, draft, settings.ANCHOR_CHUNK_WORDS)
+        logger.info(f"Job {job_id}: {len(segments)} text chunks placed, {anchored:.0%} of words anchored")
+        return {"segments": segments, "language": language}
+
+    async def _align_stage(self, job_id: str, result: dict, audio: np.ndarray, speech: Optional[SpeechMap] = None, report_progress: bool = True) -> Tuple[dict, Optional[str]]:
+        """
+        Returns (result, error). On failure the unaligned result is kept.
+        With a `speech` map alignment runs on the compacted audio and the word times are mapped back.
+        """
+        progress = self.update_progress if report_progress else _no_progress
+        unaligned = result
+        if speech is not None:
+            result = speech.result_to_compact({**result, "segments": copy.deepcopy(result["segments"])})
+            audio = speech.compact(audio)
+        try:
+            await progress(job_id, "Aligning text...", 60)
+            logger.info(f"Aligning {len(result['segments'])} segments ({result['language']}) in windows...")
+
+            async def on_progress(done: int, total: int):
+                await progress(job_id, f"Aligning text ({done}/{total} windows)...", 60 + int(15 * done / max(1, total)))
+
+            aligned, failed, windows = await alignment_engine.align(
+                result["segments"], audio, result["language"], self.device, on_progress=on_progress
+            )
+            aligned["language"] = result["language"]
+            if speech is not None:
+                aligned = speech.result_to_original(aligned)
+            if failed and failed >= windows:
+                raise RuntimeError(f"alignment failed in all {windows} window(s)")
+            if failed:
+                # Those windows keep segment-level timestamps; a retry re-runs the alignment
+                await db.get_db().jobs.update_one(
+                    {"_id": ObjectId(job_id)},
+                    {"$set": {"status_message": f"Alignment failed in {failed} of {windows} windows, segment timestamps kept there"}}
+                )
+                return aligned, f"{failed} of {windows} alignment windows failed"
+            return aligned, None
+        except Exception as align_error:
+            logger.warning(f"Alignment phase failed for job {job_id}: {align_error}")
+            # We save the align error but continue to allow the job to finish with basic transcription
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {"status_message": f"Alignment skipped due to error: {str(align_error)}"}}
+            )
+            return unaligned, str(align_error)
+
+    async def _diarize_stage(
+        self,
+        job_id: str,
+        audio: np.ndarray,
+        params: dict,
+        report_percent: bool = True,
+        speech: Optional[SpeechMap] = None,
+        store: Optional[CheckpointStore] = None,
+        user_id: Optional[str] = None
+    ) -> Tuple[Optional[list], Optional[str]]:
+        """
+        Returns (speaker turns, error). Needs only the audio, so it can run alongside ASR;
+        the turns are assigned to words in the merge stage. Skipped without HF_TOKEN.
+        With a `speech` map only the speech regions are diarized.
+        """
+        # Check if HF_TOKEN is present
+        if not settings.HF_TOKEN:
+            logger.warning("HF_TOKEN not found, skipping diarization")
+            # Recorded as an error so a retry runs it once a token is configured
+            return None, "HF_TOKEN not configured"
+        try:
+            diarize_audio = speech.compact(audio) if speech is not None else audio
+            diarize_segments = await self._onnx_diarize(
+                job_id, diarize_audio, params, 90 if report_percent else None, store, user_id
+            )
+            if diarize_segments is None:
+                await self.update_progress(job_id, "Diarizing speakers (Loading model)...", 80 if report_percent else None)
+                diarize_model = await asyncio.to_thread(whisperx.diarize.DiarizationPipeline, use_auth_token=settings.HF_TOKEN, device=self.device)
+                
+                await self.update_progress(job_id, "Diarizing speakers (Processing)...", 90 if report_percent else None)
+                
+                diarize_segments = await asyncio.to_thread(diarize_model, diarize_audio, **params)
+                
+                # Free diarize model
+                del diarize_model
+                gc.collect()
+                if self.device == "cuda":
+                    torch.cuda.empty_cache()
+            turns = diarization_records(diarize_segments)
+            return (speech.turns_to_original(turns) if speech is not None else turns), None
+        except Exception as diarize_error:
+            logger.warning(f"Diarization phase failed for job {job_id}: {diarize_error}")
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {"status_message": f"Diarization skipped. This usually happens if the HF_TOKEN is invalid or models haven't been accepted on HuggingFace: {str(diarize_error)}"}}
+            )
+            return None, str(diarize_error)
+
+    async def _onnx_diarize(
+        self,
+        job_id: str,
+        audio: np.ndarray,
+        params: dict,
+        percent: Optional[int] = None,
+        store: Optional[CheckpointStore] = None,
+        user_id: Optional[str] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Diarization on the ONNX backend when DIARIZE_BACKEND is "onnx" (CPU only).
+        None when not selected or when it fails, so the caller runs the pyannote pipeline.
+        The segmentation and embeddings are kept in `store` for re-diarization, and
+        speakers matching one of the user's voiceprints get its name.
+        """
+        if settings.DIARIZE_BACKEND != "onnx" or self.device != "cpu":
+            return None
+        await self.update_progress(job_id, "Diarizing speakers (ONNX)...", percent)
+        try:
+            features = await asyncio.to_thread(onnx_diarizer.extract, audio, self.threads["torch"])
+            if store:
+                await asyncio.to_thread(store.save_bytes, "embeddings", features.to_bytes())
+            diarize_segments = await asyncio.to_thread(diarize_features, features, **params)
+        except Exception as e:
+            logger.warning(f"ONNX diarization failed for job {job_id}, using pyannote: {e}")
+            return None
+        return await self._name_known_speakers(job_id, user_id, features, diarize_segments)
+
+    async def _name_known_speakers(
+        self,
+        job_id: str,
+        user_id: Optional[str],
+        features: DiarizationFeatures,
+        diarize_segments: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Renames diarized speakers whose voice matches one of the user's voiceprints. The
+        names given are recorded on the job so learn_voiceprints does not learn them back.
+        """
+        if not user_id or settings.VOICEPRINT_MATCH_THRESHOLD is None or diarize_segments.empty:
+            return diarize_segments
+        try:
+            voiceprints = await voiceprint_store_for(user_id)
+            if not voiceprints.names:
+                return diarize_segments
+            centroids = await asyncio.to_thread(speaker_centroids, features, diarization_records(diarize_segments))
+            names = voiceprints.match(centroids)
+        except Exception as e:
+            logger.warning(f"Voiceprint matching failed for job {job_id}: {e}")
+            return diarize_segments
+        await db.get_db().jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"recognized_speakers": sorted(set(names.values()))}}
+        )
+        if names:
+            logger.info(f"Job {job_id}: recognized {len(names)} known speaker(s)")
+            diarize_segments = diarize_segments.assign(speaker=diarize_segments["speaker"].replace(names))
+        return diarize_segments
+
+    async def learn_voiceprints(self, job_id: str, segments: list):
+        """
+        Keeps a voiceprint for every speaker the user named in a saved transcript (renamed
+        from SPEAKER_xx), from the embeddings of the job's ONNX diarization. Later jobs of
+        the user get those names at diarization time. Names the job got from voiceprint
+        matching are skipped: learning them back would let a wrong match reinforce itself.
+        Jobs without stored embeddings are skipped.
+        """
+        try:
+            job = await db.get_db().jobs.find_one({"_id": ObjectId(job_id)})
+            if not job:
+                return
+            recognized = set(job.get("recognized_speakers") or [])
+            named = [
+                s for s in segments
+                if is_named(s.get("speaker")) and s["speaker"] not in recognized
+                and s.get("start") is not None and s.get("end") is not None
+            ]
+            if not named:
+                return
+            store = CheckpointStore(checkpoint_base_for(job, job_id), decode_str(job["file_key"]))
+            features = self._load_diarization_features(store)
+            if features is None:
+                return
+            # Embeddings are on the time base of the diarized (speech-only) audio
+            speech = self._load_speech_map(store)
+            if speech is not None:
+                named = [{**s, "start": speech.to_compact(s["start"]), "end": speech.to_compact(s["end"])} for s in named]
+            centroids = await asyncio.to_thread(speaker_centroids, features, named, MIN_EMBEDDINGS)
+            # Jobs of the same user finishing together would otherwise drop each other's voices
+            async with voiceprint_lock(job["user_id"]):
+                voiceprints = await voiceprint_store_for(job["user_id"])
+                voiceprints.add(job_id, centroids)
+                await asyncio.to_thread(voiceprints.save)
+            logger.info(f"Job {job_id}: saved voiceprints for {len(centroids)} speaker(s)")
+        except Exception as e:
+            logger.warning(f"Could not save voiceprints for job {job_id}: {e}")
+
+    def _load_diarization_features(self, store: CheckpointStore) -> Optional[DiarizationFeatures]:
+        data = store.load_bytes("embeddings")
+        if data is None:
+            return None
+        try:
+            return DiarizationFeatures.from_bytes(data)
+        except Exception as e:
+            logger.warning(f"Unreadable speaker embeddings checkpoint: {e}")
+            return None
+
+    def _speech_map(self, audio: np.ndarray, config: dict) -> Tuple[SpeechMap, str]:
+        """Speech regions of the recording (Silero, or the energy VAD as fallback), padded."""
+        min_silence_ms = config.get("min_silence_duration_ms", 250)
+        regions = None
+        if settings.VAD_BACKEND == "silero":
+            regions = silero_speech_regions(
+                audio,
+                threshold=config.get("vad_onset", 0.5),
+                min_silence_ms=min_silence_ms,
+                pad_ms=settings.SPEECH_PAD_MS
+            )
+            if regions is None:
+                logger.warning("Silero VAD unavailable (faster-whisper not installed), using the energy VAD")
+        backend = "silero" if regions is not None else "energy"
+        if regions is None:
+            pad = settings.SPEECH_PAD_MS / 1000
+            regions = [(s - pad, e + pad) for s, e in speech_regions(audio, min_silence_ms=min_silence_ms)]
+        return SpeechMap(regions, len(audio) / SAMPLE_RATE), backend
+
+    def _compaction(self, speech: SpeechMap) -> Optional[SpeechMap]:
+        """The map to compact the audio with, or None when skipping non-speech would not pay off."""
+        if not settings.SPEECH_MAP or not speech.regions or not speech.duration:
+            return None
+        if speech.speech_seconds > settings.SPEECH_MAP_MAX_RATIO * speech.duration:
+            return None
+        return speech
+
+    def _load_speech_map(self, store: CheckpointStore) -> Optional[SpeechMap]:
+        checkpoint = store.load_json("vad")
+        if not checkpoint or "map" not in checkpoint:
+            return None
+        return self._compaction(SpeechMap.from_dict(checkpoint["map"]))
+
+    def _write_transcript(self, job: dict, job_id: str, result: dict, file_key: bytes) -> str:
+        result_json = json.dumps(result).encode('utf-8')
+        encrypted_transcript = encrypt_data(result_json, file_key)
+        
+        transcript_filename = f"{job.get('filename', job_id)}.json.enc"
+        transcript_path = os.path.join(os.path.dirname(job["file_path"]), transcript_filename)
+        
+        tmp_path = transcript_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encrypted_transcript)
+        os.replace(tmp_path, transcript_path)
+        return transcript_path
+
+    async def resume_interrupted_jobs(self):
+        """
+        Picks up jobs left pending or processing by a restart and queues them on the
+        job pipeline, oldest first. They resume from their last checkpoint. Live
+        recordings cut off by the restart are stored from their spool and queued too.
+        """
+        recordings = await db.get_db().jobs.find({"status": JobStatus.RECORDING}).to_list(None)
+        for job in recordings:
+            try:
+                size = await asyncio.to_thread(recover_recording, job["file_path"], decode_str(job["file_key"]))
+            except Exception as e:
+                logger.warning(f"Could not recover live recording {job['_id']}: {e}")
+                size = None
+            if size is None:
+                update = {"status": JobStatus.FAILED, "status_message": "Live recording was lost"}
+            else:
+                logger.info(f"Recovered live recording {job['_id']} after a restart")
+                update = {"status": JobStatus.PENDING, "status_message": None, "size": size}
+            await db.get_db().jobs.update_one({"_id": job["_id"]}, {"$set": update})
+
+        interrupted = await db.get_db().jobs.find(
+            {"status": {"$in": [JobStatus.PENDING, JobStatus.PROCESSING]}},
+            {"_id": 1}
+        ).sort("created_at", 1).to_list(None)
+        if interrupted:
+            logger.info(f"Resuming {len(interrupted)} interrupted job(s)")
+            for job in interrupted:
+                job_pipeline.submit(str(job["_id"]), force=True)
+
+        # Draft transcripts whose refinement never ran or was cut short
+        drafts = await db.get_db().jobs.find(
+            {"status": JobStatus.COMPLETED, "transcript_status": {"$in": ["draft", "refining"]}},
+            {"_id": 1}
+        ).sort("completed_at", 1).to_list(None)
+        for job in drafts:
+            job_pipeline.submit(str(job["_id"]), background=True)
+
+    async def refine_job(self, job_id: str):
+        """
+        Second pass of two-pass ASR, run at background priority. Re-decodes a draft
+        transcript with WHISPER_MODEL, aligns it, re-assigns speakers from the diarize
+        checkpoint and swaps it in, keeping the speaker renames made on the draft.
+        On failure the draft stays in place.
+        """
+        job = await db.get_db().jobs.find_one({"_id": ObjectId(job_id)})
+        if not job or job.get("status") != JobStatus.COMPLETED or job.get("transcript_status") not in ("draft", "refining"):
+            return
+
+        model_name = os.getenv("WHISPER_MODEL", "large-v3")
+        logger.info(f"Refining draft transcript of job {job_id} with {model_name}")
+        await db.get_db().jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"transcript_status": "refining", "status_message": f"Draft ready, refining with {model_name}..."}}
+        )
+        try:
+            file_key = decode_str(job["file_key"])
+            store = CheckpointStore(checkpoint_base_for(job, job_id), file_key)
+            raw_config = job.get("config", {})
+            config = raw_config if isinstance(raw_config, dict) else {}
+
+            # The stages' progress messages would overwrite the completed job's status
+            audio = await self._decode_stage(job_id, job, store, file_key, save=False, report_progress=False)
+            speech = self._load_speech_map(store)
+            result = await self._asr_stage(
+                job_id, job, config, model_name, audio, file_key, self.threads["asr"],
+                window_slot="asr", speech=speech, report_progress=False
+            )
+            async with job_pipeline.slot("align"):
+                result, _ = await self._align_stage(job_id, result, audio, report_progress=False)
+            del audio
+
+            checkpoint = store.load_json("diarize") or {}
+            turns = checkpoint.get("diarization") if not checkpoint.get("error") else None
+            if turns:
+                result = await asyncio.to_thread(whisperx.assign_word_speakers, pd.DataFrame(turns), result)
+            result["asr_pass"] = "refined"
+
+            # No await between reading the current transcript and replacing it, so a rename
+            # saved by update_transcript (same event loop) is either included or comes after
+            renames = self._swap_refined(job, job_id, result, turns, file_key)
+
+            duration = result["segments"][-1]["end"] if result.get("segments") else job.get("duration")
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {
+                    "transcript_status": "final",
+                    "asr_model": model_name,
+                    "duration": duration,
+                    "status_message": "Completed (refined transcript)"
+                }}
+            )
+            logger.info(f"Job {job_id}: refined transcript swapped in ({len(renames)} speaker rename(s) kept)")
+        except Exception as e:
+            logger.exception(f"Refinement of job {job_id} failed: {e}")
+            await db.get_db().jobs.update_one(
+                {"_id": ObjectId(job_id)},
+                {"$set": {"transcript_status": "draft", "status_message": f"Refinement failed, keeping the draft: {str(e)}"}}
+            )
+
+    def _swap_refined(self, job: dict, job_id: str, result: dict, turns: Optional[list], file_key: bytes) -> Dict[str, str]:
+        renames = {}
+        transcript_path = job.get("transcript_path")
+        if turns and transcript_path and os.path.exists(transcript_path):
+            with open(transcript_path, "rb") as f:
+                current = json.loads(decrypt_data(f.read(), file_key).decode("utf-8"))
+            renames = speaker_renames(current.get("segments", []), turns)
+            apply_speaker_renames(result, renames)
+        self._write_transcript(job, job_id, result, file_key)
+        return renames
 
     def log_progress(self, job_id, status_msg, percent=None):
         # This is a synchronous log for internal use, update_progress handles DB
@@ -349,18 +1007,22 @@ class TranscriptionService:
 
     async def update_progress(self, job_id, message, percent=None):
         # This updates the database
-        update_data = {"status_message": message}
+        update = {"$set": {"status_message": message}}
         if percent is not None:
-            update_data["progress"] = percent
+            # Stages run concurrently, never move the bar backwards
+            update["$max"] = {"progress": percent}
             
         await db.get_db().jobs.update_one(
             {"_id": ObjectId(job_id)},
-            {"$set": update_data}
+            update
         )
 
     async def process_diarization_only(self, job_id: str):
         """
         Runs ONLY the diarization phase on an existing COMPLETED job with a transcript.
+        Speaker turns from a successful diarize checkpoint with the same speaker limits
+        are reused, so only the (cheap) assignment to the current transcript is redone.
+        With other limits, stored speaker embeddings (ONNX backend) are only re-clustered.
         """
         logger.info(f"Starting standalone diarization for job {job_id}")
         
@@ -369,90 +1031,37 @@ class TranscriptionService:
             logger.error(f"Job {job_id} not found")
             return
 
-        temp_audio_path = None
         try:
-            # 1. Decrypt Audio
             encrypted_file_key = job.get("file_key")
             file_key = decode_str(encrypted_file_key)
-            file_path = job["file_path"]
-            
-            with open(file_path, "rb") as f:
-                encrypted_content = f.read()
-            audio_data = decrypt_data(encrypted_content, file_key)
-
-            ext = "wav"
-            if job.get('original_filename'):
-                ext = job['original_filename'].split('.')[-1]
-            elif job.get('filename'):
-                ext = job['filename'].split('.')[-1]
+            store = CheckpointStore(checkpoint_base_for(job, job_id), file_key)
 
-            temp_audio_path = f"/tmp/{job_id}_diarize.{ext}"
-            with open(temp_audio_path, "wb") as f:
-                 f.write(audio_data)
-
-            # 2. Decrypt Transcript (to get segments)
+            # 1. Decrypt Transcript (to get segments)
             transcript_path = job["transcript_path"]
             with open(transcript_path, "rb") as f:
                 tr_enc = f.read()
             tr_dec = decrypt_data(tr_enc, file_key)
             result = json.loads(tr_dec.decode('utf-8'))
 
-            # 3. Load Audio for WhisperX
-            audio = whisperx.load_audio(temp_audio_path)
-            
-            # 4. Run Diarization
-            if not settings.HF_TOKEN:
-                 raise ValueError("HF_TOKEN is missing in server configuration.")
-                 
-            await self.update_progress(job_id, "Diarizing (Loading model)...")
-            
-            # Capture standard output/error to catch Pyannote's print statements on failure
-            import io
-            import sys
-            from contextlib import redirect_stdout, redirect_stderr
-            
-            capture_stream = io.StringIO()
-            diarize_model = None
-            
-            try:
-                with redirect_stdout(capture_stream), redirect_stderr(capture_stream):
-                    diarize_model = whisperx.diarize.DiarizationPipeline(use_auth_token=settings.HF_TOKEN, device=self.device)
-            except Exception as e:
-                # Fallback if wrapper fails
-                logger.error(f"Diarization init crashed: {e}")
-
-            captured_output = capture_stream.getvalue()
-            
-            if diarize_model is None:
-                 logger.error(f"DiarizationPipeline returned None. Output: {captured_output}")
-                 
-                 error_details = "Unknown Error"
-                 if "Accept the user conditions" in captured_output:
-                     error_details = "You must accept the user agreement on HuggingFace for 'pyannote/speaker-diarization-3.1' AND 'pyannote/segmentation-3.0'."
-                 elif "Login required" in captured_output or "Unauthorized" in captured_output:
-                      error_details = "Invalid HF_TOKEN. Please check your token permissions."
-                 elif "private or gated" in captured_output:
-                      error_details = "Access Denied: This model is GATED. You MUST visit https://hf.co/pyannote/speaker-diarization-3.1 and https://hf.co/pyannote/segmentation-3.0 to accept the User Agreements."
-                 
-                 if "visit https://hf.co" in captured_output:
-                     # Extract link roughly? Or just give generic advice.
-                     pass
+            # 2. Reuse the speaker turns of an earlier run when they are still valid
+            params = speaker_params(job)
+            checkpoint = store.load_json("diarize") if "diarize" in (job.get("checkpoint_stages") or []) else None
 
-                 raise ValueError(f"Model Init Failed. {error_details} Raw output: {captured_output[:300]}")
+            if checkpoint and checkpoint.get("diarization") and not checkpoint.get("error") and checkpoint.get("params") == params:
+                await self.update_progress(job_id, "Diarization loaded from checkpoint")
+                diarize_segments = pd.DataFrame(checkpoint["diarization"])
+            else:
+                async with job_pipeline.slot("diarize"):
+                    diarize_segments = await self._diarize_standalone(
+                        job_id, job, store, file_key, params, speech=self._load_speech_map(store)
+                    )
+                store.save_json("diarize", {"diarization": diarization_records(diarize_segments), "params": params, "error": None})
+                await self._mark_stage(job_id, "diarize")
 
-            await self.update_progress(job_id, "Diarizing (Processing)...")
-            diarize_segments = diarize_model(audio)
-            
-            # 5. Assign Speakers
+            # 3. Assign Speakers
             result = whisperx.assign_word_speakers(diarize_segments, result)
-            
-            # Free memory
-            del diarize_model
-            gc.collect()
-            if self.device == "cuda":
-                torch.cuda.empty_cache()
                 
-            # 6. Save Updated Transcript
+            # 4. Save Updated Transcript
             result_json = json.dumps(result).encode('utf-8')
             encrypted_transcript = encrypt_data(result_json, file_key)
             with open(transcript_path, "wb") as f:
@@ -475,9 +1084,88 @@ class TranscriptionService:
                 {"_id": ObjectId(job_id)},
                 {"$set": {"status_message": f"Diarization Failed: {str(e)}"}}
             )
-        finally:
-            if temp_audio_path and os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
+
+    async def _diarize_standalone(
+        self,
+        job_id: str,
+        job: dict,
+        store: CheckpointStore,
+        file_key: bytes,
+        params: dict,
+        speech: Optional[SpeechMap] = None
+    ):
+        # Embeddings from an earlier ONNX run: a new speaker count only needs re-clustering
+        features = self._load_diarization_features(store)
+        if features is not None:
+            await self.update_progress(job_id, "Re-clustering stored speaker embeddings...")
+            diarize_segments = await asyncio.to_thread(diarize_features, features, **params)
+            diarize_segments = await self._name_known_speakers(job_id, job.get("user_id"), features, diarize_segments)
+            if speech is not None:
+                diarize_segments = pd.DataFrame(speech.turns_to_original(diarization_records(diarize_segments)))
+            return diarize_segments
+
+        # Load Audio for WhisperX (the decode checkpoint is used if the job never finished)
+        audio = await self._decode_stage(job_id, job, store, file_key, save=False)
+        if speech is not None:
+            audio = speech.compact(audio)
+        
+        # Run Diarization
+        if not settings.HF_TOKEN:
+             raise ValueError("HF_TOKEN is missing in server configuration.")
+
+        diarize_segments = await self._onnx_diarize(job_id, audio, params, store=store, user_id=job.get("user_id"))
+        if diarize_segments is not None:
+            if speech is not None:
+                diarize_segments = pd.DataFrame(speech.turns_to_original(diarization_records(diarize_segments)))
+            return diarize_segments
+             
+        await self.update_progress(job_id, "Diarizing (Loading model)...")
+        
+        # Capture standard output/error to catch Pyannote's print statements on failure
+        import io
+        import sys
+        from contextlib import redirect_stdout, redirect_stderr
+        
+        capture_stream = io.StringIO()
+        diarize_model = None
+        
+        try:
+            with redirect_stdout(capture_stream), redirect_stderr(capture_stream):
+                diarize_model = whisperx.diarize.DiarizationPipeline(use_auth_token=settings.HF_TOKEN, device=self.device)
+        except Exception as e:
+            # Fallback if wrapper fails
+            logger.error(f"Diarization init crashed: {e}")
+
+        captured_output = capture_stream.getvalue()
+        
+        if diarize_model is None:
+             logger.error(f"DiarizationPipeline returned None. Output: {captured_output}")
+             
+             error_details = "Unknown Error"
+             if "Accept the user conditions" in captured_output:
+                 error_details = "You must accept the user agreement on HuggingFace for 'pyannote/speaker-diarization-3.1' AND 'pyannote/segmentation-3.0'."
+             elif "Login required" in captured_output or "Unauthorized" in captured_output:
+                  error_details = "Invalid HF_TOKEN. Please check your token permissions."
+             elif "private or gated" in captured_output:
+                  error_details = "Access Denied: This model is GATED. You MUST visit https://hf.co/pyannote/speaker-diarization-3.1 and https://hf.co/pyannote/segmentation-3.0 to accept the User Agreements."
+             
+             if "visit https://hf.co" in captured_output:
+                 # Extract link roughly? Or just give generic advice.
+                 pass
+
+             raise ValueError(f"Model Init Failed. {error_details} Raw output: {captured_output[:300]}")
+
+        await self.update_progress(job_id, "Diarizing (Processing)...")
+        diarize_segments = await asyncio.to_thread(diarize_model, audio, **params)
+        
+        # Free memory
+        del diarize_model
+        gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        if speech is not None:
+            diarize_segments = pd.DataFrame(speech.turns_to_original(diarization_records(diarize_segments)))
+        return diarize_segments
 
 
 transcription_service = TranscriptionService()
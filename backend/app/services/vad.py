@@ -0,0 +1,280 @@
+import numpy as np
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+def frame_energy(audio: np.ndarray, frame_ms: int = FRAME_MS, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """RMS energy per frame in dBFS."""
+    frame = int(sample_rate * frame_ms / 1000)
+    usable = len(audio) - len(audio) % frame
+    if usable <= 0:
+        return np.full(1, -100.0)
+    frames = audio[:usable].reshape(-1, frame).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-5))
+
+
+def speech_mask(energy_db: np.ndarray, margin_db: float = 12.0, hangover_frames: int = 8) -> np.ndarray:
+    """
+    Energy VAD: a frame is speech when it is `margin_db` above the noise floor
+    (10th percentile of the recording). `hangover_frames` keeps short pauses inside speech.
+    """
+    noise_floor = np.percentile(energy_db, 10)
+    mask = energy_db > noise_floor + margin_db
+    if hangover_frames and mask.any():
+        # Extend every speech frame forward by the hangover
+        kernel = np.ones(hangover_frames + 1, dtype=np.int32)
+        mask = np.convolve(mask.astype(np.int32), kernel)[:len(mask)] > 0
+    return mask
+
+
+def speech_regions(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    min_speech_ms: int = 250,
+    min_silence_ms: int = 250
+) -> List[Tuple[float, float]]:
+    """(start, end) seconds of the speech regions found by the energy VAD. Pauses shorter than `min_silence_ms` stay inside a region."""
+    mask = speech_mask(frame_energy(audio, sample_rate=sample_rate), hangover_frames=max(0, min_silence_ms // FRAME_MS))
+    frame_s = FRAME_MS / 1000
+    regions = []
+    start = None
+    for i, is_speech in enumerate(mask):
+        if is_speech and start is None:
+            start = i
+        elif not is_speech and start is not None:
+            regions.append((start, i))
+            start = None
+    if start is not None:
+        regions.append((start, len(mask)))
+    min_frames = max(1, min_speech_ms // FRAME_MS)
+    return [(s * frame_s, e * frame_s) for s, e in regions if e - s >= min_frames]
+
+
+def split_at_silence(
+    audio: np.ndarray,
+    target_seconds: float = 120.0,
+    search_seconds: float = 15.0,
+    sample_rate: int = SAMPLE_RATE
+) -> List[Tuple[int, int]]:
+    """
+    Cuts the audio into windows of about `target_seconds`, each cut placed on the
+    quietest frame within `search_seconds` of the target so no word is split.
+    Returns (start_sample, end_sample) pairs covering the whole recording. Deterministic,
+    so the same audio always gives the same windows (used to resume partial ASR).
+    """
+    total = len(audio)
+    target = int(target_seconds * sample_rate)
+    if total <= target + int(search_seconds * sample_rate):
+        return [(0, total)]
+
+    energy = frame_energy(audio, sample_rate=sample_rate)
+    frame = int(sample_rate * FRAME_MS / 1000)
+    search_frames = int(search_seconds * 1000 / FRAME_MS)
+
+    windows = []
+    start = 0
+    while total - start > target + int(search_seconds * sample_rate):
+        centre = (start + target) // frame
+        lo = max(start // frame + 1, centre - search_frames)
+        hi = min(len(energy), centre + search_frames)
+        cut_frame = lo + int(np.argmin(energy[lo:hi])) if hi > lo else centre
+        cut = cut_frame * frame
+        windows.append((start, cut))
+        start = cut
+    windows.append((start, total))
+    return windows
+
+
+class StreamingVAD:
+    """
+    Rolling energy VAD for live audio. Feed it consecutive chunks; it returns the
+    utterances that just ended as absolute (start_sample, end_sample) ranges.
+    The noise floor adapts while nobody speaks. An utterance ends after
+    `end_silence_ms` of silence or once it reaches `max_utterance_s`.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = SAMPLE_RATE,
+        margin_db: float = 12.0,
+        end_silence_ms: int = 600,
+        max_utterance_s: float = 15.0,
+        pre_roll_ms: int = 300
+    ):
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * FRAME_MS / 1000)
+        self.margin_db = margin_db
+        self.end_silence_frames = max(1, end_silence_ms // FRAME_MS)
+        self.max_utterance = int(max_utterance_s * sample_rate)
+        self.pre_roll = int(sample_rate * pre_roll_ms / 1000)
+        self.noise_db: float = None
+        self.position = 0 # Absolute sample index of the next frame
+        self.active_start: int = None # Start of the utterance in progress
+        self._silent_frames = 0
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def feed(self, audio: np.ndarray) -> List[Tuple[int, int]]:
+        audio = np.concatenate([self._remainder, audio.astype(np.float32)])
+        usable = len(audio) - len(audio) % self.frame
+        self._remainder = audio[usable:]
+        ended = []
+        for energy in frame_energy(audio[:usable], FRAME_MS, self.sample_rate) if usable else []:
+            frame_start = self.position
+            self.position += self.frame
+            if self.noise_db is None:
+                self.noise_db = energy
+            is_speech = energy > self.noise_db + self.margin_db
+
+            if self.active_start is None:
+                # Track the noise floor only outside speech (fast down, slow up)
+                self.noise_db = energy if energy < self.noise_db else 0.98 * self.noise_db + 0.02 * energy
+                if is_speech:
+                    self.active_start = max(0, frame_start - self.pre_roll)
+                    self._silent_frames = 0
+                continue
+
+            self._silent_frames = 0 if is_speech else self._silent_frames + 1
+            if self._silent_frames >= self.end_silence_frames or self.position - self.active_start >= self.max_utterance:
+                ended.append((self.active_start, self.position))
+                self.active_start = None
+                self._silent_frames = 0
+        return ended
+
+    def flush(self) -> List[Tuple[int, int]]:
+        """Closes the utterance in progress (end of stream)."""
+        if self.active_start is None:
+            return []
+        ended = [(self.active_start, self.position)]
+        self.active_start = None
+        return ended
+
+
+def silero_speech_regions(
+    audio: np.ndarray,
+    threshold: float = 0.5,
+    min_silence_ms: int = 250,
+    min_speech_ms: int = 250,
+    pad_ms: int = 200
+) -> Optional[List[Tuple[float, float]]]:
+    """
+    (start, end) seconds of speech found by Silero VAD, run through ONNX Runtime on CPU
+    with the model bundled in faster-whisper. None when faster-whisper is not installed.
+    """
+    try:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+    except ImportError:
+        return None
+    options = VadOptions(
+        threshold=threshold,
+        min_speech_duration_ms=min_speech_ms,
+        min_silence_duration_ms=min_silence_ms,
+        speech_pad_ms=pad_ms
+    )
+    chunks = get_speech_timestamps(audio, options)
+    return [(chunk["start"] / SAMPLE_RATE, chunk["end"] / SAMPLE_RATE) for chunk in chunks]
+
+
+class SpeechMap:
+    """
+    Speech regions of a recording and the mapping between original time and "compact"
+    time, where only the regions remain, concatenated. ASR, alignment and diarization
+    run on the compact audio; their timestamps are mapped back with to_original.
+    """
+
+    def __init__(self, regions: List[Tuple[float, float]], duration: float):
+        merged: List[List[float]] = []
+        for start, end in sorted(regions):
+            start, end = max(0.0, float(start)), min(float(duration), float(end))
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.regions = [(s, e) for s, e in merged]
+        self.duration = float(duration)
+        self._starts = [s for s, _ in self.regions]
+        self._ends = [e for _, e in self.regions]
+        self._compact_starts: List[float] = []
+        total = 0.0
+        for s, e in self.regions:
+            self._compact_starts.append(total)
+            total += e - s
+        self.speech_seconds = total
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpeechMap":
+        return cls([tuple(r) for r in data["regions"]], data["duration"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"regions": [[round(s, 3), round(e, 3)] for s, e in self.regions], "duration": self.duration}
+
+    def compact(self, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+        if not self.regions:
+            return audio[:0]
+        return np.concatenate([audio[int(s * sample_rate):int(e * sample_rate)] for s, e in self.regions])
+
+    def to_original(self, t: float, is_end: bool = False) -> float:
+        """Compact -> original time. A time on a joint maps to the end of the earlier region when `is_end`."""
+        if not self.regions:
+            return t
+        i = (bisect_left if is_end else bisect_right)(self._compact_starts, t) - 1
+        i = min(max(i, 0), len(self.regions) - 1)
+        start, end = self.regions[i]
+        return min(end, start + max(0.0, t - self._compact_starts[i]))
+
+    def to_compact(self, t: float) -> float:
+        """Original -> compact time. Times in a gap map to the joint between its two regions."""
+        if not self.regions:
+            return t
+        i = bisect_right(self._starts, t) - 1
+        if i < 0:
+            return 0.0
+        start, end = self.regions[i]
+        return self._compact_starts[i] + min(t, end) - start
+
+    def _map_items(self, result: Dict[str, Any], fn) -> Dict[str, Any]:
+        items = list(result.get("word_segments") or [])
+        for seg in result.get("segments", []):
+            items.append(seg)
+            items.extend(seg.get("words") or [])
+        seen = set()
+        for item in items:
+            # WhisperX may list the same word dict in both segments and word_segments
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            if item.get("start") is not None:
+                item["start"] = round(fn(item["start"], False), 3)
+            if item.get("end") is not None:
+                item["end"] = round(fn(item["end"], True), 3)
+        return result
+
+    def result_to_original(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return self._map_items(result, lambda t, is_end: self.to_original(t, is_end))
+
+    def result_to_compact(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return self._map_items(result, lambda t, is_end: self.to_compact(t))
+
+    def turns_to_original(self, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Speaker turns in compact time -> original time, split at every gap they span."""
+        mapped = []
+        for turn in turns:
+            first = max(0, bisect_right(self._compact_starts, turn["start"]) - 1)
+            for i in range(first, len(self.regions)):
+                c_start = self._compact_starts[i]
+                c_end = c_start + self._ends[i] - self._starts[i]
+                if c_start >= turn["end"]:
+                    break
+                lo, hi = max(turn["start"], c_start), min(turn["end"], c_end)
+                if hi > lo:
+                    mapped.append({
+                        **turn,
+                        "start": round(self._starts[i] + lo - c_start, 3),
+                        "end": round(self._starts[i] + hi - c_start, 3)
+                    })
+        return mapped
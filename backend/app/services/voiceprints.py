@@ -0,0 +1,216 @@
+import io
+import os
+import re
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from bson import ObjectId
+from app.core.config import settings
+from app.core.crypto import encrypt_data, decrypt_data, encode_bytes, decode_str, generate_key
+from app.core.database import db
+from app.services.diarization import refine_centroids
+
+logger = logging.getLogger(__name__)
+
+# Bump when the embedding model changes: voiceprints of another model do not compare
+VOICEPRINT_VERSION = "1"
+
+# Labels that do not name anyone (diarization and HiDock defaults)
+GENERIC_SPEAKER = re.compile(r'^(speaker[ _]?\d*|unknown( speaker)?)$', re.IGNORECASE)
+
+# Clean embeddings (about 1 s of speech each) needed before a speaker's voice is kept
+MIN_EMBEDDINGS = 10
+
+# Inverted-file lists scanned per query once the index is approximate
+ANN_PROBES = 4
+
+# The store file is read, changed and rewritten whole: one writer per user at a time
+_store_locks: Dict[str, asyncio.Lock] = {}
+
+
+def is_named(speaker: Optional[str]) -> bool:
+    return bool(speaker) and not GENERIC_SPEAKER.match(speaker.strip())
+
+
+def voiceprint_path_for(user_id: str) -> str:
+    return os.path.join(settings.TRANSCRIPT_STORAGE_PATH, "users", str(user_id), "voiceprints.npz.enc")
+
+
+def voiceprint_lock(user_id: str) -> asyncio.Lock:
+    """Hold it from loading the user's store (voiceprint_store_for) until it is saved."""
+    return _store_locks.setdefault(str(user_id), asyncio.Lock())
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-8)
+
+
+class VoiceprintIndex:
+    """
+    Cosine nearest-neighbour search over voiceprints. Exact (one matrix product) below
+    VOICEPRINT_ANN_MIN voiceprints; past that an inverted-file index: spherical k-means
+    splits them into about sqrt(n) lists and a query only scans the ANN_PROBES lists
+    with the closest centroids.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        self.lists: Optional[List[np.ndarray]] = None
+        count = len(self.vectors)
+        if count >= max(2, settings.VOICEPRINT_ANN_MIN):
+            num_lists = int(np.sqrt(count))
+            start = self.vectors[np.random.default_rng(0).choice(count, num_lists, replace=False)]
+            self.centroids = refine_centroids(self.vectors, start)
+            assigned = np.argmax(self.vectors @ self.centroids.T, axis=1)
+            self.lists = [np.flatnonzero(assigned == c) for c in range(num_lists)]
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(similarities, voiceprint indices) of the k nearest voiceprints per query, best first, -1 past the end."""
+        queries = _normalize(np.atleast_2d(queries).astype(np.float32))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(self.vectors) == 0:
+            return scores, ids
+        if self.lists is None:
+            similarity = queries @ self.vectors.T
+            top = np.argsort(-similarity, axis=1)[:, :k]
+            scores[:, :top.shape[1]] = np.take_along_axis(similarity, top, axis=1)
+            ids[:, :top.shape[1]] = top
+            return scores, ids
+        for i, query in enumerate(queries):
+            probed = np.argsort(-(self.centroids @ query))[:ANN_PROBES]
+            candidates = np.concatenate([self.lists[c] for c in probed])
+            similarity = self.vectors[candidates] @ query
+            top = np.argsort(-similarity)[:k]
+            scores[i, :len(top)] = similarity[top]
+            ids[i, :len(top)] = candidates[top]
+        return scores, ids
+
+
+class VoiceprintStore:
+    """
+    A user's known voices, encrypted with the key on their user document. Every job in
+    which a speaker was named adds one centroid embedding under that name (saving the
+    job again replaces it); a name's voiceprint is the mean of its centroids.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        self.path = path
+        self.key = key
+        self.names: List[str] = []
+        self.jobs: List[str] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._index: Optional[Tuple[List[str], VoiceprintIndex]] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = decrypt_data(f.read(), self.key)
+            with np.load(io.BytesIO(data)) as arrays:
+                if str(arrays["version"]) != VOICEPRINT_VERSION:
+                    logger.info(f"Voiceprints in {self.path} come from another embedding model, starting over")
+                    return
+                self.names = arrays["names"].tolist()
+                self.jobs = arrays["jobs"].tolist()
+                self.vectors = arrays["vectors"]
+        except Exception as e:
+            logger.warning(f"Could not read voiceprints {self.path}: {e}")
+
+    def save(self):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            version=np.array(VOICEPRINT_VERSION),
+            names=np.array(self.names, dtype=str),
+            jobs=np.array(self.jobs, dtype=str),
+            vectors=self.vectors.astype(np.float32)
+        )
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encrypt_data(buffer.getvalue(), self.key))
+        os.replace(tmp_path, self.path)
+
+    def _keep(self, keep: np.ndarray) -> bool:
+        changed = not keep.all()
+        self.names = [n for n, k in zip(self.names, keep) if k]
+        self.jobs = [j for j, k in zip(self.jobs, keep) if k]
+        self.vectors = self.vectors[keep]
+        self._index = None
+        return changed
+
+    def add(self, job_id: str, centroids: Dict[str, np.ndarray]):
+        """Replaces the centroids learned from `job_id` with these ({name: embedding})."""
+        self._keep(np.array([j != job_id for j in self.jobs], dtype=bool))
+        if not centroids:
+            return
+        new = np.stack(list(centroids.values())).astype(np.float32)
+        self.vectors = np.concatenate([self.vectors, new]) if len(self.vectors) else new
+        self.names += list(centroids)
+        self.jobs += [job_id] * len(centroids)
+
+    def forget_job(self, job_id: str) -> bool:
+        return self._keep(np.array([j != job_id for j in self.jobs], dtype=bool))
+
+    def forget_name(self, name: str) -> bool:
+        return self._keep(np.array([n != name for n in self.names], dtype=bool))
+
+    def voiceprints(self) -> Tuple[List[str], np.ndarray]:
+        """(names, one normalized voiceprint per name)."""
+        names = sorted(set(self.names))
+        if not names:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        position = {name: i for i, name in enumerate(names)}
+        owner = np.array([position[n] for n in self.names])
+        sums = np.zeros((len(names), self.vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, owner, _normalize(self.vectors))
+        return names, _normalize(sums)
+
+    def summary(self) -> List[Dict[str, object]]:
+        return [{"name": n, "meetings": self.names.count(n)} for n in sorted(set(self.names))]
+
+    def match(self, centroids: Dict[str, np.ndarray], threshold: Optional[float] = None) -> Dict[str, str]:
+        """
+        {diarization label: known name} for the speakers whose closest voiceprint has at least
+        `threshold` cosine similarity. Each name goes to one speaker of the meeting at most.
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        if threshold is None:
+            threshold = settings.VOICEPRINT_MATCH_THRESHOLD
+        if self._index is None:
+            names, vectors = self.voiceprints()
+            self._index = (names, VoiceprintIndex(vectors))
+        names, index = self._index
+        labels = list(centroids)
+        if not labels or not names:
+            return {}
+        scores, ids = index.search(np.stack([centroids[label] for label in labels]), k=len(labels))
+        candidates = sorted({int(i) for i in ids.ravel() if i >= 0})
+        similarity = np.full((len(labels), len(candidates)), -1.0)
+        for row in range(len(labels)):
+            for score, i in zip(scores[row], ids[row]):
+                if i >= 0:
+                    similarity[row, candidates.index(int(i))] = score
+        rows, cols = linear_sum_assignment(-similarity)
+        return {labels[r]: names[candidates[c]] for r, c in zip(rows, cols) if similarity[r, c] >= threshold}
+
+
+async def voiceprint_store_for(user_id: str) -> VoiceprintStore:
+    """The user's store. Its key is created on first use and kept on the user document, like job file keys."""
+    users = db.get_db().users
+    user = await users.find_one({"_id": ObjectId(user_id)}, {"voiceprint_key": 1})
+    if user is None:
+        raise ValueError(f"User {user_id} not found")
+    if not user.get("voiceprint_key"):
+        # Only set while still missing, so concurrent first uses end up with the same key
+        await users.update_one(
+            {"_id": ObjectId(user_id), "voiceprint_key": None},
+            {"$set": {"voiceprint_key": encode_bytes(generate_key())}}
+        )
+        user = await users.find_one({"_id": ObjectId(user_id)}, {"voiceprint_key": 1})
+    return VoiceprintStore(voiceprint_path_for(user_id), decode_str(user["voiceprint_key"]))
@@ -0,0 +1,118 @@
+"""
+Alignment backend benchmark: the torch wav2vec2 model against its int8 ONNX Runtime
+export (ALIGN_BACKEND=onnx), in this process, with the same thread count.
+
+Reports model load time (the first ONNX run includes the export), alignment time,
+real-time factor and peak RSS (process-wide, so run one --backend at a time for
+separate memory numbers). With a real recording and its transcript it also reports
+how far the ONNX word timings are from the torch ones.
+
+Needs the image's AI dependencies (whisperx, torch, onnxruntime, onnx). Run from backend/:
+    JWT_SECRET=bench python -m benchmarks.bench_alignment --minutes 10
+    JWT_SECRET=bench python -m benchmarks.bench_alignment --audio meeting.wav --segments meeting.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+from app.services.alignment import load_align_model
+from app.services.vad import SAMPLE_RATE
+
+WORDS = ("we need to ship the release before the review so the customer can sign off on the budget "
+         "and the deadline moves to next sprint if the owner agrees with the plan").split()
+
+
+def synthetic_input(minutes: float, seed: int = 0):
+    """Noise with WhisperX-style segments over it: exercises the model, the timings are meaningless."""
+    rnd = random.Random(seed)
+    audio = (np.random.default_rng(seed).standard_normal(int(minutes * 60 * SAMPLE_RATE)) * 0.05).astype(np.float32)
+    segments, t = [], 0.0
+    while t < minutes * 60 - 10:
+        duration = rnd.uniform(2.0, 8.0)
+        words = [rnd.choice(WORDS) for _ in range(int(duration * 2.5))]
+        segments.append({"start": round(t, 3), "end": round(t + duration, 3), "text": " ".join(words)})
+        t += duration + rnd.uniform(0.2, 1.0)
+    return audio, segments
+
+
+def run_backend(backend: str, audio: np.ndarray, segments: List[Dict[str, Any]], language: str, threads: int) -> Dict[str, Any]:
+    import whisperx
+    started = time.perf_counter()
+    model_a, metadata = load_align_model(language, "cpu", backend, threads)
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = whisperx.align(segments, model_a, metadata, audio, "cpu", return_char_alignments=False)
+    align_s = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "model": type(model_a).__name__,
+        "load_s": round(load_s, 2),
+        "align_s": round(align_s, 2),
+        "realtime_factor": round(align_s / (len(audio) / SAMPLE_RATE), 4),
+        "words": len(result.get("word_segments", [])),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "_words": result.get("word_segments", []),
+    }
+
+
+def word_drift(reference: List[Dict[str, Any]], other: List[Dict[str, Any]]) -> Optional[Dict[str, float]]:
+    """Start-time differences between two alignments of the same text."""
+    pairs = [(a["start"], b["start"]) for a, b in zip(reference, other) if a.get("start") is not None and b.get("start") is not None]
+    if not pairs:
+        return None
+    diffs = np.abs(np.array([a - b for a, b in pairs]))
+    return {"mean_ms": round(float(diffs.mean()) * 1000, 1), "p95_ms": round(float(np.percentile(diffs, 95)) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Torch vs ONNX int8 alignment benchmark")
+    parser.add_argument("--minutes", type=float, default=5.0, help="Length of the synthetic recording")
+    parser.add_argument("--audio", help="Real recording (any format ffmpeg reads)")
+    parser.add_argument("--segments", help="JSON with WhisperX segments (start, end, text) for --audio")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--threads", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--backend", action="append", choices=["torch", "onnx"], help="Run only these backends")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(args.threads)
+    if args.audio:
+        import whisperx
+        audio = whisperx.load_audio(args.audio)
+        with open(args.segments, encoding="utf-8") as f:
+            data = json.load(f)
+        segments = data["segments"] if isinstance(data, dict) else data
+    else:
+        audio, segments = synthetic_input(args.minutes)
+
+    results = [run_backend(b, audio, segments, args.language, args.threads) for b in args.backend or ["torch", "onnx"]]
+    if len(results) == 2 and args.audio:
+        results[1]["drift_vs_torch"] = word_drift(results[0]["_words"], results[1]["_words"])
+    for r in results:
+        r.pop("_words")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ["backend", "model", "load_s", "align_s", "realtime_factor", "words", "max_rss_mb"]
+    print(" | ".join(columns))
+    for r in results:
+        print(" | ".join(str(r[c]) for c in columns))
+    for r in results:
+        if r.get("drift_vs_torch"):
+            print(f"{r['backend']} word start drift vs torch: {r['drift_vs_torch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Speaker clustering benchmark on synthetic embedding sets: exact agglomerative clustering
+of every clean embedding against the sampled mode long recordings switch to past
+DIARIZE_CLUSTER_SAMPLE (linkage on an even sample, k-means over all embeddings), with
+and without a known speaker count.
+
+Embeddings are noisy copies of one random direction per speaker, with unbalanced speaking
+time, in the (chunk, local speaker) layout the ONNX diarizer produces. Reports wall
+time, peak traced memory, the number of speakers found and the share of embeddings given
+the right speaker. Exact clustering needs memory quadratic in the embeddings, so it only
+runs up to --exact-limit.
+
+Run from backend/:
+    JWT_SECRET=bench python -m benchmarks.bench_clustering
+    JWT_SECRET=bench python -m benchmarks.bench_clustering --embeddings 40000 --speakers 8 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from app.core.config import settings
+from app.services.diarization import Embeddings, cluster_embeddings
+
+DIMENSIONS = 256 # WeSpeaker ResNet34 embedding size
+LOCAL_SPEAKERS = 3 # Local speakers per segmentation window
+
+
+def synthetic_embeddings(count: int, speakers: int, spread: float, seed: int = 0):
+    """(Embeddings, true speaker per embedding, number of chunks)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((speakers, DIMENSIONS))
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    # Meetings are dominated by a few voices
+    share = rng.dirichlet(np.full(speakers, 0.8))
+    truth = rng.choice(speakers, size=count, p=share)
+    noise = rng.standard_normal((count, DIMENSIONS)) * spread / np.sqrt(DIMENSIONS)
+    vectors = (centres[truth] + noise).astype(np.float32)
+
+    # Up to LOCAL_SPEAKERS embeddings per window, different speakers within a window
+    pairs, chunk, used = [], 0, set()
+    for s in truth:
+        if len(used) == LOCAL_SPEAKERS or s in used:
+            chunk, used = chunk + 1, set()
+        pairs.append((chunk, len(used)))
+        used.add(s)
+    clean = rng.random(count) > 0.15 # Some embeddings come from overlapped speech
+    return Embeddings(np.array(pairs, dtype=np.int32), vectors, clean), truth, chunk + 1
+
+
+def accuracy(labels: np.ndarray, truth: np.ndarray) -> float:
+    """Share of embeddings on the right speaker, under the best speaker-to-cluster mapping."""
+    confusion = np.zeros((truth.max() + 1, labels.max() + 1))
+    np.add.at(confusion, (truth, labels), 1)
+    rows, cols = linear_sum_assignment(-confusion)
+    return float(confusion[rows, cols].sum() / len(truth))
+
+
+def measure(name: str, embeddings: Embeddings, truth: np.ndarray, chunks: int, sample: int, num_speakers: Optional[int]) -> Dict[str, Any]:
+    settings.DIARIZE_CLUSTER_SAMPLE = sample
+
+    def run() -> np.ndarray:
+        labels = cluster_embeddings(embeddings, chunks, LOCAL_SPEAKERS, num_speakers)
+        return labels[embeddings.pairs[:, 0], embeddings.pairs[:, 1]]
+
+    started = time.perf_counter()
+    labels = run()
+    wall = time.perf_counter() - started
+    # Separate run for memory: tracing slows the Python parts down
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "case": name,
+        "embeddings": len(truth),
+        "wall_s": round(wall, 3),
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 1),
+        "speakers_found": len(np.unique(labels)),
+        "accuracy": round(accuracy(labels, truth), 4),
+    }
+
+
+def run(count: int, speakers: int, spread: float, exact_limit: int) -> List[Dict[str, Any]]:
+    embeddings, truth, chunks = synthetic_embeddings(count, speakers, spread)
+    sample = settings.DIARIZE_CLUSTER_SAMPLE
+    results = []
+    for known in (None, speakers):
+        suffix = f", num_speakers={known}" if known else ""
+        if count <= exact_limit:
+            results.append(measure(f"exact{suffix}", embeddings, truth, chunks, count, known))
+        results.append(measure(f"sampled ({min(sample, count)}){suffix}", embeddings, truth, chunks, sample, known))
+    settings.DIARIZE_CLUSTER_SAMPLE = sample
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact vs sampled speaker clustering benchmark")
+    parser.add_argument("--embeddings", type=int, action="append", help="Embedding set sizes (default 2000, 10000, 40000)")
+    parser.add_argument("--speakers", type=int, default=6)
+    parser.add_argument("--spread", type=float, default=0.6, help="Noise norm relative to the unit speaker directions")
+    parser.add_argument("--exact-limit", type=int, default=12000, help="Largest set clustered exactly")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.embeddings or [2000, 10000, 40000]:
+        results.extend(run(count, args.speakers, args.spread, args.exact_limit))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ["case", "embeddings", "wall_s", "tracemalloc_peak_mb", "speakers_found", "accuracy"]
+    print(" | ".join(columns))
+    for r in results:
+        print(" | ".join(str(r[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
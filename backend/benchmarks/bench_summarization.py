@@ -0,0 +1,216 @@
+"""
+End-to-end summarization benchmark against the mock Ollama server.
+
+Drives the same path as process_summary_task (compaction -> chunk notes ->
+generate_summary -> Ollama) without MongoDB or a real model, and reports
+throughput, tail latency, model cascade behaviour and memory per scenario.
+
+Run from backend/:
+    JWT_SECRET=bench python -m benchmarks.bench_summarization
+    JWT_SECRET=bench python -m benchmarks.bench_summarization --scenario errors --time-scale 0.01 --json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from typing import List, Dict, Any
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings
+from app.core.crypto import generate_key
+from app.services.compaction import compact_transcript
+from app.services.summary_notes import summarize_transcript, NotesStore
+from app.services.llm_backends import reset_backend_pool
+from benchmarks.mock_ollama import start_mock_server
+
+SPEAKERS = ["SPEAKER_00", "SPEAKER_01", "SPEAKER_02", "SPEAKER_03"]
+WORDS = ("we need to ship the release before the review so the customer can sign off on the budget "
+         "and the deadline moves to next sprint if the owner agrees with the plan").split()
+FILLERS = ["um,", "uh,", "you know,", "I mean,"]
+
+
+def synthetic_segments(minutes: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """About 12 WhisperX-style segments per minute with fillers and the odd hallucination loop."""
+    rnd = random.Random(seed)
+    segments = []
+    t = 0.0
+    speaker = rnd.choice(SPEAKERS)
+    for _ in range(minutes * 12):
+        if rnd.random() < 0.35:
+            speaker = rnd.choice(SPEAKERS)
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 30))]
+        if rnd.random() < 0.4:
+            words.insert(rnd.randrange(len(words)), rnd.choice(FILLERS))
+        text = " ".join(words).capitalize() + "."
+        if rnd.random() < 0.02:
+            text += " Thank you." * rnd.randint(3, 8)
+        duration = len(words) * 0.35
+        segments.append({"start": t, "end": t + duration, "speaker": speaker, "text": text})
+        t += duration + 0.2
+    return segments
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "baseline": {"jobs": 4, "concurrency": 1, "minutes": 30, "mock": {}},
+    "concurrent": {"jobs": 8, "concurrency": 4, "minutes": 30, "mock": {}},
+    "long_meeting": {"jobs": 2, "concurrency": 1, "minutes": 180, "mock": {}},
+    # Same transcript again with other templates, a speaker renamed between runs
+    "resummarize": {"jobs": 4, "concurrency": 1, "minutes": 180, "mock": {}, "same_transcript": True,
+                    "templates": ["General Meeting", "Client Call"], "rename_speaker": True},
+    "errors": {"jobs": 10, "concurrency": 2, "minutes": 30, "mock": {"error_rate": 0.3}},
+    "hangs": {"jobs": 6, "concurrency": 2, "minutes": 30, "mock": {"hang_rate": 0.3}, "timeout": 2},
+    "primary_down": {"jobs": 4, "concurrency": 2, "minutes": 30, "mock": {"failing_models": ["__primary__"]}},
+    # Same load as "concurrent", spread over an Ollama and an OpenAI-compatible endpoint
+    "two_backends": {"jobs": 8, "concurrency": 4, "minutes": 30, "mock": {}, "backends": ["ollama", "openai"]},
+}
+
+
+async def run_scenario(name: str, spec: Dict[str, Any], time_scale: float) -> Dict[str, Any]:
+    mock_config = dict(spec["mock"])
+    mock_config["time_scale"] = time_scale
+    if mock_config.get("failing_models") == ["__primary__"]:
+        mock_config["failing_models"] = [os.getenv("OLLAMA_MODEL", "qwen2.5:32b")]
+
+    servers = []
+    backend_specs = []
+    for kind in spec.get("backends", ["ollama"]):
+        mock, runner, url = await start_mock_server(mock_config)
+        servers.append((mock, runner))
+        backend_specs.append(f"{kind}={url}")
+    previous = (settings.LLM_BACKENDS, settings.OLLAMA_TIMEOUT)
+    settings.LLM_BACKENDS = ",".join(backend_specs)
+    settings.OLLAMA_TIMEOUT = spec.get("timeout", settings.OLLAMA_TIMEOUT)
+    reset_backend_pool()
+
+    templates = spec.get("templates", ["General Meeting"])
+    workdir = tempfile.mkdtemp(prefix="bench_summary_")
+    file_key = generate_key()
+    semaphore = asyncio.Semaphore(spec["concurrency"])
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+    models_used: Dict[str, int] = {}
+    compaction_ratios: List[float] = []
+    modes: Dict[str, int] = {}
+
+    async def one_job(index: int):
+        seed = 0 if spec.get("same_transcript") else index
+        segments = synthetic_segments(spec["minutes"], seed)
+        if spec.get("rename_speaker") and index:
+            segments = [{**s, "speaker": f"Renamed {index}"} if s["speaker"] == SPEAKERS[0] else s for s in segments]
+        notes_path = os.path.join(workdir, f"job{seed}.notes.enc")
+        async with semaphore:
+            started = time.perf_counter()
+            stats: Dict[str, Any] = {}
+            compacted = compact_transcript(segments, "en")
+            summary = await summarize_transcript(
+                compacted,
+                meeting_type=templates[index % len(templates)],
+                language="en",
+                notes_store=NotesStore(notes_path, file_key),
+                stats=stats
+            )
+            latencies.append(time.perf_counter() - started)
+        outcome = "error" if summary.startswith("Error:") else "ok"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        model = stats.get("model", "none")
+        models_used[model] = models_used.get(model, 0) + 1
+        modes[stats.get("mode", "?")] = modes.get(stats.get("mode", "?"), 0) + 1
+        compaction_ratios.append(compacted["stats"]["reduction_ratio"])
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one_job(i) for i in range(spec["jobs"])))
+    finally:
+        wall = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        settings.LLM_BACKENDS, settings.OLLAMA_TIMEOUT = previous
+        reset_backend_pool()
+        for _, runner in servers:
+            await runner.cleanup()
+
+    def total(key: str) -> int:
+        return sum(mock.stats[key] for mock, _ in servers)
+
+    requests_by_model: Dict[str, int] = {}
+    for mock, _ in servers:
+        for model, count in mock.stats["by_model"].items():
+            requests_by_model[model] = requests_by_model.get(model, 0) + count
+
+    return {
+        "scenario": name,
+        "jobs": spec["jobs"],
+        "concurrency": spec["concurrency"],
+        "wall_s": round(wall, 3),
+        "throughput_per_min": round(spec["jobs"] / wall * 60, 2) if wall else None,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        "latency_max_s": round(max(latencies), 3) if latencies else 0.0,
+        "outcomes": outcomes,
+        "models_used": models_used,
+        "modes": modes,
+        "llm_requests": total("requests"),
+        "llm_requests_by_model": requests_by_model,
+        "llm_requests_by_backend": {spec_: mock.stats["requests"] for spec_, (mock, _) in zip(backend_specs, servers)},
+        "injected_errors": total("errors"),
+        "injected_hangs": total("hangs"),
+        "prefix_cache_hits": total("prefix_cache_hits"),
+        "compaction_ratio_avg": round(sum(compaction_ratios) / len(compaction_ratios), 3) if compaction_ratios else 0.0,
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    columns = ["scenario", "jobs", "wall_s", "throughput_per_min", "latency_p50_s", "latency_p95_s",
+               "latency_p99_s", "llm_requests", "prefix_cache_hits", "tracemalloc_peak_mb"]
+    print(" | ".join(columns))
+    for r in results:
+        print(" | ".join(str(r[c]) for c in columns))
+    print()
+    for r in results:
+        print(f"{r['scenario']}: outcomes={r['outcomes']} models={r['models_used']} modes={r['modes']} "
+              f"errors={r['injected_errors']} hangs={r['injected_hangs']} "
+              f"backends={list(r['llm_requests_by_backend'].values())} "
+              f"compaction={r['compaction_ratio_avg']:.1%} rss={r['max_rss_mb']}MB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Summarization benchmark against a mock Ollama")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument("--time-scale", type=float, default=0.02, help="Scale simulated LLM delays (1.0 = real time)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show service logs (fallbacks, timeouts)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        results.append(await run_scenario(name, SCENARIOS[name], args.time_scale))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
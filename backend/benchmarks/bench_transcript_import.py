@@ -0,0 +1,141 @@
+"""
+Transcript import benchmark: the line-oriented parser (app.services.transcript_import)
+on large HiDock TXT, SRT and WebVTT files, next to the DOTALL regex the HiDock importer
+used before. Reports wall time, segments per second and peak traced memory.
+The legacy regex only accepts two-digit hours, so it misses the blocks past 99 hours
+in the 100k-segment HiDock file.
+
+Run from backend/:
+    python -m benchmarks.bench_transcript_import
+    python -m benchmarks.bench_transcript_import --segments 100000 --format hidock --json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.transcript_import import parse_transcript
+
+SPEAKERS = ["Unknown Speaker", "Anna Berg", "Tom", "Speaker 3"]
+WORDS = ("we need to ship the release before the review so the customer can sign off on the budget "
+         "and the deadline moves to next sprint if the owner agrees with the plan").split()
+
+# The importer's previous approach, kept here as the baseline
+LEGACY_HIDOCK = re.compile(
+    r'(\d{2}:\d{2}:\d{2})\s*-\s*(\d{2}:\d{2}:\d{2})\s+(.+?):\s*\n\s*\n(.*?)(?=\n\d{2}:\d{2}:\d{2}\s*-|\Z)',
+    re.DOTALL
+)
+
+# The legacy regex is quadratic on malformed input; keep that case to a file it can finish
+LEGACY_MALFORMED_SEGMENTS = 2000
+
+
+def hhmmss(t: float, ms_sep: str = "") -> str:
+    h, rest = divmod(t, 3600)
+    m, s = divmod(rest, 60)
+    text = f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
+    return text + f"{ms_sep}{int(t % 1 * 1000):03d}" if ms_sep else text
+
+
+def synthetic_transcript(fmt: str, segments: int, seed: int = 0) -> str:
+    """A transcript of `segments` cues in the given format, some of them spanning several lines."""
+    rnd = random.Random(seed)
+    lines = ["WEBVTT", ""] if fmt == "vtt" else []
+    t = 0.0
+    for i in range(segments):
+        duration = rnd.uniform(1.0, 12.0)
+        text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 30))).capitalize() + "."
+        body = [text[:len(text) // 2], text[len(text) // 2:]] if rnd.random() < 0.3 else [text]
+        speaker = rnd.choice(SPEAKERS)
+        if fmt == "hidock":
+            lines += [f"{hhmmss(t)} - {hhmmss(t + duration)} {speaker}:", ""] + body + [""]
+        elif fmt == "srt":
+            lines += [str(i + 1), f"{hhmmss(t, ',')} --> {hhmmss(t + duration, ',')}"] + body + [""]
+        else:
+            lines += [f"{hhmmss(t, '.')} --> {hhmmss(t + duration, '.')}", f"<v {speaker}>{body[0]}"] + body[1:] + [""]
+        t += duration + rnd.uniform(0.0, 1.5)
+    return "\n".join(lines) + "\n"
+
+
+def legacy_parse(text: str) -> List[Dict[str, Any]]:
+    return [{"start": m[0], "end": m[1], "speaker": m[2], "text": m[3].strip()} for m in LEGACY_HIDOCK.findall(text)]
+
+
+def measure(name: str, fn: Callable[[], int]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    count = fn()
+    wall = time.perf_counter() - started
+    # Separate run for memory: tracing slows Python code far more than the regex engine
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "case": name,
+        "segments": count,
+        "wall_s": round(wall, 3),
+        "segments_per_s": int(count / wall) if wall else 0,
+        "tracemalloc_peak_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def run(fmt: str, segments: int) -> List[Dict[str, Any]]:
+    text = synthetic_transcript(fmt, segments)
+    results = [measure(f"{fmt}: parser (str)", lambda: len(parse_transcript(text).segments))]
+
+    # Streaming from disk: the whole file is never held as one string
+    with tempfile.NamedTemporaryFile("w", suffix=f".{fmt}", delete=False, encoding="utf-8") as f:
+        f.write(text)
+        path = f.name
+    try:
+        def from_file() -> int:
+            with open(path, encoding="utf-8") as stream:
+                return len(parse_transcript(stream).segments)
+        results.append(measure(f"{fmt}: parser (stream)", from_file))
+    finally:
+        os.remove(path)
+
+    if fmt == "hidock":
+        results.append(measure("hidock: legacy regex", lambda: len(legacy_parse(text))))
+        # Headers without the blank line the regex expects: it finds nothing and rescans the rest
+        # of the file from every header (quadratic), so it only gets a small file
+        squashed = text.replace(":\n\n", ":\n")
+        small = synthetic_transcript(fmt, min(segments, LEGACY_MALFORMED_SEGMENTS)).replace(":\n\n", ":\n")
+        results.append(measure("hidock (no blank lines): parser", lambda: len(parse_transcript(squashed).segments)))
+        results.append(measure(
+            f"hidock (no blank lines, {min(segments, LEGACY_MALFORMED_SEGMENTS)} blocks): legacy regex",
+            lambda: len(legacy_parse(small))
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcript import parser benchmark")
+    parser.add_argument("--segments", type=int, default=100_000, help="Segments per synthetic file")
+    parser.add_argument("--format", action="append", choices=["hidock", "srt", "vtt"], help="Run only these formats")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for fmt in args.format or ["hidock", "srt", "vtt"]:
+        results.extend(run(fmt, args.segments))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = ["case", "segments", "wall_s", "segments_per_s", "tracemalloc_peak_mb"]
+    print(" | ".join(columns))
+    for r in results:
+        print(" | ".join(str(r[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Mock Ollama server for offline summarization benchmarks.
+
+Speaks enough of the Ollama API (/api/generate, /api/tags, /api/ps) and of
+the OpenAI-compatible API (/v1/chat/completions, as served by llama.cpp)
+for app.services.summarization to run against it without a real model.
+Latency is simulated from the prompt size (prefill) and the number of
+generated tokens (decode), and requests to the same model are serialized
+like a single Ollama runner with OLLAMA_NUM_PARALLEL=1.
+
+Run standalone from backend/:
+    python -m benchmarks.mock_ollama --port 11500 --eval-rate 40 --error-rate 0.1
+
+Runtime config can be changed with POST /_mock/config and counters read
+from GET /_mock/stats.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Any, Optional
+from aiohttp import web
+
+from app.services.token_budget import estimate_tokens
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "base_latency": 0.05,       # Seconds added to every request
+    "load_time": 0.0,           # Seconds to "load" a model that is not resident
+    "prefill_rate": 2000.0,     # Prompt tokens per second
+    "eval_rate": 50.0,          # Generated tokens per second
+    "response_tokens": 400,     # Tokens generated per request
+    "parallel": 1,              # Concurrent requests per model
+    "error_rate": 0.0,          # Probability of an HTTP 500
+    "hang_rate": 0.0,           # Probability of never answering
+    "failing_models": [],       # Models that always answer 404 (forces the fallback cascade)
+    "prefix_cache": True,       # Skip prefill for a system prompt identical to the previous one
+    "time_scale": 1.0,          # Multiply every simulated delay (0.01 = 100x faster)
+}
+
+FILLER_WORDS = ["decision", "owner", "budget", "deadline", "review", "customer", "release", "risk", "follow-up", "plan"]
+
+
+class MockOllama:
+    def __init__(self, config: Optional[Dict[str, Any]] = None, seed: int = 0):
+        self.config = dict(DEFAULT_CONFIG)
+        if config:
+            self.config.update(config)
+        self.random = random.Random(seed)
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.loaded_models: Dict[str, float] = {}
+        self.last_system: Dict[str, str] = {}
+        self.stats: Dict[str, Any] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            "requests": 0,
+            "by_model": {},
+            "errors": 0,
+            "hangs": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "prefix_cache_hits": 0,
+            "num_ctx": [],
+        }
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self.semaphores:
+            self.semaphores[model] = asyncio.Semaphore(max(1, int(self.config["parallel"])))
+        return self.semaphores[model]
+
+    async def _sleep(self, seconds: float):
+        await asyncio.sleep(seconds * self.config["time_scale"])
+
+    def _fake_text(self, tokens: int) -> str:
+        words = [self.random.choice(FILLER_WORDS) for _ in range(tokens)]
+        return "## Summary\n- " + " ".join(words)
+
+    def _metrics(self, model: str, prompt_tokens: int, eval_tokens: int,
+                 load_s: float, prefill_s: float, eval_s: float) -> Dict[str, Any]:
+        ns = 1_000_000_000
+        return {
+            "model": model,
+            "done": True,
+            "load_duration": int(load_s * ns),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_s * ns),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_s * ns),
+            "total_duration": int((load_s + prefill_s + eval_s) * ns),
+        }
+
+    async def _simulate(self, model: str, system: str, prompt: str, options: Dict[str, Any]):
+        """
+        Counts the request and applies error/hang injection.
+        Returns an error (status, message) tuple, or None if the request should be served.
+        """
+        cfg = self.config
+        self.stats["requests"] += 1
+        self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+        if options.get("num_ctx"):
+            self.stats["num_ctx"].append(options["num_ctx"])
+
+        if model in cfg["failing_models"]:
+            return 404, f"model '{model}' not found"
+        if self.random.random() < cfg["error_rate"]:
+            self.stats["errors"] += 1
+            return 500, "mock: injected failure"
+        if self.random.random() < cfg["hang_rate"]:
+            self.stats["hangs"] += 1
+            await asyncio.sleep(3600)
+        return None
+
+    def _timings(self, model: str, system: str, prompt: str) -> Dict[str, Any]:
+        cfg = self.config
+        system_tokens = estimate_tokens(system)
+        prompt_tokens = estimate_tokens(prompt)
+
+        load_s = 0.0 if model in self.loaded_models else cfg["load_time"]
+        self.loaded_models[model] = time.time()
+
+        prefill_tokens = system_tokens + prompt_tokens
+        if cfg["prefix_cache"] and self.last_system.get(model) == system:
+            prefill_tokens = prompt_tokens
+            self.stats["prefix_cache_hits"] += 1
+        self.last_system[model] = system
+
+        eval_tokens = int(cfg["response_tokens"])
+        return {
+            "prompt_tokens": system_tokens + prompt_tokens,
+            "eval_tokens": eval_tokens,
+            "load_s": load_s,
+            "prefill_s": prefill_tokens / cfg["prefill_rate"],
+            "eval_s": eval_tokens / cfg["eval_rate"],
+        }
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        model = payload.get("model", "unknown")
+        system = payload.get("system", "")
+        prompt = payload.get("prompt", "")
+
+        error = await self._simulate(model, system, prompt, payload.get("options") or {})
+        if error:
+            return web.json_response({"error": error[1]}, status=error[0])
+
+        async with self._semaphore(model):
+            self._enter()
+            try:
+                t = self._timings(model, system, prompt)
+                await self._sleep(self.config["base_latency"] + t["load_s"] + t["prefill_s"])
+
+                if payload.get("stream", True):
+                    return await self._stream(request, model, t["eval_tokens"], t["prompt_tokens"],
+                                              t["load_s"], t["prefill_s"], t["eval_s"])
+
+                await self._sleep(t["eval_s"])
+                body = self._metrics(model, t["prompt_tokens"], t["eval_tokens"], t["load_s"], t["prefill_s"], t["eval_s"])
+                body["response"] = self._fake_text(t["eval_tokens"])
+                return web.json_response(body)
+            finally:
+                self.stats["in_flight"] -= 1
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        """OpenAI-compatible endpoint with llama.cpp-style timings (non-streaming)."""
+        payload = await request.json()
+        model = payload.get("model", "unknown")
+        messages = payload.get("messages", [])
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+
+        error = await self._simulate(model, system, prompt, {})
+        if error:
+            return web.json_response({"error": {"message": error[1]}}, status=error[0])
+
+        async with self._semaphore(model):
+            self._enter()
+            try:
+                t = self._timings(model, system, prompt)
+                await self._sleep(self.config["base_latency"] + t["prefill_s"] + t["eval_s"])
+                return web.json_response({
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": self._fake_text(t["eval_tokens"])}}],
+                    "usage": {"prompt_tokens": t["prompt_tokens"], "completion_tokens": t["eval_tokens"],
+                              "total_tokens": t["prompt_tokens"] + t["eval_tokens"]},
+                    "timings": {
+                        "prompt_n": t["prompt_tokens"],
+                        "prompt_ms": t["prefill_s"] * 1000,
+                        "prompt_per_second": t["prompt_tokens"] / t["prefill_s"] if t["prefill_s"] else None,
+                        "predicted_n": t["eval_tokens"],
+                        "predicted_ms": t["eval_s"] * 1000,
+                        "predicted_per_second": self.config["eval_rate"],
+                    },
+                })
+            finally:
+                self.stats["in_flight"] -= 1
+
+    def _enter(self):
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+    async def _stream(self, request, model, eval_tokens, prompt_tokens, load_s, prefill_s, eval_s):
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        per_token = eval_s / max(1, eval_tokens)
+        for _ in range(eval_tokens):
+            await self._sleep(per_token)
+            chunk = {"model": model, "response": self.random.choice(FILLER_WORDS) + " ", "done": False}
+            await response.write((json.dumps(chunk) + "\n").encode("utf-8"))
+        final = self._metrics(model, prompt_tokens, eval_tokens, load_s, prefill_s, eval_s)
+        final["response"] = ""
+        await response.write((json.dumps(final) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": m} for m in self.loaded_models]})
+
+    async def ps(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": m, "expires_at": None} for m in self.loaded_models]})
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def set_config(self, request: web.Request) -> web.Response:
+        self.config.update(await request.json())
+        self.semaphores.clear()
+        return web.json_response(self.config)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/generate", self.generate)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_get("/api/ps", self.ps)
+        app.router.add_get("/_mock/stats", self.get_stats)
+        app.router.add_post("/_mock/config", self.set_config)
+        return app
+
+
+async def start_mock_server(config: Optional[Dict[str, Any]] = None, host: str = "127.0.0.1", port: int = 0):
+    """
+    Starts a MockOllama in the running event loop.
+    Returns (mock, runner, base_url); call `await runner.cleanup()` to stop it.
+    """
+    mock = MockOllama(config)
+    runner = web.AppRunner(mock.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return mock, runner, f"http://{host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    for key, value in DEFAULT_CONFIG.items():
+        if isinstance(value, list):
+            parser.add_argument(f"--{key.replace('_', '-')}", nargs="*", default=value)
+        elif isinstance(value, bool):
+            parser.add_argument(f"--{key.replace('_', '-')}", type=lambda v: v.lower() in ("1", "true", "yes"), default=value)
+        else:
+            parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    mock = MockOllama(args)
+    print(f"Mock Ollama listening on http://{host}:{port} with {mock.config}")
+    web.run_app(mock.make_app(), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    main()
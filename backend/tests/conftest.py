@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Run from backend/ or the repository root; settings need a JWT secret to load
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("JWT_SECRET", "test")
@@ -0,0 +1,84 @@
+import io
+import os
+import wave
+import tracemalloc
+
+import numpy as np
+
+from app.core.crypto import generate_key, decrypt_data, encrypt_stream
+from app.services.audio_spool import (
+    AudioSpool, SPOOL_RECORD_BYTES, spool_path_for, store_spool, recover_recording
+)
+
+
+def pcm(seconds: float, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-8000, 8000, int(seconds * 16000), dtype=np.int16).tobytes()
+
+
+def upload_pcm(file_path: str, key: bytes) -> bytes:
+    with open(file_path, "rb") as f:
+        data = decrypt_data(f.read(), key)
+    with wave.open(io.BytesIO(data)) as wav:
+        assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (1, 2, 16000)
+        return wav.readframes(wav.getnframes())
+
+
+def spool(tmp_path, audio: bytes, frame: int = 3200):
+    key = generate_key()
+    file_path = str(tmp_path / "1700000000.0_live.wav.enc")
+    spool = AudioSpool(spool_path_for(file_path), key)
+    for i in range(0, len(audio), frame):
+        spool.append(audio[i:i + frame])
+    return spool, file_path, key
+
+
+def test_encrypt_stream_matches_encrypt_data_layout():
+    key = generate_key()
+    out = io.BytesIO()
+    size = encrypt_stream([b"abc", b"", b"def" * 1000], key, out)
+    assert size == len(out.getvalue())
+    assert decrypt_data(out.getvalue(), key) == b"abc" + b"def" * 1000
+
+
+def test_store_spool_writes_the_whole_stream(tmp_path):
+    audio = pcm(3.3)
+    s, file_path, key = spool(tmp_path, audio)
+    s.close()
+    size = store_spool(s.path, file_path, key)
+    assert size == os.path.getsize(file_path)
+    assert upload_pcm(file_path, key) == audio
+    assert not os.path.exists(s.path)
+
+
+def test_recover_after_crash_keeps_flushed_records(tmp_path):
+    audio = pcm(2.5)
+    s, file_path, key = spool(tmp_path, audio)
+    # Crash: the last partial second was never flushed and the last write was cut short
+    s._file.flush()
+    with open(s.path, "ab") as f:
+        f.write(b"\x00\x00\x10\x00partial")
+    assert recover_recording(file_path, key) == os.path.getsize(file_path)
+    flushed = (len(audio) // SPOOL_RECORD_BYTES) * SPOOL_RECORD_BYTES
+    assert upload_pcm(file_path, key) == audio[:flushed]
+
+
+def test_recover_without_spool(tmp_path):
+    key = generate_key()
+    missing = str(tmp_path / "gone.wav.enc")
+    assert recover_recording(missing, key) is None
+    with open(missing, "wb") as f:
+        f.write(b"stored before the crash")
+    assert recover_recording(missing, key) == len(b"stored before the crash")
+
+
+def test_store_spool_memory_does_not_grow_with_the_recording(tmp_path):
+    audio = pcm(120) # ~3.8 MB of PCM
+    s, file_path, key = spool(tmp_path, audio, frame=32000)
+    s.close()
+    del audio
+    tracemalloc.start()
+    store_spool(s.path, file_path, key)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 8 * SPOOL_RECORD_BYTES
@@ -0,0 +1,67 @@
+from app.services.compaction import drop_fillers, collapse_loops, compact_transcript
+
+
+def test_drops_hesitation_sounds():
+    text, removed = drop_fillers("So, um, the budget is done.")
+    assert text == "So the budget is done."
+    assert removed == 1
+
+
+def test_keeps_ambiguous_short_words():
+    assert drop_fillers("the ER was full")[0] == "the ER was full"
+    assert drop_fillers('He said "ah" and left')[0] == 'He said "ah" and left'
+    assert drop_fillers("Mm is short for millimetres")[0] == "Mm is short for millimetres"
+
+
+def test_discourse_markers_only_as_a_clause():
+    assert drop_fillers("It is, you know, late")[0] == "It is late"
+    assert drop_fillers("Do you know where it is?")[0] == "Do you know where it is?"
+    assert drop_fillers("I mean it")[0] == "I mean it"
+
+
+def test_stutter_collapses_letters_and_triples():
+    assert drop_fillers("I I think so")[0] == "I think so"
+    assert drop_fillers("the the the plan")[0] == "the plan"
+    assert drop_fillers("he had had enough")[0] == "he had had enough"
+
+
+def test_stutter_keeps_numbers():
+    assert drop_fillers("We need 2 2 servers")[0] == "We need 2 2 servers"
+    assert drop_fillers("call 5 5 5 1 2 3 4")[0] == "call 5 5 5 1 2 3 4"
+    assert drop_fillers("dial 555 555 555")[0] == "dial 555 555 555"
+
+
+def test_stutter_is_case_sensitive():
+    assert drop_fillers("Plan B b")[0] == "Plan B b"
+
+
+def test_collapses_phrase_loops():
+    text, collapsed = collapse_loops("Thank you. Thank you. Thank you. Bye.")
+    assert text == "Thank you. Bye."
+    assert collapsed == 1
+
+
+def test_keeps_deliberate_repeats():
+    assert collapse_loops("No, no, no. We cannot.") == ("No, no, no. We cannot.", 0)
+    assert collapse_loops("very very very good") == ("very very very good", 0)
+    assert collapse_loops("yes, we can, yes, we can, yes, we can") == ("yes, we can, yes, we can, yes, we can", 0)
+
+
+def test_keeps_repeated_numbers():
+    assert collapse_loops("10 10 10 percent") == ("10 10 10 percent", 0)
+    assert collapse_loops("room 4 B room 4 B room 4 B") == ("room 4 B room 4 B room 4 B", 0)
+
+
+def test_collapses_long_single_word_loops():
+    assert collapse_loops(" ".join(["the"] * 12) + " end") == ("the end", 1)
+
+
+def test_compact_transcript_end_to_end():
+    segments = [
+        {"speaker": "Ana", "text": "Um, we need 2 2 servers."},
+        {"speaker": "Ana", "text": "No, no, no. Not 3."},
+        {"speaker": "Ben", "text": "Okay."},
+    ]
+    result = compact_transcript(segments)
+    assert result["lines"] == ["Ana: we need 2 2 servers. No, no, no. Not 3.", "Ben: Okay."]
+    assert result["neutral_lines"][1] == "[[S2]]: Okay."
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.services import summarization
+from app.services.llm_backends import LLMBackend, LLMBackendError, BackendPool, parse_backends
+
+
+class FakeBackend(LLMBackend):
+    kind = "fake"
+
+    def __init__(self, url, model_override=None, failing=()):
+        super().__init__(url, model_override)
+        self.failing = set(failing)
+        self.requests = []
+
+    async def _generate(self, model, system, prompt, options):
+        self.requests.append(model)
+        if model in self.failing:
+            raise LLMBackendError(f"{model} failed on {self.name}")
+        return f"{model} on {self.url}", {"prompt_eval_count": 1, "eval_count": 1, "tokens_per_sec": None}
+
+
+def test_backend_without_driver_cannot_be_built():
+    with pytest.raises(TypeError):
+        LLMBackend("http://x")
+
+
+def test_parse_backends_reads_model_overrides():
+    backends = parse_backends("ollama=http://gpu1:11434,openai=http://box2:8080#qwen2.5-32b-instruct")
+    assert [b.name for b in backends] == ["ollama:http://gpu1:11434", "openai:http://box2:8080/v1"]
+    assert backends[1].model_for("qwen2.5:32b") == "qwen2.5-32b-instruct"
+    assert backends[0].model_for("qwen2.5:32b") == "qwen2.5:32b"
+
+
+def test_pool_skips_pairs_already_attempted():
+    pinned = FakeBackend("http://pinned", "local-model", failing={"local-model"})
+    pool = BackendPool([pinned])
+    attempted = set()
+
+    async def cascade():
+        for model in ("primary", "fallback"):
+            try:
+                return await pool.generate(model, "system", "prompt", {}, attempted=attempted)
+            except LLMBackendError:
+                continue
+
+    assert asyncio.run(cascade()) is None
+    assert pinned.requests == ["local-model"]
+
+
+def test_fallback_model_not_resent_to_overridden_endpoint(monkeypatch):
+    pinned = FakeBackend("http://pinned", "local-model", failing={"local-model"})
+    shared = FakeBackend("http://shared", failing={"qwen2.5:32b"})
+    pool = BackendPool([pinned, shared], max_concurrent=1)
+    monkeypatch.setattr(summarization, "get_backend_pool", lambda: pool)
+
+    text, model = asyncio.run(summarization._call_llm("system", "prompt", "en", "qwen2.5:32b", {}))
+    assert (text, model) == ("llama3.1:latest on http://shared", "llama3.1:latest")
+    assert pinned.requests == ["local-model"]
+    assert shared.requests == ["qwen2.5:32b", "llama3.1:latest"]
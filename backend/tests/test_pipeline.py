@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.pipeline import JobPipeline, PipelineFull
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(settings, "PIPELINE_MAX_QUEUED", 3)
+    return JobPipeline()
+
+
+def test_submit_refuses_past_the_queue_limit(pipeline):
+    for i in range(3):
+        pipeline.submit(f"job{i}")
+    with pytest.raises(PipelineFull):
+        pipeline.submit("job3")
+    assert pipeline.stats()["queued"] == 3
+
+
+def test_force_and_background_bypass_the_limit(pipeline):
+    for i in range(3):
+        pipeline.submit(f"job{i}")
+    pipeline.submit("recovered", force=True)
+    pipeline.submit("refine", background=True)
+    assert pipeline.stats()["queued"] == 4
+    assert pipeline.stats()["background_queued"] == 1
+
+
+def test_resubmitting_a_queued_job_is_a_no_op(pipeline):
+    for i in range(3):
+        pipeline.submit(f"job{i}")
+    pipeline.submit("job0")
+    assert pipeline.stats()["queued"] == 3
+
+
+def test_concurrent_requests_cannot_overfill_the_queue(pipeline):
+    # Each request checks is_full(), awaits its upload, then submits: only submit() holds the line
+    accepted, refused = [], []
+
+    async def request(job_id):
+        if pipeline.is_full():
+            refused.append(job_id)
+            return
+        await asyncio.sleep(0.01)
+        try:
+            pipeline.submit(job_id)
+            accepted.append(job_id)
+        except PipelineFull:
+            refused.append(job_id)
+
+    async def burst():
+        await asyncio.gather(*(request(f"job{i}") for i in range(10)))
+
+    asyncio.run(burst())
+    assert len(accepted) == 3
+    assert len(refused) == 7
+    assert pipeline.stats()["queued"] == 3
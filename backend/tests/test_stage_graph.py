@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.stage_graph import StageGraph, thread_budget
+
+
+@pytest.fixture
+def budget_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ASR_THREADS", 0)
+    monkeypatch.setattr(settings, "TORCH_THREADS", 0)
+    monkeypatch.setattr(settings, "HF_TOKEN", "token")
+    monkeypatch.setattr(settings, "PARALLEL_DIARIZATION", True)
+    return monkeypatch
+
+
+def test_budget_is_shared_between_concurrent_jobs(budget_settings):
+    budget_settings.setattr(settings, "PIPELINE_MAX_JOBS", 3)
+    threads = thread_budget(cpu_count=24)
+    assert threads == {"asr": 5, "torch": 3}
+    assert (threads["asr"] + threads["torch"]) * settings.PIPELINE_MAX_JOBS <= 24
+
+
+def test_single_job_gets_the_machine(budget_settings):
+    budget_settings.setattr(settings, "PIPELINE_MAX_JOBS", 1)
+    budget_settings.setattr(settings, "PARALLEL_DIARIZATION", False)
+    assert thread_budget(cpu_count=8) == {"asr": 8, "torch": 8}
+
+
+def test_budget_never_drops_below_one_thread(budget_settings):
+    budget_settings.setattr(settings, "PIPELINE_MAX_JOBS", 8)
+    assert thread_budget(cpu_count=2) == {"asr": 1, "torch": 1}
+
+
+def test_overrides_win(budget_settings):
+    budget_settings.setattr(settings, "ASR_THREADS", 6)
+    budget_settings.setattr(settings, "TORCH_THREADS", 2)
+    assert thread_budget(cpu_count=64) == {"asr": 6, "torch": 2}
+
+
+def test_graph_runs_independent_stages_concurrently():
+    order = []
+
+    async def stage(name, delay):
+        order.append(f"{name}+")
+        await asyncio.sleep(delay)
+        order.append(f"{name}-")
+        return name
+
+    graph = StageGraph()
+    graph.add("decode", lambda: stage("decode", 0))
+    graph.add("asr", lambda decode: stage("asr", 0.02), ["decode"])
+    graph.add("diarize", lambda decode: stage("diarize", 0.01), ["decode"])
+    graph.add("merge", lambda asr, diarize: stage("merge", 0), ["asr", "diarize"])
+    results = asyncio.run(graph.run())
+    assert results["merge"] == "merge"
+    assert order.index("diarize+") < order.index("asr-")
+    assert order[-2:] == ["merge+", "merge-"]
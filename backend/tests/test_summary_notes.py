@@ -0,0 +1,62 @@
+import asyncio
+
+from app.core.config import settings
+from app.services import summary_notes
+from app.services.compaction import compact_transcript
+from app.services.summary_notes import summarize_transcript, split_chunks, SPEAKER_PLACEHOLDER
+
+
+def meeting(names):
+    return [
+        {"speaker": names[i % 2], "text": f"Item {i}: we move the backups to AWS S3 and test the S2 model."}
+        for i in range(40)
+    ]
+
+
+def run_map_reduce(monkeypatch, segments, notes_reply):
+    calls = {"notes": [], "reduce": None}
+
+    async def fake_notes(chunk, language, model, priority=None):
+        calls["notes"].append(chunk)
+        return notes_reply(chunk)
+
+    async def fake_summary(text, **kwargs):
+        calls["reduce"] = text
+        return "summary"
+
+    monkeypatch.setattr(summary_notes, "generate_notes", fake_notes)
+    monkeypatch.setattr(summary_notes, "generate_summary", fake_summary)
+    monkeypatch.setattr(settings, "SUMMARY_MAP_REDUCE_THRESHOLD", 10)
+    monkeypatch.setattr(settings, "SUMMARY_CHUNK_TOKENS", 200)
+    asyncio.run(summarize_transcript(compact_transcript(segments)))
+    return calls
+
+
+def test_neutral_lines_use_bracketed_placeholders():
+    compacted = compact_transcript(meeting(["Ana", "Ben"]))
+    assert compacted["neutral_lines"][0].startswith("[[S1]]: ")
+    assert compacted["speakers"] == {"[[S1]]": "Ana", "[[S2]]": "Ben"}
+
+
+def test_placeholder_does_not_match_content():
+    assert not SPEAKER_PLACEHOLDER.search("Backups go to AWS S3; the S2 model and S1 ship.")
+    assert SPEAKER_PLACEHOLDER.findall("[[S1]] agreed with [[S12]]") == ["[[S1]]", "[[S12]]"]
+
+
+def test_names_substituted_only_for_placeholders(monkeypatch):
+    calls = run_map_reduce(monkeypatch, meeting(["Ana", "Ben"]), lambda chunk: "- [[S1]] wants AWS S3, [[S2]] the S2 model")
+    assert len(calls["notes"]) > 1
+    assert "- Ana wants AWS S3, Ben the S2 model" in calls["reduce"]
+    assert "[[" not in calls["reduce"]
+
+
+def test_raw_chunk_fallback_keeps_content(monkeypatch):
+    calls = run_map_reduce(monkeypatch, meeting(["Ana", "S1"]), lambda chunk: None)
+    assert "Ana: Item 0: we move the backups to AWS S3 and test the S2 model." in calls["reduce"]
+    assert "S1: Item 1:" in calls["reduce"]
+
+
+def test_chunks_do_not_change_with_speaker_names():
+    before = split_chunks(compact_transcript(meeting(["SPEAKER_00", "SPEAKER_01"]))["neutral_lines"], target_tokens=200)
+    after = split_chunks(compact_transcript(meeting(["Ana", "Ben"]))["neutral_lines"], target_tokens=200)
+    assert before == after
@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+
+from app.core.crypto import generate_key
+from app.services.voiceprints import VoiceprintStore, voiceprint_lock, is_named
+
+
+def voice(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(256).astype(np.float32)
+
+
+def test_generic_labels_are_not_names():
+    assert not is_named("SPEAKER_01")
+    assert not is_named("Unknown Speaker")
+    assert not is_named("")
+    assert is_named("Ana")
+
+
+def test_store_round_trip_and_match(tmp_path):
+    path, key = str(tmp_path / "voiceprints.npz.enc"), generate_key()
+    store = VoiceprintStore(path, key)
+    store.add("job1", {"Ana": voice(1), "Ben": voice(2)})
+    store.save()
+
+    loaded = VoiceprintStore(path, key)
+    assert loaded.summary() == [{"name": "Ana", "meetings": 1}, {"name": "Ben", "meetings": 1}]
+    noisy = {"SPEAKER_00": voice(2) + 0.1 * voice(7), "SPEAKER_01": voice(9)}
+    assert loaded.match(noisy) == {"SPEAKER_00": "Ben"}
+
+
+def test_saving_a_job_again_replaces_its_voices(tmp_path):
+    store = VoiceprintStore(str(tmp_path / "v.npz.enc"), generate_key())
+    store.add("job1", {"Ana": voice(1)})
+    store.add("job2", {"Ana": voice(1)})
+    store.add("job1", {"Anna": voice(1)})
+    assert store.summary() == [{"name": "Ana", "meetings": 1}, {"name": "Anna", "meetings": 1}]
+    assert store.forget_job("job1")
+    assert store.summary() == [{"name": "Ana", "meetings": 1}]
+
+
+def test_concurrent_updates_under_the_lock_keep_every_job(tmp_path):
+    path, key = str(tmp_path / "voiceprints.npz.enc"), generate_key()
+
+    async def learn(job_id: str, name: str, seed: int):
+        async with voiceprint_lock("user"):
+            store = VoiceprintStore(path, key)
+            await asyncio.sleep(0.01) # Another job finishes meanwhile
+            store.add(job_id, {name: voice(seed)})
+            await asyncio.to_thread(store.save)
+
+    async def both():
+        await asyncio.gather(learn("job1", "Ana", 1), learn("job2", "Ben", 2))
+
+    asyncio.run(both())
+    assert [v["name"] for v in VoiceprintStore(path, key).summary()] == ["Ana", "Ben"]
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useParams } from 'next/navigation';
 import api from '@/lib/api';
 import { Button } from '@/components/ui';
@@ -29,6 +29,10 @@ export default function EditorPage() {
 
     const [loading, setLoading] = useState(true);
     const [segments, setSegments] = useState<Segment[]>([]);
+    const [partialSegments, setPartialSegments] = useState<Segment[]>([]);
+    const lastPartialFetch = useRef(0);
+    // asr_pass of the loaded transcript ("draft" while two-pass ASR refines it)
+    const [asrPass, setAsrPass] = useState<string | null>(null);
     const [job, setJob] = useState<any>(null);
     const [summary, setSummary] = useState('');
     const [summaryContext, setSummaryContext] = useState({
@@ -77,6 +81,7 @@ export default function EditorPage() {
             // Fetch Transcript
             if (jobRes.data.status === 'completed') {
                 const transRes = await api.get(`/jobs/${jobId}/transcript`);
+                setAsrPass(transRes.data.asr_pass || null);
 
                 // Adapt format: OpenAI verbose_json uses 'segments' array
                 const rawSegments = transRes.data.segments || [];
@@ -105,6 +110,27 @@ export default function EditorPage() {
         }
     };
 
+    // Segments already transcribed while ASR is still running (throttled)
+    const fetchPartial = async () => {
+        const now = Date.now();
+        if (now - lastPartialFetch.current < 10000) return;
+        lastPartialFetch.current = now;
+        try {
+            const res = await api.get(`/jobs/${jobId}/transcript`);
+            if (res.data.partial) {
+                setPartialSegments((res.data.segments || []).map((s: any, idx: number) => ({
+                    id: idx,
+                    start: s.start,
+                    end: s.end,
+                    text: s.text,
+                    speaker: s.speaker || 'Speaker'
+                })));
+            }
+        } catch (e) {
+            // Nothing transcribed yet
+        }
+    };
+
     // SSE for Real-time Progress
     useEffect(() => {
         let eventSource: EventSource | null = null;
@@ -143,6 +169,9 @@ export default function EditorPage() {
                             progress: data.progress,
                             status_message: data.message
                         }));
+                        if (data.status === 'processing') {
+                            fetchPartial();
+                        }
                     }
                 } catch (e) {
                     console.error("SSE Parse Error", e);
@@ -166,6 +195,20 @@ export default function EditorPage() {
     }, [jobId, job?.status]); // Re-run if status changes (e.g. from pending to processing)
 
 
+    // Two-pass ASR: watch for the refined transcript while a draft is shown
+    useEffect(() => {
+        if (job?.status !== 'completed' || asrPass !== 'draft' || job?.transcript_status === 'final') return;
+        const refinePoll = setInterval(async () => {
+            try {
+                const res = await api.get(`/jobs/${jobId}`);
+                setJob((prev: any) => ({ ...prev, transcript_status: res.data.transcript_status, status_message: res.data.status_message }));
+            } catch (e) {
+                console.error("Polling error", e);
+            }
+        }, 30000);
+        return () => clearInterval(refinePoll);
+    }, [jobId, job?.status, job?.transcript_status, asrPass]);
+
     const handleTextChange = (id: number, newText: string) => {
         setSegments(prev => prev.map(s => s.id === id ? { ...s, text: newText } : s));
     };
@@ -194,7 +237,13 @@ export default function EditorPage() {
 
     const handleSave = async () => {
         try {
-            await api.put(`/jobs/${jobId}/transcript`, { segments });
+            const res = await api.put(`/jobs/${jobId}/transcript`, { segments, asr_pass: asrPass });
+            if (res.data.status === 'merged') {
+                // The draft was refined meanwhile: only the speaker names were carried over
+                alert("A refined transcript replaced the draft. Your speaker names were applied to it.");
+                fetchData();
+                return;
+            }
             alert("Transcript saved successfully!");
         } catch (err) {
             console.error(err);
@@ -204,8 +253,15 @@ export default function EditorPage() {
 
     const handleRediarize = async () => {
         if (!confirm("This will attempt to run AI Diarization again and OVERWRITE current speaker labels. Continue?")) return;
+        const count = prompt("Number of speakers (leave empty to detect automatically):", job?.num_speakers ? String(job.num_speakers) : "");
+        if (count === null) return;
+        const numSpeakers = parseInt(count, 10);
+        // Only the count is sent (and only when given or cleared): the min/max bounds set at upload still apply
+        const hints = numSpeakers > 0
+            ? { num_speakers: numSpeakers }
+            : job?.num_speakers ? { num_speakers: null } : {};
         try {
-            await api.post(`/jobs/${jobId}/diarize`);
+            await api.post(`/jobs/${jobId}/diarize`, hints);
             alert("Diarization started. Please wait a moment for updates.");
             // Force status reload
             fetchData();
@@ -231,11 +287,21 @@ export default function EditorPage() {
             const pollInterval = setInterval(async () => {
                 try {
                     const res = await api.get(`/jobs/${jobId}/summary`);
+                    if (res.data.status === 'failed') {
+                        // The draft (or the previous summary) stays; the full model did not finish
+                        clearInterval(pollInterval);
+                        setSummary(res.data.summary || previousSummary || res.data.error);
+                        alert(`Summarization failed: ${res.data.error}`);
+                        return;
+                    }
                     // Only update if summary exists AND is different from the one we started with
                     // OR if we started with nothing and got something.
                     if (res.data.summary && res.data.summary !== previousSummary) {
                         setSummary(res.data.summary);
-                        clearInterval(pollInterval);
+                        // A draft is replaced by the full model's summary, keep polling until then
+                        if (!res.data.is_draft) {
+                            clearInterval(pollInterval);
+                        }
                     }
                 } catch (e) {
                     console.error("Polling error", e);
@@ -387,6 +453,11 @@ export default function EditorPage() {
                                 {job.status.toUpperCase()}
                             </span>
                         )}
+                        {job?.status === 'completed' && asrPass === 'draft' && (
+                            <span className={styles.statusProcessing} style={{ fontSize: '0.8rem', marginLeft: '0.5rem', padding: '0.2rem 0.5rem', borderRadius: '4px', cursor: job.transcript_status === 'final' ? 'pointer' : 'default' }} title={job.transcript_status === 'final' ? "Click to load the refined transcript (save your speaker names first)" : "A more accurate transcript is being produced in the background"} onClick={() => job.transcript_status === 'final' && fetchData()}>
+                                {job.transcript_status === 'final' ? 'REFINED VERSION READY' : 'DRAFT'}
+                            </span>
+                        )}
                     </div>
                     <div className={styles.scrollArea}>
                         {(job?.status === 'processing' || job?.status === 'pending' || (job?.status !== 'completed' && job?.status_message && job.status_message.includes('Diariz'))) ? (
@@ -401,6 +472,19 @@ export default function EditorPage() {
                                 <p style={{ fontSize: '0.9rem', color: 'hsl(var(--muted-foreground))', marginTop: '0.5rem' }}>
                                     {job?.progress ? `${job.progress}% Complete` : 'This may take a few minutes depending on file size.'}
                                 </p>
+                                {partialSegments.length > 0 && (
+                                    <div style={{ width: '100%', marginTop: '1.5rem', textAlign: 'left' }}>
+                                        <p style={{ fontSize: '0.8rem', opacity: 0.7 }}>Preview (speakers and timing are refined when processing finishes)</p>
+                                        {partialSegments.map((seg) => (
+                                            <div key={seg.id} className={styles.segment}>
+                                                <div className={styles.timestamp}>
+                                                    {formatTime(seg.start)} - {formatTime(seg.end)}
+                                                </div>
+                                                <div className={styles.content}>{seg.text}</div>
+                                            </div>
+                                        ))}
+                                    </div>
+                                )}
                             </div>
                         ) : job?.status === 'failed' ? (
                             <div className={styles.errorState}>